@@ -1,21 +1,47 @@
+import asyncio
+import atexit
 import os
 import sys
+import time
 import threading
 import json
-import time
 import traceback
 import errno
 
 import structlog
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+)
 from flask_basicauth import BasicAuth
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from rectifier.config import ConfigParser, ConfigReadError
+from rectifier.circuit_breaker import CircuitBreakers
+from rectifier.config import ConfigParser, ConfigReadError, BrokerType
 from rectifier.health_checker import HealthChecker
-from rectifier.infrastructure_provider import Heroku
-from rectifier.message_brokers import RabbitMQ
+from rectifier.async_rectifier import AsyncRectifier
+from rectifier.infrastructure_provider import (
+    Heroku,
+    CachedInfrastructureProvider,
+    SyncInfrastructureProviderAdapter,
+)
+from rectifier.leader_election import LeaderElection
+from rectifier.profiler import TickProfiler
+from rectifier.message_brokers import (
+    AsyncRabbitMQ,
+    RabbitMQ,
+    RabbitMQAMQP,
+    SyncBrokerAdapter,
+)
 from rectifier.rectifier import Rectifier
+from rectifier.sharding import ShardMembership
 from rectifier.storage.redis_storage import RedisStorage
 from rectifier import settings
 
@@ -33,17 +59,79 @@ basic_auth = BasicAuth(app)
 
 storage = RedisStorage()
 config_reader = ConfigParser(storage=storage)
-health_checker = HealthChecker(storage)
+circuit_breakers = CircuitBreakers()
+health_checker = HealthChecker(storage, circuit_breakers)
+profiler = TickProfiler()
 
 
 class RectifierThread(threading.Thread):
+    """
+    Scales the consumers. Every gunicorn worker and every web dyno runs one: either the
+    leader scales all the apps while the others wait to take over, or, in sharded mode,
+    each of them scales its own share of the apps.
+    """
+
+    leader_election = None
+
     def run(self):
+        rectifier_storage = RedisStorage()
+
+        leader_election = None
+        shard = None
+        if settings.SHARDING:
+            shard = ShardMembership(rectifier_storage)
+            atexit.register(shard.leave)
+        else:
+            leader_election = LeaderElection(rectifier_storage)
+            atexit.register(leader_election.release)
+
+        self.leader_election = leader_election
+
+        if settings.ASYNC_IO:
+            asyncio.run(self._run_async(rectifier_storage, leader_election, shard))
+            return
+
         rectifier = Rectifier(
-            storage=RedisStorage(), broker=RabbitMQ(), infrastructure_provider=Heroku()
+            storage=rectifier_storage,
+            broker=RabbitMQ(),
+            infrastructure_provider=CachedInfrastructureProvider(Heroku()),
+            brokers={BrokerType.AMQP: RabbitMQAMQP()},
+            leader_election=leader_election,
+            shard=shard,
+            circuit_breakers=circuit_breakers,
+        )
+        while True:
+            with profiler.tick(leader_election):
+                rectifier.run()
+
+            if leader_election:
+                leader_election.wait(rectifier.next_poll_delay())
+            else:
+                time.sleep(rectifier.next_poll_delay())
+
+    @staticmethod
+    async def _run_async(rectifier_storage, leader_election, shard):
+        rectifier = AsyncRectifier(
+            storage=rectifier_storage,
+            broker=AsyncRabbitMQ(),
+            infrastructure_provider=SyncInfrastructureProviderAdapter(
+                CachedInfrastructureProvider(Heroku())
+            ),
+            brokers={BrokerType.AMQP: SyncBrokerAdapter(RabbitMQAMQP())},
+            leader_election=leader_election,
+            shard=shard,
+            circuit_breakers=circuit_breakers,
         )
         while True:
-            rectifier.run()
-            time.sleep(settings.TIME_BETWEEN_REQUESTS)
+            with profiler.tick(leader_election):
+                await rectifier.run()
+
+            if leader_election:
+                await asyncio.to_thread(
+                    leader_election.wait, rectifier.next_poll_delay()
+                )
+            else:
+                await asyncio.sleep(rectifier.next_poll_delay())
 
 
 @app.route("/")
@@ -81,6 +169,73 @@ def health_check():
     return health_checker.run()
 
 
+def is_follower() -> bool:
+    """Whether another process is elected to scale the apps, so this one's loop is idle."""
+    leader_election = rectifier.leader_election
+    return bool(leader_election and not leader_election.is_leader())
+
+
+@app.route("/metrics")
+@basic_auth.required
+def metrics():
+    # Every process serves its own metrics, `rectifier_is_leader` tells whether they're about the scaling loop.
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+@app.route("/profile", methods=['POST'])
+@basic_auth.required
+def start_profiling():
+    if is_follower():
+        return jsonify(status='not_leader'), 503
+
+    ticks = request.args.get('ticks', 3, type=int)
+    interval = request.args.get('interval', 0.005, type=float)
+
+    try:
+        session = profiler.start(ticks, interval)
+    except ValueError as error:
+        return jsonify(status='invalid', error=str(error)), 400
+
+    if not session:
+        return jsonify(status='running'), 409
+
+    return (
+        jsonify(status='running', ticks=session.ticks, interval=session.interval),
+        202,
+    )
+
+
+@app.route("/profile", methods=['DELETE'])
+@basic_auth.required
+def cancel_profiling():
+    if is_follower():
+        return jsonify(status='not_leader'), 503
+
+    if not profiler.cancel():
+        return jsonify(status='idle'), 404
+
+    return jsonify(status='cancelled')
+
+
+@app.route("/profile")
+@basic_auth.required
+def profiling_result():
+    if is_follower():
+        return jsonify(status='not_leader'), 503
+
+    if profiler.running:
+        return jsonify(status='running'), 202
+
+    result = profiler.result()
+    if result is None:
+        return jsonify(status='idle'), 404
+
+    if request.args.get('format') == 'collapsed':
+        return Response('\n'.join(result['collapsed_stacks']), mimetype='text/plain')
+
+    return jsonify(status='done', **result)
+
+
 class WebThread(threading.Thread):
     def run(self):
         app.run()
@@ -100,7 +255,7 @@ def on_uncaught_exception(args):
 # by the hook and cause the whole process to exit
 threading.excepthook = on_uncaught_exception  # type: ignore
 
-rectifier = RectifierThread()
+rectifier = RectifierThread(name='rectifier')
 rectifier.start()
 
 
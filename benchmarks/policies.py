@@ -0,0 +1,171 @@
+"""
+Benchmark of the evaluation of the step policies.
+
+Builds a configuration with the given number of queues, and measures how long it takes to decide the
+number of workers of every queue, for a few ticks of random queue depths:
+
+    python -m benchmarks.policies --queues 10000 --intervals 20 --output policies.json
+
+The linear scan the intervals were looked up with before is measured along with the binary search
+over the compiled arrays, and the batch evaluation (in a single NumPy pass, if NumPy is installed).
+All of them are checked to decide the same number of workers. The results are written as JSON, so
+they can be compared between revisions.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rectifier.config import AppConfig, AppMode, CoordinatorConfig, QueueConfig
+from rectifier.consumer_updates_coordinator import step_policies
+from rectifier.consumer_updates_coordinator.step_policies import StepPolicies
+from benchmarks.fleet import git_revision
+
+QUEUES_PER_APP = 10
+
+
+def policies_config(queues: int, intervals: int, seed: int = 0) -> CoordinatorConfig:
+    """A configuration with random step policies, `QUEUES_PER_APP` queues per app."""
+    rng = random.Random(seed)
+
+    apps: Dict[str, AppConfig] = dict()
+    for queue in range(0, queues):
+        app = f'app{queue // QUEUES_PER_APP}'
+        thresholds = sorted(rng.sample(range(1, intervals * 100), intervals - 1))
+
+        apps.setdefault(app, AppConfig(queues=dict(), mode=AppMode.SCALE)).queues[
+            f'queue{queue}'
+        ] = QueueConfig(
+            intervals=[0, *thresholds],
+            workers=sorted(rng.randint(1, 200) for _ in range(0, intervals)),
+            cooldown=rng.choice([0, 30, 60, 300]),
+            queue_name=f'queue{queue}',
+            consumers_formation_name=f'worker_queue{queue}',
+        )
+
+    return CoordinatorConfig(apps=apps)
+
+
+def linear_scan(queue_config: QueueConfig, messages: float) -> int:
+    """How the number of workers was looked up before the policies were compiled."""
+    matching_interval_index = [
+        i
+        for (i, messages_count) in enumerate(queue_config.intervals)
+        if messages >= messages_count
+    ][-1]
+
+    return queue_config.workers[matching_interval_index]
+
+
+def measure(evaluate: Callable[[], List[int]], ticks: int) -> Tuple[Dict, List[int]]:
+    durations = []
+    for _ in range(0, ticks):
+        started_at = time.perf_counter()
+        workers = evaluate()
+        durations.append(time.perf_counter() - started_at)
+
+    return (
+        dict(
+            ticks=durations,
+            min=min(durations),
+            median=statistics.median(durations),
+            max=max(durations),
+        ),
+        workers,
+    )
+
+
+def run_benchmark(
+    queues: int, intervals: int = 20, ticks: int = 5, seed: int = 0
+) -> Dict:
+    """
+    Runs the benchmark.
+
+    :param queues: How many queues the configuration has.
+    :param intervals: How many intervals each queue has.
+    :param ticks: How many times the evaluation of every queue is measured.
+    :param seed: Seeds the configuration and the queue depths.
+    """
+    config = policies_config(queues, intervals, seed)
+    policies = StepPolicies(config)
+
+    rng = random.Random(seed)
+    queue_configs = [
+        queue_config
+        for app_config in config.apps.values()
+        for queue_config in app_config.queues.values()
+    ]
+    indexes = [
+        policies.policy(app, queue_name)
+        for (app, app_config) in config.apps.items()
+        for queue_name in app_config.queues
+    ]
+    messages = [rng.uniform(0, intervals * 120) for _ in queue_configs]
+    seconds_since_update = [rng.choice([-1, 0, 45, 600]) for _ in queue_configs]
+
+    (linear_scan_times, expected) = measure(
+        lambda: [
+            linear_scan(queue_config, queue_messages)
+            for (queue_config, queue_messages) in zip(queue_configs, messages)
+        ],
+        ticks,
+    )
+    (binary_search_times, workers) = measure(
+        lambda: [
+            policies.workers_for(policy, queue_messages)
+            for (policy, queue_messages) in zip(indexes, messages)
+        ],
+        ticks,
+    )
+    assert workers == expected
+
+    (batch_times, workers) = measure(
+        lambda: policies.evaluate(indexes, messages, seconds_since_update)[0], ticks
+    )
+    assert workers == expected
+
+    return dict(
+        revision=git_revision(),
+        timestamp=datetime.utcnow().isoformat(),
+        parameters=dict(
+            queues=queues,
+            intervals=intervals,
+            ticks=ticks,
+            seed=seed,
+            numpy=step_policies.numpy is not None,
+        ),
+        linear_scan=linear_scan_times,
+        binary_search=binary_search_times,
+        batch=batch_times,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--queues', type=int, default=10000)
+    parser.add_argument('--intervals', type=int, default=20, help='intervals per queue')
+    parser.add_argument('--ticks', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='-', help='the results file (- for stdout)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        queues=args.queues, intervals=args.intervals, ticks=args.ticks, seed=args.seed
+    )
+
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+        return
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=4)
+
+
+if __name__ == '__main__':
+    main()
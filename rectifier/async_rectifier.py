@@ -0,0 +1,284 @@
+import asyncio
+import time
+from typing import Awaitable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import structlog
+
+from rectifier import metrics, settings
+from rectifier.circuit_breaker import CircuitBreakers
+from rectifier.config import AppConfig, BrokerType
+from rectifier.infrastructure_provider import (
+    AsyncInfrastructureProvider,
+    InfrastructureProviderError,
+    RequestDeferredError,
+)
+from rectifier.leader_election import LeaderElection
+from rectifier.message_brokers import AsyncBroker
+from rectifier.message_brokers.rabbitmq import BrokerError
+from rectifier.queue import Queue
+from rectifier.rectifier import BaseRectifier
+from rectifier.sharding import ShardMembership
+from rectifier.storage import Storage
+
+LOGGER = structlog.get_logger(__name__)
+
+T = TypeVar('T')
+
+
+class AsyncRectifier(BaseRectifier):
+    """
+    The controller of the autoscaler, overlapping the calls made for all the apps on a single event loop.
+
+    Makes the same decisions as `Rectifier`. Every call to a broker or to the infrastructure provider
+    has a timeout, so a slow broker only holds up its own app.
+    """
+
+    broker: AsyncBroker
+    brokers: Dict[BrokerType, AsyncBroker]
+    infrastructure_provider: AsyncInfrastructureProvider
+
+    def __init__(
+        self,
+        storage: Storage,
+        broker: AsyncBroker,
+        infrastructure_provider: AsyncInfrastructureProvider,
+        max_concurrent_apps: Optional[int] = None,
+        brokers: Optional[Dict[BrokerType, AsyncBroker]] = None,
+        leader_election: Optional[LeaderElection] = None,
+        shard: Optional[ShardMembership] = None,
+        timeout: Optional[float] = None,
+        circuit_breakers: Optional[CircuitBreakers] = None,
+    ) -> None:
+        """
+        :param broker: The broker used for the apps which don't use another broker type.
+        :param max_concurrent_apps: How many apps can be in flight at the same time.
+            Defaults to `settings.MAX_APPS_IN_FLIGHT`.
+        :param brokers: The brokers used for the other broker types an app can be configured with.
+        :param timeout: For how many seconds a single call can take. Defaults to `settings.ASYNC_CALL_TIMEOUT`.
+        """
+        self.broker = broker
+        self.brokers = {BrokerType.HTTP: broker, **(brokers or dict())}
+        self.infrastructure_provider = infrastructure_provider
+        self.timeout = timeout if timeout is not None else settings.ASYNC_CALL_TIMEOUT
+
+        super().__init__(
+            storage,
+            max_concurrent_apps=(
+                max_concurrent_apps
+                if max_concurrent_apps is not None
+                else settings.MAX_APPS_IN_FLIGHT
+            ),
+            leader_election=leader_election,
+            shard=shard,
+            circuit_breakers=circuit_breakers,
+        )
+
+    async def run(self) -> None:
+        """
+        Checks if the configuration has changed, and scales the consumers if needed.
+        """
+        apps = self._begin_tick()
+        if apps is None:
+            return
+
+        self._end_tick(apps, await self.scale(apps))
+
+    async def scale(
+        self, apps_to_scale: Optional[Iterable[str]] = None
+    ) -> Dict[str, List[Queue]]:
+        """
+        Scales the consumers, if needed.
+
+        :param apps_to_scale: The apps to be scaled. All of them, by default.
+        :return: The queues seen for each of the apps whose broker could be inspected.
+        """
+        if not self.consumer_updates_coordinator:
+            return dict()
+
+        apps = self._select_apps(apps_to_scale)
+        self._start_deadline()
+
+        try:
+            started_at = time.perf_counter()
+            with self._renewing_lease():
+                observed_queues = await self._scale_apps(apps)
+            metrics.TICK_DURATION.observe(time.perf_counter() - started_at)
+
+            metrics.tick_completed()
+            return observed_queues
+        finally:
+            self._flush()
+
+    async def close(self) -> None:
+        """Releases the connections held by the brokers."""
+        for broker in set(self.brokers.values()):
+            await broker.close()
+
+    async def _scale_apps(
+        self, apps: List[Tuple[str, AppConfig]]
+    ) -> Dict[str, List[Queue]]:
+        in_flight = asyncio.Semaphore(self.max_concurrent_apps)
+
+        async def scale_app(app: str, app_config: AppConfig) -> Optional[List[Queue]]:
+            async with in_flight:
+                return await self._scale_app(app, app_config)
+
+        # The semaphore is fair, so the apps left out by the deadline are the last ones.
+        tasks = [
+            (app, asyncio.ensure_future(scale_app(app, app_config)))
+            for (app, app_config) in apps
+        ]
+        if not tasks:
+            return dict()
+
+        (_, not_done) = await asyncio.wait(
+            [task for (_, task) in tasks], timeout=self._time_left()
+        )
+
+        # A scale made in a thread keeps going after its task is cancelled. Its update time was recorded
+        # when it was decided, so the deferred app isn't scaled again before its cooldown elapses.
+        for task in not_done:
+            task.cancel()
+
+        await asyncio.gather(*not_done, return_exceptions=True)
+        self._defer([app for (app, task) in tasks if task in not_done])
+
+        observed_queues: Dict[str, List[Queue]] = dict()
+        for (app, task) in tasks:
+            if task in not_done:
+                continue
+
+            result = task.exception() or task.result()
+            if isinstance(result, (InfrastructureProviderError, asyncio.TimeoutError)):
+                LOGGER.warning('Skipping app', app=app, err=repr(result))
+                continue
+
+            if isinstance(result, BaseException):
+                raise result
+
+            if result is not None:
+                observed_queues[app] = result
+
+        return observed_queues
+
+    async def _scale_app(
+        self, app: str, app_config: AppConfig
+    ) -> Optional[List[Queue]]:
+        """
+        Scales the consumers of a single app, if needed.
+
+        :return: The queues seen on the broker of the app, or None if it couldn't be inspected.
+
+        Raises:
+            InfrastructureProviderError:
+                When the broker URI of the app cannot be retrieved.
+            asyncio.TimeoutError:
+                When the broker URI of the app isn't retrieved in time.
+        """
+        app_breaker = self._app_breaker(app)
+        if not app_breaker:
+            return None
+
+        # Only a call which reached the infrastructure provider closes the breaker, and is counted.
+        provider_called = not self.infrastructure_provider.is_broker_uri_cached(app)
+
+        try:
+            with metrics.api_call(
+                app, 'broker_uri', phase='broker_uri', counted=provider_called
+            ):
+                broker_uri = await self._call(
+                    self.infrastructure_provider.broker_uri(app)
+                )
+        except (InfrastructureProviderError, asyncio.TimeoutError) as err:
+            # A deferred call says nothing about the app.
+            if not isinstance(err, RequestDeferredError):
+                app_breaker.record_failure()
+            raise
+
+        queues = await self._queues(app, app_config, broker_uri)
+        if queues is None:
+            if provider_called:
+                app_breaker.record_success()
+            return None
+
+        updates = self._decide(app, app_config, queues, await self._formation(app))
+        if updates:
+            try:
+                with metrics.api_call(app, 'scale', phase='scale'):
+                    await self._call(self.infrastructure_provider.scale(app, updates))
+            except asyncio.TimeoutError:
+                # The scale might still go through, so it's neither a failure nor a success.
+                LOGGER.warning('Timed out scaling, it might still complete', app=app)
+                return queues
+            except InfrastructureProviderError as err:
+                LOGGER.warning('Failed to scale', app=app, err=repr(err))
+                app_breaker.record_failure()
+                return queues
+
+            provider_called = True
+
+        if provider_called:
+            app_breaker.record_success()
+        return queues
+
+    async def _queues(
+        self, app: str, app_config: AppConfig, broker_uri: Optional[str]
+    ) -> Optional[List[Queue]]:
+        """
+        The queues seen on the broker of an app, or None if it couldn't be inspected.
+        """
+        if not broker_uri:
+            LOGGER.warning('Cannot find broker URI on app', app=app)
+            return None
+
+        broker = self.brokers.get(app_config.broker)
+        if not broker:
+            LOGGER.warning(
+                'No broker available for app', app=app, broker=app_config.broker.value
+            )
+            return None
+
+        broker_breaker = self._broker_breaker(app, broker_uri)
+        if not broker_breaker:
+            return None
+
+        try:
+            with metrics.api_call(app, 'stats', phase='stats'):
+                interest_queues = list(app_config.queues.keys())
+                stats = await self._call(broker.stats(broker_uri, interest_queues))
+                queues = await broker.queues(interest_queues, stats)
+        except (BrokerError, asyncio.TimeoutError) as err:
+            LOGGER.warning(
+                'Skipping broker', app=app, broker_uri=broker_uri, err=repr(err)
+            )
+            broker_breaker.record_failure()
+            self.infrastructure_provider.invalidate_broker_uri(app)
+            return None
+
+        broker_breaker.record_success()
+        return queues
+
+    async def _formation(self, app: str) -> Optional[Dict[str, int]]:
+        """
+        The quantity of each process type of an app, which the consumers counts are reconciled with.
+
+        :return: None if the consumers counts reported by the broker should be used instead.
+        """
+        if not self._reconciles_with_formation(app):
+            return None
+
+        try:
+            with metrics.api_call(app, 'formation'):
+                return await self._call(self.infrastructure_provider.formation(app))
+        except (InfrastructureProviderError, asyncio.TimeoutError):
+            LOGGER.warning('Using the consumers counts of the broker', app=app)
+            return None
+
+    async def _call(self, call: Awaitable[T]) -> T:
+        """
+        Waits for a call for at most `timeout` seconds.
+
+        A call made in a thread, such as the calls of a `SyncInfrastructureProviderAdapter`, isn't
+        interrupted by the timeout: it's only given up on, and may still complete afterwards.
+        """
+        return await asyncio.wait_for(call, self.timeout)
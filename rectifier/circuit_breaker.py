@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+from enum import Enum
+from typing import Dict, Optional
+
+import structlog
+
+from rectifier import settings
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class CircuitState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Stops calling something which keeps failing, and tries it again after a backoff.
+
+    The breaker opens after a number of consecutive failures. Once its backoff has elapsed, it's
+    half-open: a single trial call is let through, which closes it if it succeeds, or opens it again
+    for twice as long if it fails. The backoffs are jittered, so the breakers opened by the same outage
+    aren't all retried at once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+    ) -> None:
+        """
+        :param name: What the breaker guards, for the logs.
+        :param failure_threshold: After how many consecutive failures the breaker opens.
+            Defaults to `settings.CIRCUIT_BREAKER_THRESHOLD`.
+        :param backoff: For how many seconds the breaker stays open the first time.
+            Defaults to `settings.CIRCUIT_BREAKER_BACKOFF`.
+        :param max_backoff: For how many seconds the breaker stays open at most.
+            Defaults to `settings.CIRCUIT_BREAKER_MAX_BACKOFF`.
+        """
+        self.name = name
+        self.failure_threshold = max(
+            failure_threshold
+            if failure_threshold is not None
+            else settings.CIRCUIT_BREAKER_THRESHOLD,
+            1,
+        )
+        self.backoff = (
+            backoff if backoff is not None else settings.CIRCUIT_BREAKER_BACKOFF
+        )
+        self.max_backoff = (
+            max_backoff
+            if max_backoff is not None
+            else settings.CIRCUIT_BREAKER_MAX_BACKOFF
+        )
+
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.openings = 0
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call can be made now."""
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+
+            now = time.monotonic()
+            if now < self.retry_at:
+                return False
+
+            # Until the trial reports back, or another backoff elapses, no other call is let through.
+            self.state = CircuitState.HALF_OPEN
+            self.retry_at = now + self._backoff()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CircuitState.CLOSED:
+                LOGGER.info('Circuit closed', circuit=self.name)
+
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+            self.openings = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if (
+                self.state == CircuitState.CLOSED
+                and self.failures < self.failure_threshold
+            ):
+                return
+
+            self.state = CircuitState.OPEN
+            self.openings += 1
+            backoff = self._backoff()
+            self.retry_at = time.monotonic() + backoff
+            LOGGER.warning(
+                'Circuit opened',
+                circuit=self.name,
+                failures=self.failures,
+                backoff=round(backoff, 1),
+            )
+
+    def snapshot(self) -> Dict:
+        """The state of the breaker, as reported on the health endpoint."""
+        with self._lock:
+            return dict(
+                state=self.state.value,
+                failures=self.failures,
+                retry_in=(
+                    round(max(self.retry_at - time.monotonic(), 0), 1)
+                    if self.state != CircuitState.CLOSED
+                    else None
+                ),
+            )
+
+    def _backoff(self) -> float:
+        """Doubles with every opening, jittered between half and all of it."""
+        backoff = min(self.backoff * 2 ** max(self.openings - 1, 0), self.max_backoff)
+        return random.uniform(backoff / 2, backoff)
+
+
+class CircuitBreakers:
+    """The circuit breakers of the apps and of the broker hosts, created as they are needed."""
+
+    _breakers: Dict[str, CircuitBreaker]
+
+    def __init__(self) -> None:
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def app(self, app: str) -> CircuitBreaker:
+        """Guards the calls made to the infrastructure provider for an app."""
+        return self._breaker(f'app:{app}')
+
+    def broker(self, host: Optional[str]) -> CircuitBreaker:
+        """Guards the calls made to a broker host, shared by the apps whose brokers it hosts."""
+        return self._breaker(f'broker:{host}')
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """The state of the breakers which aren't closed."""
+        with self._lock:
+            breakers = list(self._breakers.values())
+
+        snapshots = {breaker.name: breaker.snapshot() for breaker in breakers}
+        return {
+            name: snapshot
+            for (name, snapshot) in snapshots.items()
+            if snapshot['state'] != CircuitState.CLOSED.value
+        }
+
+    def _breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name)
+                self._breakers[name] = breaker
+
+            return breaker
@@ -1,4 +1,11 @@
-from .config import AppConfig, CoordinatorConfig, QueueConfig, Config, AppMode
+from .config import (
+    AppConfig,
+    CoordinatorConfig,
+    QueueConfig,
+    Config,
+    AppMode,
+    BrokerType,
+)
 from .config_parser import ConfigParser, ConfigReadError
 
 __all__ = [
@@ -9,4 +16,5 @@ __all__ = [
     'ConfigParser',
     'ConfigReadError',
     'AppMode',
+    'BrokerType',
 ]
@@ -1,17 +1,27 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 
 @dataclass
 class QueueConfig:
-    """Configuration for a single Queue"""
+    """
+    Configuration for a single Queue
+
+    The workers are either looked up in steps, by the interval the number of messages falls in,
+    or track a target number of messages per worker, when `target_messages_per_worker` is set.
+    """
 
     intervals: List[int]
     workers: List[int]
     cooldown: int
     queue_name: str
     consumers_formation_name: str
+    forecast_horizon: Optional[int] = None
+    target_messages_per_worker: Optional[float] = None
+    min_workers: int = 0
+    max_workers: Optional[int] = None
+    max_step: Optional[int] = None
 
 
 class AppMode(Enum):
@@ -20,12 +30,20 @@ class AppMode(Enum):
     KILL = 'kill'
 
 
+class BrokerType(Enum):
+    """How the stats of the queues are retrieved from the broker."""
+
+    HTTP = 'http'
+    AMQP = 'amqp'
+
+
 @dataclass
 class AppConfig:
     """Configuration for a single App"""
 
     queues: Dict[str, QueueConfig]
     mode: AppMode
+    broker: BrokerType = BrokerType.HTTP
 
 
 @dataclass
@@ -42,4 +60,11 @@ class Config:
     coordinator_config: CoordinatorConfig
 
 
-__all__ = ['QueueConfig', 'CoordinatorConfig', 'AppConfig', 'Config', 'AppMode']
+__all__ = [
+    'QueueConfig',
+    'CoordinatorConfig',
+    'AppConfig',
+    'Config',
+    'AppMode',
+    'BrokerType',
+]
@@ -1,12 +1,19 @@
 import json
 from json import JSONDecodeError
-from typing import Dict
+from typing import Any, Dict
 
 import jsonschema
 import structlog
 
 import schemas
-from rectifier.config import Config, AppConfig, QueueConfig, CoordinatorConfig, AppMode
+from rectifier.config import (
+    Config,
+    AppConfig,
+    QueueConfig,
+    CoordinatorConfig,
+    AppMode,
+    BrokerType,
+)
 from rectifier.storage.storage import Storage
 from rectifier import settings
 
@@ -23,6 +30,9 @@ class ConfigReadError(RuntimeError):
 class ConfigParser:
     """A utility class for parsing and validating configuration."""
 
+    # The keys of an app configuration which are settings of the app, rather than queues.
+    APP_SETTINGS = ('mode', 'broker')
+
     def __init__(self, storage: Storage) -> None:
         """Takes the configuration from the storage, and tries to parse it."""
 
@@ -52,12 +62,15 @@ class ConfigParser:
             queues = dict()
 
             mode = AppMode(config.get('mode', AppMode.SCALE.value))
+            broker = BrokerType(config.get('broker', BrokerType.HTTP.value))
             for (queue_name, queue_properties) in cls._queue_configs(config):
-                queues[queue_name] = QueueConfig(
-                    queue_name=queue_name, **queue_properties
-                )
+                # The queues tracking a target of messages per worker have no intervals.
+                properties: Dict[str, Any] = dict(intervals=[], workers=[])
+                properties.update(queue_properties)
 
-            apps[app] = AppConfig(queues=queues, mode=mode)
+                queues[queue_name] = QueueConfig(queue_name=queue_name, **properties)
+
+            apps[app] = AppConfig(queues=queues, mode=mode, broker=broker)
 
         return Config(coordinator_config=CoordinatorConfig(apps=apps))
 
@@ -86,45 +99,101 @@ class ConfigParser:
                 message = f'Improper value for app mode: {app_mode}. Possible values: {[mode.value for mode in AppMode]}'
                 raise ConfigReadError(message) from err
 
+            broker = config.get('broker', BrokerType.HTTP.value)
+            try:
+                BrokerType(broker)
+            except ValueError as err:
+                message = f'Improper value for broker: {broker}. Possible values: {[broker.value for broker in BrokerType]}'
+                raise ConfigReadError(message) from err
+
             for (queue_name, queue_properties) in cls._queue_configs(config):
-                intervals = queue_properties['intervals']
-                workers = queue_properties['workers']
                 cooldown = queue_properties['cooldown']
-
-                if len(intervals) != len(workers):
-                    message = 'The length of the intervals array should match the length of the workers array.'
-                    LOGGER.error(message, queue_name=queue_name)
-                    raise ConfigReadError(message)
-
-                if intervals[0] != 0:
-                    message = 'The first interval should start with 0.'
-                    LOGGER.error(message, intervals=intervals, queue_name=queue_name)
+                if cooldown < 0:
+                    message = 'The cooldown should be positive.'
+                    LOGGER.error(message, cooldown=cooldown, queue_name=queue_name)
                     raise ConfigReadError(message)
 
-                if any([interval < 0 for interval in intervals]):
-                    message = (
-                        'The entries in the message intervals should all be positive.'
+                forecast_horizon = queue_properties.get('forecast_horizon')
+                if forecast_horizon is not None and forecast_horizon < 0:
+                    message = 'The forecast horizon should be positive.'
+                    LOGGER.error(
+                        message,
+                        forecast_horizon=forecast_horizon,
+                        queue_name=queue_name,
                     )
-                    LOGGER.error(message, intervals=intervals, queue_name=queue_name)
                     raise ConfigReadError(message)
 
-                if any([worker < 0 for worker in workers]):
-                    message = (
-                        'The entries in the workers count array should all be positive.'
-                    )
-                    LOGGER.error(message, workers=workers, queue_name=queue_name)
-                    raise ConfigReadError(message)
+                if 'target_messages_per_worker' in queue_properties:
+                    cls._validate_target_tracking(queue_name, queue_properties)
+                else:
+                    cls._validate_steps(queue_name, queue_properties)
 
-                if cooldown < 0:
-                    message = 'The cooldown should be positive.'
-                    LOGGER.error(message, cooldown=cooldown, queue_name=queue_name)
-                    raise ConfigReadError(message)
+    @classmethod
+    def _validate_steps(cls, queue_name: str, queue_properties: Dict) -> None:
+        """Validates a queue whose workers are looked up by the interval its number of messages falls in."""
 
-                if sorted(intervals) != intervals:
-                    message = 'The intervals should be sorted in ascending order.'
-                    LOGGER.error(message, intervals=intervals, queue_name=queue_name)
-                    raise ConfigReadError(message)
+        intervals = queue_properties['intervals']
+        workers = queue_properties['workers']
+
+        if len(intervals) != len(workers):
+            message = 'The length of the intervals array should match the length of the workers array.'
+            LOGGER.error(message, queue_name=queue_name)
+            raise ConfigReadError(message)
 
-    @staticmethod
-    def _queue_configs(app_config: Dict):
-        return ((k, v) for (k, v) in app_config.items() if k != 'mode')
+        if intervals[0] != 0:
+            message = 'The first interval should start with 0.'
+            LOGGER.error(message, intervals=intervals, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+        if any([interval < 0 for interval in intervals]):
+            message = 'The entries in the message intervals should all be positive.'
+            LOGGER.error(message, intervals=intervals, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+        if any([worker < 0 for worker in workers]):
+            message = 'The entries in the workers count array should all be positive.'
+            LOGGER.error(message, workers=workers, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+        if sorted(intervals) != intervals:
+            message = 'The intervals should be sorted in ascending order.'
+            LOGGER.error(message, intervals=intervals, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+    @classmethod
+    def _validate_target_tracking(cls, queue_name: str, queue_properties: Dict) -> None:
+        """Validates a queue whose workers track a target number of messages per worker."""
+
+        target = queue_properties['target_messages_per_worker']
+        min_workers = queue_properties.get('min_workers', 0)
+        max_workers = queue_properties['max_workers']
+        max_step = queue_properties.get('max_step')
+
+        if target <= 0:
+            message = 'The target of messages per worker should be greater than 0.'
+            LOGGER.error(message, target=target, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+        if min_workers < 0:
+            message = 'The minimum number of workers should be positive.'
+            LOGGER.error(message, min_workers=min_workers, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+        if max_workers < min_workers:
+            message = 'The maximum number of workers should be at least the minimum number of workers.'
+            LOGGER.error(
+                message,
+                min_workers=min_workers,
+                max_workers=max_workers,
+                queue_name=queue_name,
+            )
+            raise ConfigReadError(message)
+
+        if max_step is not None and max_step < 1:
+            message = 'The maximum step should be at least 1.'
+            LOGGER.error(message, max_step=max_step, queue_name=queue_name)
+            raise ConfigReadError(message)
+
+    @classmethod
+    def _queue_configs(cls, app_config: Dict):
+        return ((k, v) for (k, v) in app_config.items() if k not in cls.APP_SETTINGS)
@@ -1,3 +1,4 @@
 from .consumer_updates_coordinator import ConsumerUpdatesCoordinator
+from .depth_forecaster import DepthForecaster
 
-__all__ = ['ConsumerUpdatesCoordinator']
+__all__ = ['ConsumerUpdatesCoordinator', 'DepthForecaster']
@@ -1,19 +1,42 @@
+import io
+import math
 import pickle
+import threading
 from collections import defaultdict
 from datetime import datetime
-from json import JSONDecodeError
-from typing import DefaultDict, Dict, Optional, Tuple
+from typing import DefaultDict, Dict, List, Optional, Sequence, Tuple
 
 import structlog
 
-from rectifier.config import CoordinatorConfig, AppMode
+from rectifier.config import CoordinatorConfig, AppMode, QueueConfig
 from rectifier.queue import Queue
 from rectifier.storage import Storage
-from rectifier import settings
+from rectifier import metrics, settings
+from .depth_forecaster import DepthForecaster
+from .step_policies import StepPolicies
 
 LOGGER = structlog.get_logger(__name__)
 
 
+class _UpdateTimesUnpickler(pickle.Unpickler):
+    """
+    Unpickles the update times as they were stored before they moved to a hash, refusing anything
+    but the dictionaries and the datetimes they were made of.
+    """
+
+    ALLOWED = {
+        ('collections', 'defaultdict'),
+        ('builtins', 'dict'),
+        ('datetime', 'datetime'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f'{module}.{name} is not an update time.')
+
+        return super().find_class(module, name)
+
+
 class ConsumerUpdatesCoordinator:
     """
     Keeps track of the updates time of the queues, storing/loading them from the storage.
@@ -23,44 +46,175 @@ class ConsumerUpdatesCoordinator:
 
     queues_update_time: DefaultDict[str, Dict[str, datetime]]
 
-    def __init__(self, config: CoordinatorConfig, storage: Storage) -> None:
+    def __init__(
+        self,
+        config: CoordinatorConfig,
+        storage: Storage,
+        depth_forecaster: Optional[DepthForecaster] = None,
+    ) -> None:
         """
         :param config: The configuration to be used for computing the number of consumers.
         :param storage: The storage for storing/loading the update times.
+        :param depth_forecaster: Keeps the history of the queues which are scaled on forecasts.
         """
         self.config = config
+        self.policies = StepPolicies(config)
         self.storage = storage
+        self.depth_forecaster = depth_forecaster or DepthForecaster()
+        self._lock = threading.Lock()
+        self._pending_update_times: Dict[str, str] = dict()
+
+        self.queues_update_time = defaultdict(dict)
+        stale_fields: List[str] = []
+
+        self._migrate_update_times()
+
+        for (field, value) in storage.hgetall(settings.REDIS_UPDATE_TIMES).items():
+            field = field.decode() if isinstance(field, bytes) else field
+            (app_name, _, queue_name) = field.partition('/')
+
+            app_config = config.apps.get(app_name)
+            if app_config is None or queue_name not in app_config.queues:
+                stale_fields.append(field)
+                continue
 
-        update_times = storage.get(settings.REDIS_UPDATE_TIMES)
-        if update_times is None:
-            self.queues_update_time = defaultdict(dict)
+            try:
+                self.queues_update_time[app_name][queue_name] = datetime.fromisoformat(
+                    value.decode() if isinstance(value, bytes) else value
+                )
+            except (ValueError, TypeError):
+                LOGGER.info(
+                    'Failed to parse an update time from the redis store.',
+                    field=field,
+                    value=value,
+                )
+
+        if stale_fields:
+            LOGGER.info('Removing stale update times.', fields=stale_fields)
+            storage.hdel(settings.REDIS_UPDATE_TIMES, *stale_fields)
+
+    def _migrate_update_times(self) -> None:
+        """
+        Moves the update times stored under the legacy key, as a single pickled blob, into the hash.
+
+        The fields already in the hash are newer, and are kept. The legacy key is deleted afterwards, so
+        the migration only happens once.
+        """
+        legacy_update_times = self.storage.get(settings.REDIS_LEGACY_UPDATE_TIMES)
+        if legacy_update_times is None:
             return
 
         try:
-            self.queues_update_time = pickle.loads(update_times)
-            return
-        except (JSONDecodeError, TypeError):
+            update_times = _UpdateTimesUnpickler(io.BytesIO(legacy_update_times)).load()
+            migrated = {
+                f'{app_name}/{queue_name}': time_of_update.isoformat()
+                for (app_name, queues) in update_times.items()
+                for (queue_name, time_of_update) in queues.items()
+            }
+        except (
+            pickle.UnpicklingError,
+            AttributeError,
+            EOFError,
+            TypeError,
+            ValueError,
+        ) as error:
             LOGGER.info(
-                'Failed to parse the update times from the redis store.',
-                queues_update_time=update_times,
+                'Failed to parse the legacy update times, dropping them.',
+                error=str(error),
             )
+            migrated = dict()
 
-        self.queues_update_time = defaultdict(dict)
+        existing_fields = {
+            field.decode() if isinstance(field, bytes) else field
+            for field in self.storage.hgetall(settings.REDIS_UPDATE_TIMES)
+        }
+
+        batch = self.storage.batch()
+        for (field, value) in migrated.items():
+            if field not in existing_fields:
+                batch.hset(settings.REDIS_UPDATE_TIMES, field, value)
+        batch.execute()
+
+        self.storage.delete(settings.REDIS_LEGACY_UPDATE_TIMES)
+        LOGGER.info('Migrated the legacy update times.', fields=sorted(migrated))
 
     def _update_time(self, app_name: str, queue_name: str) -> None:
         """
         Updates the time of update for a given queue name, both in memory and in the persistent storage.
+
+        Each queue is stored in its own field of a hash, so only the field of the updated queue is written,
+        once the pending update times are flushed.
         :param queue_name: The name of the queue to be updated.
         """
         time_of_update = datetime.now()
 
-        self.queues_update_time[app_name][queue_name] = time_of_update
-        self.storage.set(
-            settings.REDIS_UPDATE_TIMES, pickle.dumps(self.queues_update_time)
+        with self._lock:
+            self.queues_update_time[app_name][queue_name] = time_of_update
+            self._pending_update_times[
+                f'{app_name}/{queue_name}'
+            ] = time_of_update.isoformat()
+
+    def flush(self) -> None:
+        """
+        Writes the pending update times to the persistent storage, in a single batch.
+        """
+        with self._lock:
+            pending_update_times = self._pending_update_times
+            self._pending_update_times = dict()
+
+        if not pending_update_times:
+            return
+
+        batch = self.storage.batch()
+        for (field, value) in pending_update_times.items():
+            batch.hset(settings.REDIS_UPDATE_TIMES, field, value)
+        batch.execute()
+
+    def discard(self, app_name: str) -> None:
+        """
+        Drops the pending update times of an app whose consumers ended up not being scaled.
+
+        The update times kept in memory are left as they are, they are reloaded from the storage on
+        the next term of the leadership.
+        """
+        with self._lock:
+            self._pending_update_times = {
+                field: value
+                for (field, value) in self._pending_update_times.items()
+                if field.partition('/')[0] != app_name
+            }
+
+    def cooldown_left(self, app: str) -> float:
+        """
+        In how many seconds the first queue of an app leaves its cooldown, or 0 if one already has.
+        """
+        now = datetime.now()
+        app_config = self.config.apps.get(app)
+        update_times = self.queues_update_time.get(app, {})
+
+        if not app_config:
+            return 0
+
+        return max(
+            min(
+                (
+                    queue_config.cooldown
+                    - (now - update_times[queue_name]).total_seconds()
+                    if queue_name in update_times
+                    else 0
+                    for (queue_name, queue_config) in app_config.queues.items()
+                ),
+                default=0,
+            ),
+            0,
         )
 
     def compute_consumers_count(
-        self, app: str, app_mode: AppMode, queue: Queue
+        self,
+        app: str,
+        app_mode: AppMode,
+        queue: Queue,
+        current_consumers: Optional[int] = None,
     ) -> Tuple[Optional[int], Optional[str]]:
         """
         Computes the count of the consumers which should be used for a queue, given its stats and the configuration.
@@ -68,6 +222,8 @@ class ConsumerUpdatesCoordinator:
         :param app: The app in which the queue resides.
         :param app_mode: The mode in which the current app is set to run
         :param queue: The queue for which the consumers count should be calculated.
+        :param current_consumers: The number of consumers actually running for the queue.
+            Defaults to the consumers count reported by the broker.
         :return:
             None
                 - if no update should be made (either because the cooldown hasn't yet expired, or the queue
@@ -76,39 +232,207 @@ class ConsumerUpdatesCoordinator:
             Otherwise
                 - the number of consumers which should be used for this queue.
         """
-        last_update = self.queues_update_time[app].get(queue.queue_name)
+        now = datetime.now()
+        last_update = self.queues_update_time.get(app, {}).get(queue.queue_name)
+        policy = self.policies.policy(app, queue.queue_name)
+        self._observe(app, queue, now)
+
+        messages = (
+            0 if app_mode == AppMode.KILL else self._expected_messages(app, queue)
+        )
+        in_cooldown = self.policies.in_cooldown(
+            policy, self._seconds_since(last_update, now)
+        )
+
+        return self._decide(
+            app,
+            app_mode,
+            queue,
+            current_consumers,
+            messages,
+            self.policies.workers_for(policy, messages),
+            in_cooldown,
+            last_update,
+            now,
+        )
+
+    def compute_consumers_counts(
+        self, queues: Sequence[Tuple[str, AppMode, Queue, Optional[int]]]
+    ) -> List[Tuple[Optional[int], Optional[str]]]:
+        """
+        Computes the count of the consumers of many queues at once, as `compute_consumers_count` does for each of them.
+
+        The intervals and the cooldowns of all the queues are looked up in a single pass.
+
+        :param queues: The app, the app mode, the queue and the current consumers of each queue.
+        :return: The count of the consumers and the formation of each queue, in the same order.
+        """
+        now = datetime.now()
+
+        policies: List[int] = []
+        messages: List[float] = []
+        seconds_since_update: List[int] = []
+        last_updates: List[Optional[datetime]] = []
+
+        for (app, app_mode, queue, _) in queues:
+            last_update = self.queues_update_time.get(app, {}).get(queue.queue_name)
+            self._observe(app, queue, now)
+
+            policies.append(self.policies.policy(app, queue.queue_name))
+            messages.append(
+                0 if app_mode == AppMode.KILL else self._expected_messages(app, queue)
+            )
+            seconds_since_update.append(self._seconds_since(last_update, now))
+            last_updates.append(last_update)
+
+        (step_workers, in_cooldown) = self.policies.evaluate(
+            policies, messages, seconds_since_update
+        )
+
+        return [
+            self._decide(
+                app,
+                app_mode,
+                queue,
+                current_consumers,
+                queue_messages,
+                queue_step_workers,
+                queue_in_cooldown,
+                last_update,
+                now,
+            )
+            for (
+                (app, app_mode, queue, current_consumers),
+                queue_messages,
+                queue_step_workers,
+                queue_in_cooldown,
+                last_update,
+            ) in zip(queues, messages, step_workers, in_cooldown, last_updates)
+        ]
+
+    def _decide(
+        self,
+        app: str,
+        app_mode: AppMode,
+        queue: Queue,
+        current_consumers: Optional[int],
+        messages: float,
+        step_workers: int,
+        in_cooldown: bool,
+        last_update: Optional[datetime],
+        now: datetime,
+    ) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Decides whether the consumers of a queue should be updated, once its intervals and cooldown are looked up.
+
+        :param messages: The number of messages the consumers of the queue should be scaled for.
+        :param step_workers: The workers of the interval the messages fall in, for the queues scaled in steps.
+        """
+        if current_consumers is None:
+            current_consumers = queue.consumers_count
 
         queue_config = self.config.apps[app].queues[queue.queue_name]
 
-        if last_update is not None:
-            time_since_update = datetime.now() - last_update
-            if time_since_update.seconds < queue_config.cooldown:
-                LOGGER.info(
-                    "Not updating the queues yet.",
-                    app=app,
-                    queue_name=queue.queue_name,
-                    last_update=last_update.isoformat(),
-                    cooldown=queue_config.cooldown,
-                    timedelta=time_since_update.seconds,
-                )
-                return None, None
+        if app_mode == AppMode.KILL:
+            target_consumers = 0
+        elif queue_config.target_messages_per_worker is not None:
+            target_consumers = self._tracked_consumers_count(
+                queue_config, messages, current_consumers
+            )
+        else:
+            target_consumers = step_workers
+
+        metrics.CURRENT_WORKERS.labels(app, queue_config.consumers_formation_name).set(
+            current_consumers
+        )
+        metrics.TARGET_WORKERS.labels(app, queue_config.consumers_formation_name).set(
+            target_consumers
+        )
+
+        if in_cooldown:
+            assert last_update is not None
+            LOGGER.info(
+                "Not updating the queues yet.",
+                app=app,
+                queue_name=queue.queue_name,
+                last_update=last_update.isoformat(),
+                cooldown=queue_config.cooldown,
+                timedelta=(now - last_update).seconds,
+            )
+            return None, None
 
         if app_mode == AppMode.KILL:
             return (
-                0 if queue.consumers_count else None,
+                0 if current_consumers else None,
                 queue_config.consumers_formation_name,
             )
 
-        matching_interval_index = [
-            i
-            for (i, messages_count) in enumerate(queue_config.intervals)
-            if queue.messages >= messages_count
-        ][-1]
-
-        consumers_for_interval = queue_config.workers[matching_interval_index]
-
-        if queue.consumers_count == consumers_for_interval:
+        if current_consumers == target_consumers:
             return None, None
 
         self._update_time(app, queue.queue_name)
-        return consumers_for_interval, queue_config.consumers_formation_name
+        return target_consumers, queue_config.consumers_formation_name
+
+    @staticmethod
+    def _tracked_consumers_count(
+        queue_config: QueueConfig, messages: float, current_consumers: int
+    ) -> int:
+        """
+        The number of consumers a queue tracking a target of messages per worker should have.
+
+        The target is at most `max_step` workers away from the current ones, and always kept between
+        the minimum and the maximum number of workers, even if that takes a larger step.
+        """
+        assert queue_config.target_messages_per_worker is not None
+        assert queue_config.max_workers is not None
+
+        workers = math.ceil(messages / queue_config.target_messages_per_worker)
+
+        if queue_config.max_step is not None:
+            workers = min(
+                max(workers, current_consumers - queue_config.max_step),
+                current_consumers + queue_config.max_step,
+            )
+
+        return min(max(workers, queue_config.min_workers), queue_config.max_workers)
+
+    def _observe(self, app: str, queue: Queue, now: datetime) -> None:
+        """Records the depth of the queues which are scaled on forecasts."""
+        if self.config.apps[app].queues[queue.queue_name].forecast_horizon is not None:
+            self.depth_forecaster.observe(app, queue, now.timestamp())
+
+    @staticmethod
+    def _seconds_since(last_update: Optional[datetime], now: datetime) -> int:
+        """The seconds component of the time since the last update, or -1 if there was none."""
+        if last_update is None:
+            return -1
+
+        return (now - last_update).seconds
+
+    def _expected_messages(self, app: str, queue: Queue) -> float:
+        """
+        The number of messages the consumers of a queue should be scaled for.
+
+        For the queues with a forecast horizon, this is the depth forecast at the end of the horizon,
+        if it's higher than the current depth. Scaling up happens before the backlog builds up,
+        while scaling down still waits for the queue to actually drain.
+        """
+        queue_config = self.config.apps[app].queues[queue.queue_name]
+        if queue_config.forecast_horizon is None:
+            return queue.messages
+
+        forecast = self.depth_forecaster.forecast(
+            app, queue.queue_name, queue_config.forecast_horizon
+        )
+        if forecast is None or forecast <= queue.messages:
+            return queue.messages
+
+        LOGGER.info(
+            'Scaling on forecast depth.',
+            app=app,
+            queue_name=queue.queue_name,
+            messages=queue.messages,
+            forecast=forecast,
+            horizon=queue_config.forecast_horizon,
+        )
+        return forecast
@@ -0,0 +1,89 @@
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+from rectifier import settings
+from rectifier.queue import Queue
+
+
+@dataclass
+class DepthSample:
+    """The depth of a queue at a point in time."""
+
+    time: float
+    messages: int
+    net_rate: Optional[float]
+
+
+class DepthForecaster:
+    """
+    Keeps a short history of the depth of each queue, and forecasts how deep a queue will be
+    some time from now.
+
+    The growth rate of a queue is the difference between its publish and ack rates, when the broker
+    reports them, and otherwise the change in depth between successive samples. The growth rates are
+    exponentially smoothed, and extrapolated linearly from the current depth.
+    """
+
+    _history: Dict[Tuple[str, str], Deque[DepthSample]]
+
+    def __init__(self, smoothing: Optional[float] = None) -> None:
+        """
+        :param smoothing: The weight of the most recent growth rate, between 0 and 1.
+            Defaults to `settings.FORECAST_SMOOTHING`.
+        """
+        self.smoothing = (
+            smoothing if smoothing is not None else settings.FORECAST_SMOOTHING
+        )
+
+        self._history = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, app: str, queue: Queue, now: float) -> None:
+        """Records the current depth and rates of a queue."""
+
+        net_rate = None
+        if queue.publish_rate is not None and queue.ack_rate is not None:
+            net_rate = queue.publish_rate - queue.ack_rate
+
+        with self._lock:
+            history = self._history.setdefault(
+                (app, queue.queue_name),
+                deque(maxlen=max(settings.FORECAST_HISTORY, 2)),
+            )
+
+        history.append(
+            DepthSample(time=now, messages=queue.messages, net_rate=net_rate)
+        )
+
+    def forecast(self, app: str, queue_name: str, horizon: float) -> Optional[float]:
+        """Forecasts the depth of a queue `horizon` seconds after its last sample,
+        or None if there isn't enough history for it."""
+
+        history = self._history.get((app, queue_name))
+        if not history:
+            return None
+
+        growth_rate = None
+        previous = None
+        for sample in history:
+            rate = sample.net_rate
+            if rate is None and previous is not None and sample.time > previous.time:
+                rate = (sample.messages - previous.messages) / (
+                    sample.time - previous.time
+                )
+
+            if rate is not None:
+                growth_rate = (
+                    rate
+                    if growth_rate is None
+                    else self.smoothing * rate + (1 - self.smoothing) * growth_rate
+                )
+
+            previous = sample
+
+        if growth_rate is None:
+            return None
+
+        return max(history[-1].messages + growth_rate * horizon, 0)
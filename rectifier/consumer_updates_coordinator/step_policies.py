@@ -0,0 +1,137 @@
+import bisect
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+from rectifier.config import CoordinatorConfig
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+
+class StepPolicies:
+    """
+    The step policies of every queue of a configuration, compiled into contiguous arrays.
+
+    The intervals of all the queues are laid out one after another in a single array, and their workers
+    in a single list. The number of workers of a queue is found by a binary search over its own slice of the
+    intervals, rather than by scanning them.
+
+    Many queues can be evaluated at once. When NumPy is installed, large batches are evaluated in a
+    single pass over arrays, with the same results. NumPy is optional: the batches of a single app are
+    rarely as large as `NUMPY_MIN_BATCH`, so the scaler mostly evaluates them one queue at a time.
+    """
+
+    # Below this many queues, a batch is cheaper to evaluate one queue at a time.
+    NUMPY_MIN_BATCH = 64
+
+    def __init__(self, config: CoordinatorConfig) -> None:
+        self._policies: Dict[Tuple[str, str], int] = dict()
+
+        self.offsets = array('q', [0])
+        self.intervals = array('d')
+        self.cooldowns = array('d')
+        self.workers: List[int] = []
+
+        for (app, app_config) in config.apps.items():
+            for (queue_name, queue_config) in app_config.queues.items():
+                self._policies[(app, queue_name)] = len(self.cooldowns)
+                self.intervals.extend(queue_config.intervals)
+                self.workers.extend(queue_config.workers)
+                self.cooldowns.append(queue_config.cooldown)
+                self.offsets.append(len(self.intervals))
+
+        self._numpy_arrays = None
+
+    def __len__(self) -> int:
+        return len(self.cooldowns)
+
+    def policy(self, app: str, queue_name: str) -> int:
+        """The index of the policy of a queue."""
+        return self._policies[(app, queue_name)]
+
+    def workers_for(self, policy: int, messages: float) -> int:
+        """
+        The number of workers of the last interval starting at or below the given number of messages,
+        or 0 if the queue has no intervals.
+        """
+        start = self.offsets[policy]
+        index = bisect.bisect_right(
+            self.intervals, messages, start, self.offsets[policy + 1]
+        )
+        return self.workers[index - 1] if index > start else 0
+
+    def in_cooldown(self, policy: int, seconds_since_update: int) -> bool:
+        """
+        :param seconds_since_update: Since when the queue was last updated, or a negative number if it never was.
+        """
+        return 0 <= seconds_since_update < self.cooldowns[policy]
+
+    def evaluate(
+        self,
+        policies: Sequence[int],
+        messages: Sequence[float],
+        seconds_since_update: Sequence[int],
+    ) -> Tuple[List[int], List[bool]]:
+        """
+        Evaluates many queues at once.
+
+        :param policies: The index of the policy of each queue.
+        :param messages: The number of messages each queue is scaled for.
+        :param seconds_since_update: Since when each queue was last updated, or a negative number if it never was.
+        :return: The number of workers of each queue, and whether each queue is in its cooldown.
+        """
+        if numpy is None or len(policies) < self.NUMPY_MIN_BATCH:
+            return (
+                [
+                    self.workers_for(policy, queue_messages)
+                    for (policy, queue_messages) in zip(policies, messages)
+                ],
+                [
+                    self.in_cooldown(policy, seconds)
+                    for (policy, seconds) in zip(policies, seconds_since_update)
+                ],
+            )
+
+        (offsets, intervals, cooldowns, max_length) = self._arrays()
+
+        policies_array = numpy.asarray(policies, dtype=numpy.int64)
+        messages_array = numpy.asarray(messages, dtype=numpy.float64)
+
+        # A binary search over the slice of every queue at once, the same one `bisect_right` makes.
+        starts = offsets[policies_array]
+        low = starts
+        high = offsets[policies_array + 1]
+        for _ in range(0, max_length.bit_length()):
+            searching = low < high
+            middle = (low + high) // 2
+            right = searching & (
+                intervals[numpy.minimum(middle, len(intervals) - 1)] <= messages_array
+            )
+            low = numpy.where(right, middle + 1, low)
+            high = numpy.where(searching & ~right, middle, high)
+
+        seconds_array = numpy.asarray(seconds_since_update, dtype=numpy.int64)
+        in_cooldown = (seconds_array >= 0) & (seconds_array < cooldowns[policies_array])
+
+        return (
+            [
+                self.workers[index - 1] if index > start else 0
+                for (index, start) in zip(low.tolist(), starts.tolist())
+            ],
+            in_cooldown.tolist(),
+        )
+
+    def _arrays(self):
+        """The arrays the batches are evaluated over, built on first use."""
+        if self._numpy_arrays is None:
+            offsets = numpy.frombuffer(self.offsets, dtype=numpy.int64)
+            self._numpy_arrays = (
+                offsets,
+                numpy.frombuffer(self.intervals, dtype=numpy.float64),
+                numpy.frombuffer(self.cooldowns, dtype=numpy.float64),
+                int(numpy.diff(offsets).max(initial=0)),
+            )
+
+        return self._numpy_arrays
@@ -1,6 +1,8 @@
 import os
+from typing import Optional
 
 from rectifier import settings
+from rectifier.circuit_breaker import CircuitBreakers
 from healthcheck import HealthCheck
 from redis.exceptions import ConnectionError, TimeoutError
 
@@ -10,7 +12,12 @@ class HealthChecker:
     Configures a health checker
     """
 
-    def __init__(self, redis_storage):
+    def __init__(
+        self, redis_storage, circuit_breakers: Optional[CircuitBreakers] = None
+    ):
+        """
+        :param circuit_breakers: When given, the breakers which aren't closed are reported.
+        """
         self._redis_store = redis_storage
         self._health_check = HealthCheck(
             failed_status=settings.HEALTH_CHECKER_FAILED_STATUS
@@ -22,6 +29,11 @@ class HealthChecker:
         self._health_check.add_section(
             'release', {"version": os.environ.get('HEROKU_RELEASE_VERSION', None)}
         )
+        if circuit_breakers is not None:
+            # An open circuit only affects its own app or broker, so it doesn't fail the check.
+            self._health_check.add_section(
+                'circuit_breakers', circuit_breakers.snapshot
+            )
         self._health_check.add_check(self._redis_available)
 
     def _redis_available(self):
@@ -1,4 +1,23 @@
-from .infrastructure_provider import InfrastructureProvider, InfrastructureProviderError
+from .infrastructure_provider import (
+    InfrastructureProvider,
+    InfrastructureProviderError,
+    RequestDeferredError,
+)
+from .async_infrastructure_provider import (
+    AsyncInfrastructureProvider,
+    SyncInfrastructureProviderAdapter,
+)
+from .api_key_scheduler import ApiKeyScheduler
 from .heroku import Heroku
+from .cached import CachedInfrastructureProvider
 
-__all__ = ['InfrastructureProvider', 'InfrastructureProviderError', 'Heroku']
+__all__ = [
+    'InfrastructureProvider',
+    'InfrastructureProviderError',
+    'RequestDeferredError',
+    'ApiKeyScheduler',
+    'Heroku',
+    'CachedInfrastructureProvider',
+    'AsyncInfrastructureProvider',
+    'SyncInfrastructureProviderAdapter',
+]
@@ -0,0 +1,104 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+
+from rectifier import settings
+from rectifier.obfuscate_string import obfuscate_string
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class ApiKeyScheduler:
+    """
+    Picks the API key with the most remaining rate limit budget.
+
+    Heroku reports the remaining budget of a key in the `RateLimit-Remaining` header and refills it at
+    a steady rate, so between responses the budget of each key is estimated as a token bucket: the last
+    reported value, plus what was refilled since, minus the calls made since.
+
+    Calls that aren't urgent are deferred when every key is below the reserve, so that the remaining
+    budget is kept for the calls that are.
+    """
+
+    _budgets: Dict[str, Tuple[float, float]]
+
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        refill_rate: Optional[float] = None,
+        reserve: Optional[int] = None,
+    ) -> None:
+        """
+        :param capacity: The maximum budget of a key. Defaults to `settings.HEROKU_RATE_LIMIT`.
+        :param refill_rate: How many calls are refilled per minute. Defaults to `settings.HEROKU_RATE_LIMIT_REFILL`.
+        :param reserve: The budget below which calls that aren't urgent are deferred.
+            Defaults to `settings.HEROKU_RATE_LIMIT_RESERVE`.
+        """
+
+        self.capacity = capacity if capacity is not None else settings.HEROKU_RATE_LIMIT
+        self.refill_rate = (
+            refill_rate
+            if refill_rate is not None
+            else settings.HEROKU_RATE_LIMIT_REFILL
+        ) / 60
+        self.reserve = (
+            reserve if reserve is not None else settings.HEROKU_RATE_LIMIT_RESERVE
+        )
+
+        self._budgets = dict()
+        self._lock = threading.Lock()
+
+    def acquire(self, keys: List[str], urgent: bool = True) -> Optional[str]:
+        """
+        Takes one call out of the budget of the key with the most headroom.
+
+        :param keys: The keys to choose from.
+        :param urgent: Whether the call should be made even if all the keys are below the reserve.
+        :return: The key to use, or None if there are no keys or the call should be deferred.
+        """
+
+        if not keys:
+            return None
+
+        now = time.monotonic()
+
+        with self._lock:
+            budgets = {key: self._budget(key, now) for key in keys}
+            key = max(keys, key=budgets.__getitem__)
+
+            if not urgent and budgets[key] < self.reserve:
+                LOGGER.warning(
+                    'All API keys are low on budget, deferring the call.',
+                    key=obfuscate_string(key),
+                    remaining=int(budgets[key]),
+                )
+                return None
+
+            self._budgets[key] = (budgets[key] - 1, now)
+
+        return key
+
+    def record(self, key: str, remaining: int) -> None:
+        """Records the remaining budget reported for a key."""
+
+        with self._lock:
+            self._budgets[key] = (float(remaining), time.monotonic())
+
+    def remaining(self, key: str) -> float:
+        """The estimated remaining budget of a key."""
+
+        with self._lock:
+            return self._budget(key, time.monotonic())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._budgets.clear()
+
+    def _budget(self, key: str, now: float) -> float:
+        if key not in self._budgets:
+            return self.capacity
+
+        (remaining, updated_at) = self._budgets[key]
+        return min(self.capacity, remaining + (now - updated_at) * self.refill_rate)
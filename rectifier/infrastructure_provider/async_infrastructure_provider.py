@@ -0,0 +1,56 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from .infrastructure_provider import InfrastructureProvider
+
+
+class AsyncInfrastructureProvider(ABC):
+    """The provider of the infrastructure (consumers), called without blocking the event loop."""
+
+    @abstractmethod
+    async def scale(self, app_name: str, scale_requests: Dict[str, int]) -> None:
+        """Scale the infrastructure in batch for the given queue_names to the given consumers_counts"""
+
+    @abstractmethod
+    async def broker_uri(self, app_name: str) -> str:
+        """Gets the broker uri for a given app name"""
+
+    def invalidate_broker_uri(self, app_name: str) -> None:
+        """Forgets any broker uri remembered for the given app name"""
+
+    def is_broker_uri_cached(self, app_name: str) -> bool:
+        """Whether the broker uri of the given app name is remembered, and would be returned without a call"""
+        return False
+
+    async def formation(self, app_name: str) -> Optional[Dict[str, int]]:
+        """Gets the quantity of each process type of the given app name, if known"""
+        return None
+
+
+class SyncInfrastructureProviderAdapter(AsyncInfrastructureProvider):
+    """
+    Makes a synchronous infrastructure provider usable from the event loop, by running its blocking calls in threads.
+    """
+
+    def __init__(self, infrastructure_provider: InfrastructureProvider) -> None:
+        self.infrastructure_provider = infrastructure_provider
+
+    async def scale(self, app_name: str, scale_requests: Dict[str, int]) -> None:
+        await asyncio.to_thread(
+            self.infrastructure_provider.scale, app_name, scale_requests
+        )
+
+    async def broker_uri(self, app_name: str) -> str:
+        return await asyncio.to_thread(
+            self.infrastructure_provider.broker_uri, app_name
+        )
+
+    def invalidate_broker_uri(self, app_name: str) -> None:
+        self.infrastructure_provider.invalidate_broker_uri(app_name)
+
+    def is_broker_uri_cached(self, app_name: str) -> bool:
+        return self.infrastructure_provider.is_broker_uri_cached(app_name)
+
+    async def formation(self, app_name: str) -> Optional[Dict[str, int]]:
+        return await asyncio.to_thread(self.infrastructure_provider.formation, app_name)
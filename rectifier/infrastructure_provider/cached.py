@@ -0,0 +1,99 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import structlog
+
+from rectifier.infrastructure_provider import (
+    InfrastructureProvider,
+    RequestDeferredError,
+)
+from rectifier import settings
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class CachedInfrastructureProvider(InfrastructureProvider):
+    """
+    Wraps another infrastructure provider, caching the broker URIs it returns.
+
+    Concurrent lookups for the same app share a single request to the wrapped provider. When the wrapped
+    provider defers a lookup, the expired broker URI is used until it can be refreshed.
+    """
+
+    _broker_uris: Dict[str, Tuple[str, float]]
+    _locks: Dict[str, threading.Lock]
+
+    def __init__(
+        self, infrastructure_provider: InfrastructureProvider, ttl: Optional[int] = None
+    ) -> None:
+        """
+        :param infrastructure_provider: The provider whose broker URIs should be cached.
+        :param ttl: For how many seconds a broker URI is cached. Defaults to `settings.BROKER_URI_CACHE_TTL`.
+        """
+        self.infrastructure_provider = infrastructure_provider
+        self.ttl = ttl if ttl is not None else settings.BROKER_URI_CACHE_TTL
+
+        self._broker_uris = dict()
+        self._locks = dict()
+        self._locks_lock = threading.Lock()
+
+    def scale(self, app_name: str, scale_requests: Dict[str, int]) -> None:
+        self.infrastructure_provider.scale(app_name, scale_requests)
+
+    def formation(self, app_name: str) -> Optional[Dict[str, int]]:
+        return self.infrastructure_provider.formation(app_name)
+
+    def broker_uri(self, app_name: str) -> str:
+        """
+        Retrieves the broker URI for a given app_name, from the cache if it hasn't expired yet.
+        """
+
+        broker_uri = self._cached_broker_uri(app_name)
+        if broker_uri is not None:
+            return broker_uri
+
+        with self._lock(app_name):
+            # Another thread might have loaded the URI while we were waiting.
+            broker_uri = self._cached_broker_uri(app_name)
+            if broker_uri is not None:
+                return broker_uri
+
+            try:
+                broker_uri = self.infrastructure_provider.broker_uri(app_name)
+            except RequestDeferredError:
+                entry = self._broker_uris.get(app_name)
+                if entry is None:
+                    raise
+
+                LOGGER.info('Using an expired broker URI', app=app_name)
+                return entry[0]
+
+            if broker_uri:
+                self._broker_uris[app_name] = (broker_uri, time.monotonic() + self.ttl)
+
+            return broker_uri
+
+    def invalidate_broker_uri(self, app_name: str) -> None:
+        if self._broker_uris.pop(app_name, None) is not None:
+            LOGGER.info('Evicted cached broker URI', app=app_name)
+
+        self.infrastructure_provider.invalidate_broker_uri(app_name)
+
+    def is_broker_uri_cached(self, app_name: str) -> bool:
+        return self._cached_broker_uri(app_name) is not None
+
+    def _cached_broker_uri(self, app_name: str) -> Optional[str]:
+        entry = self._broker_uris.get(app_name)
+        if entry is None:
+            return None
+
+        (broker_uri, expires_at) = entry
+        if time.monotonic() >= expires_at:
+            return None
+
+        return broker_uri
+
+    def _lock(self, app_name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(app_name, threading.Lock())
@@ -1,19 +1,21 @@
-from typing import Dict
+import threading
+from typing import Dict, Optional, Tuple
 
 import structlog
 import heroku3
-from heroku3.api import ResponseError, RateLimitExceeded
-
-from heroku3.models.app import App as HerokuApp
-from requests import HTTPError
+from heroku3.api import Heroku as HerokuClient, ResponseError, RateLimitExceeded
+import requests
+from requests import HTTPError, RequestException, Response
 
 from rectifier.infrastructure_provider import (
+    ApiKeyScheduler,
     InfrastructureProvider,
     InfrastructureProviderError,
+    RequestDeferredError,
 )
 from rectifier import settings
-from rectifier.get_random_key import get_random_key
 from rectifier.obfuscate_string import obfuscate_string
+from rectifier.timeout_http_adapter import TimeoutHTTPAdapter
 
 LOGGER = structlog.get_logger(__name__)
 
@@ -21,6 +23,11 @@ LOGGER = structlog.get_logger(__name__)
 class Heroku(InfrastructureProvider):
     """A wrapper over the Heroku Platofrm API, providing the capability to scale dynos for given queue names."""
 
+    _clients: Dict[str, HerokuClient] = dict()
+    _clients_lock = threading.Lock()
+    _scheduler = ApiKeyScheduler()
+    _formations: Dict[str, Tuple[str, Dict[str, int]]] = dict()
+
     def scale(self, app_name: str, scale_requests: Dict[str, int]) -> None:
         """
         Scales dynos.
@@ -36,18 +43,33 @@ class Heroku(InfrastructureProvider):
             LOGGER.debug('Not pursuing scaling since this is a dry run')
             return
 
-        key = self._key()
+        key = self._key(urgent=True)
+
+        payload = dict(
+            updates=[
+                dict(type=formation, quantity=quantity)
+                for (formation, quantity) in scale_requests.items()
+            ]
+        )
 
         try:
-            app = self._connection(app_name, key)
-            app.batch_scale_formation_processes(scale_requests)
-        except (HTTPError, ResponseError) as e:
+            client = self._client(key)
+            response = self._request(
+                client,
+                app_name,
+                method='PATCH',
+                resource=('apps', app_name, 'formation'),
+                data=client._resource_serialize(payload),
+            )
+            self._record_rate_limit(key, response)
+        except (RequestException, ResponseError) as e:
             message = 'Failed to scale.'
             LOGGER.error(message, app=app_name, error=e, key=obfuscate_string(key))
             raise InfrastructureProviderError(message)
         except RateLimitExceeded as e:
             message = 'Rate limit exceeded.'
             LOGGER.error(message, app=app_name, error=e, key=obfuscate_string(key))
+            self._scheduler.record(key, 0)
             raise InfrastructureProviderError(message)
 
     def broker_uri(self, app_name: str):
@@ -55,40 +77,153 @@ class Heroku(InfrastructureProvider):
         Retrieves the broker URI for a given app_name
         """
 
-        key = self._key()
+        key = self._key(urgent=False)
 
         try:
-            app = self._connection(app_name, key)
-            return app.config()[settings.BROKER_URL_KEY]
-        except HTTPError as e:
+            client = self._client(key)
+            response = self._request(
+                client,
+                app_name,
+                method='GET',
+                resource=('apps', app_name, 'config-vars'),
+            )
+            self._record_rate_limit(key, response)
+            return client._resource_deserialize(response.content.decode('utf-8')).get(
+                settings.BROKER_URL_KEY
+            )
+        except (RequestException, ResponseError) as e:
             message = 'Cannot retrieve the broker uri.'
             LOGGER.error(message, app=app_name, error=e, key=obfuscate_string(key))
             raise InfrastructureProviderError(message)
         except RateLimitExceeded as e:
             message = 'Rate limit exceeded.'
             LOGGER.error(message, app=app_name, error=e, key=obfuscate_string(key))
+            self._scheduler.record(key, 0)
             raise InfrastructureProviderError(message)
 
-    @staticmethod
-    def _key() -> str:
-        key = get_random_key(settings.HEROKU_API_KEYS)
+    def formation(self, app_name: str) -> Optional[Dict[str, int]]:
+        """
+        Retrieves the quantity of each process type of an app.
 
-        if not key:
+        The last formation of every app is kept along with its ETag, so a formation that hasn't
+        changed since is not sent again.
+        """
+
+        key = self._key(urgent=False)
+        (etag, quantities) = self._formations.get(app_name, (None, None))
+
+        try:
+            client = self._client(key)
+            response = client._session.get(
+                client._url_for('apps', app_name, 'formation'),
+                headers={'If-None-Match': etag} if etag else None,
+            )
+        except RequestException as e:
+            message = 'Cannot retrieve the formation.'
+            LOGGER.error(message, app=app_name, error=e, key=obfuscate_string(key))
+            raise InfrastructureProviderError(message)
+
+        self._record_rate_limit(key, response)
+
+        if response.status_code == 304 and quantities is not None:
+            return quantities
+
+        if response.status_code == 429:
+            message = 'Rate limit exceeded.'
+            LOGGER.error(message, app=app_name, key=obfuscate_string(key))
+            self._scheduler.record(key, 0)
+            raise InfrastructureProviderError(message)
+
+        if response.status_code in (403, 404):
+            message = 'App could not be found on Heroku'
+            LOGGER.error(message, app=app_name)
+            raise InfrastructureProviderError(message)
+
+        if response.status_code != 200:
+            message = 'Cannot retrieve the formation.'
+            LOGGER.error(
+                message,
+                app=app_name,
+                status_code=response.status_code,
+                key=obfuscate_string(key),
+            )
+            raise InfrastructureProviderError(message)
+
+        try:
+            quantities = {
+                process['type']: int(process['quantity']) for process in response.json()
+            }
+        except (ValueError, TypeError, KeyError) as e:
+            message = 'Cannot decode the formation.'
+            LOGGER.error(message, app=app_name, error=e)
+            raise InfrastructureProviderError(message)
+
+        if 'ETag' in response.headers:
+            self._formations[app_name] = (response.headers['ETag'], quantities)
+
+        return quantities
+
+    @classmethod
+    def _key(cls, urgent: bool = True) -> str:
+        """
+        Picks the API key with the most remaining rate limit budget.
+
+        :param urgent: Whether the call should be made even if all the keys are low on budget.
+        """
+
+        if not settings.HEROKU_API_KEYS:
             message = 'No API key set'
             LOGGER.error('No API key set')
             raise InfrastructureProviderError(message)
 
+        key = cls._scheduler.acquire(settings.HEROKU_API_KEYS, urgent=urgent)
+        if not key:
+            raise RequestDeferredError('All API keys are low on budget.')
+
         return key
 
+    @classmethod
+    def _record_rate_limit(cls, key: str, response: Response) -> None:
+        """
+        Records the remaining budget of a key, as reported in a response made with it.
+
+        The budget is read from the response of the call itself rather than from the client, which is
+        shared by the calls made concurrently with the same key.
+        """
+
+        remaining = response.headers.get('ratelimit-remaining')
+        if isinstance(remaining, (str, int)):
+            cls._scheduler.record(key, int(remaining))
+
+    @classmethod
+    def _client(cls, api_key: str) -> HerokuClient:
+        """Gets an authenticated Heroku client, reusing it for every call made with the same key."""
+
+        with cls._clients_lock:
+            client = cls._clients.get(api_key)
+            if client is None:
+                session = requests.Session()
+                session.mount('https://', TimeoutHTTPAdapter())
+                client = heroku3.from_key(api_key, session=session)
+                cls._clients[api_key] = client
+
+        return client
+
     @staticmethod
-    def _connection(app_name: str, api_key: str) -> HerokuApp:
-        """Gets a connection to Heroku."""
+    def _request(
+        client: HerokuClient,
+        app_name: str,
+        method: str,
+        resource: tuple,
+        data: Optional[str] = None,
+    ) -> Response:
+        """Makes a request for an app resource directly by the app name,
+        without looking the app up first."""
 
-        conn = heroku3.from_key(api_key)
         try:
-            return conn.app(app_name)
+            return client._http_resource(method=method, resource=resource, data=data)
         except HTTPError as e:
-            if e.response.status_code in (403, 404):
+            if e.response is not None and e.response.status_code in (403, 404):
                 message = 'App could not be found on Heroku'
                 LOGGER.error(message, app=app_name)
                 raise InfrastructureProviderError(message) from e
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Dict, Optional
 
 
 class InfrastructureProviderError(RuntimeError):
@@ -9,6 +9,13 @@ class InfrastructureProviderError(RuntimeError):
     pass
 
 
+class RequestDeferredError(InfrastructureProviderError):
+    """Raises when a request that isn't urgent is
+    deferred to save the rate limit budget."""
+
+    pass
+
+
 class InfrastructureProvider(ABC):
     """The provider of the infrastructure (consumers). Able to scale the consumers."""
 
@@ -19,3 +26,14 @@ class InfrastructureProvider(ABC):
     @abstractmethod
     def broker_uri(self, app_name: str) -> str:
         """Gets the broker uri for a given app name"""
+
+    def invalidate_broker_uri(self, app_name: str) -> None:
+        """Forgets any broker uri remembered for the given app name"""
+
+    def is_broker_uri_cached(self, app_name: str) -> bool:
+        """Whether the broker uri of the given app name is remembered, and would be returned without a call"""
+        return False
+
+    def formation(self, app_name: str) -> Optional[Dict[str, int]]:
+        """Gets the quantity of each process type of the given app name, if known"""
+        return None
@@ -0,0 +1,139 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import structlog
+
+from rectifier.storage import Storage
+from rectifier import settings
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class LeaderElection:
+    """
+    Elects a single leader among the processes sharing a storage, through a lease which expires
+    unless the leader keeps renewing it.
+
+    Every term of the lease has a fencing token, higher than the ones of the previous terms. A leader
+    which was paused for longer than the lease can tell it was replaced, by comparing its token with
+    the latest one, before acting.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        ttl: Optional[float] = None,
+        identity: Optional[str] = None,
+    ) -> None:
+        """
+        :param storage: The storage holding the lease.
+        :param ttl: For how many seconds the lease is held without being renewed.
+            Defaults to `settings.LEADER_LEASE_TTL`.
+        :param identity: Identifies this process as the holder of the lease. Unique by default.
+        """
+        self.storage = storage
+        self.ttl = ttl if ttl is not None else settings.LEADER_LEASE_TTL
+        self.identity = (
+            identity or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        )
+
+        self.token: Optional[int] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def renew_interval(self) -> float:
+        """How often the lease is renewed, or its acquisition retried."""
+        return self.ttl / 3
+
+    def acquire(self) -> bool:
+        """
+        Acquires the lease, or renews it if this process is already the leader.
+
+        :return: Whether this process is the leader.
+        """
+        with self._lock:
+            requested_at = time.monotonic()
+            token = self.storage.acquire_lease(
+                settings.REDIS_LEADER_KEY, self.identity, self.ttl
+            )
+
+            if token is None:
+                if self.token is not None:
+                    LOGGER.warning('Lost the leadership.', identity=self.identity)
+                self.token = None
+                return False
+
+            if token != self.token:
+                LOGGER.info(
+                    'Elected as the leader.', identity=self.identity, token=token
+                )
+
+            self.token = token
+            self._expires_at = requested_at + self.ttl
+            return True
+
+    def is_leader(self) -> bool:
+        """Whether this process holds the lease, as far as it knows, without asking the storage."""
+        return self.token is not None and time.monotonic() < self._expires_at
+
+    def holds_fence(self) -> bool:
+        """Whether the term of this process is still the latest one, as stored."""
+        return self.is_leader() and (
+            self.storage.lease_token(settings.REDIS_LEADER_KEY) == self.token
+        )
+
+    def release(self) -> None:
+        """Releases the lease, so that another process can take over right away."""
+        if self.token is None:
+            return
+
+        self.storage.release_lease(settings.REDIS_LEADER_KEY, self.identity)
+        self.token = None
+        LOGGER.info('Released the leadership.', identity=self.identity)
+
+    def wait(self, seconds: float) -> None:
+        """
+        Sleeps for the given number of seconds, renewing the lease while this process is the leader.
+
+        Returns early if the leadership is lost.
+        """
+        deadline = time.monotonic() + seconds
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            time.sleep(min(remaining, self.renew_interval))
+
+            if self.token is not None and not self.acquire():
+                return
+
+    @contextmanager
+    def renewing(self) -> Iterator[None]:
+        """
+        Keeps renewing the lease from a background thread, so that it doesn't expire during a tick
+        which takes longer than the lease.
+
+        The renewals stop if the leadership is lost.
+        """
+        stop = threading.Event()
+
+        def renew() -> None:
+            while not stop.wait(self.renew_interval):
+                if self.token is None or not self.acquire():
+                    return
+
+        thread = threading.Thread(target=renew, name='leader-lease', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
@@ -1,4 +1,14 @@
 from .rabbitmq import RabbitMQ
+from .rabbitmq_amqp import RabbitMQAMQP
 from .broker import Broker
+from .async_broker import AsyncBroker, SyncBrokerAdapter
+from .async_rabbitmq import AsyncRabbitMQ
 
-__all__ = ['RabbitMQ', 'Broker']
+__all__ = [
+    'RabbitMQ',
+    'RabbitMQAMQP',
+    'Broker',
+    'AsyncBroker',
+    'SyncBrokerAdapter',
+    'AsyncRabbitMQ',
+]
@@ -0,0 +1,43 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List, Dict, Optional
+
+from rectifier.queue import Queue
+from .broker import Broker
+
+
+class AsyncBroker(ABC):
+    """
+    A message broker in which queues exist, retrieving stats about the queues without blocking the event loop.
+    """
+
+    @abstractmethod
+    async def stats(self, uri: str, interest_queues: Optional[List[str]] = None):
+        """Retrieves all the available queues stats. Implementations may only
+        retrieve the stats needed for the given interest queues."""
+
+    @abstractmethod
+    async def queues(
+        self, interest_queues: List[str], stats: List[Dict]
+    ) -> List[Queue]:
+        """Returns the stats for the given queue names, in a proper representation."""
+
+    async def close(self) -> None:
+        """Releases the connections held by the broker."""
+
+
+class SyncBrokerAdapter(AsyncBroker):
+    """
+    Makes a synchronous broker usable from the event loop, by running its blocking calls in threads.
+    """
+
+    def __init__(self, broker: Broker) -> None:
+        self.broker = broker
+
+    async def stats(self, uri: str, interest_queues: Optional[List[str]] = None):
+        return await asyncio.to_thread(self.broker.stats, uri, interest_queues)
+
+    async def queues(
+        self, interest_queues: List[str], stats: List[Dict]
+    ) -> List[Queue]:
+        return self.broker.queues(interest_queues, stats)
@@ -0,0 +1,144 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+import structlog
+
+from rectifier import settings
+from rectifier.queue import Queue
+from .async_broker import AsyncBroker
+from .json_stream import aiter_json_array
+from .rabbitmq import STREAM_CHUNK_SIZE, BrokerError, RabbitMQ
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class AsyncRabbitMQ(AsyncBroker):
+    """
+    A wrapper over the RabbitMQ management API which doesn't block the event loop, so that the brokers
+    of many apps can be queried at the same time from a single thread.
+
+    The requests, the validation and the lookup of the queues are the same as the ones of `RabbitMQ`,
+    and so is the streaming: the listing is decoded as it's received, keeping only the stats of the
+    interest queues.
+    """
+
+    _session: Optional[aiohttp.ClientSession]
+
+    def __init__(self) -> None:
+        self._session = None
+
+    async def stats(self, uri: str, interest_queues: Optional[List[str]] = None):
+        """Gets a list of available queues and stat information
+        for each available queue."""
+
+        (_, _, user, password, url) = RabbitMQ.endpoint(uri)
+        auth = aiohttp.BasicAuth(user, password)
+        params = RabbitMQ.query_params()
+
+        if not settings.RABBIT_MQ_PAGE_SIZE:
+            if settings.RABBIT_MQ_STREAMING and interest_queues is not None:
+                data = await self._stream(url, params, auth, interest_queues)
+            else:
+                data = self._decode(url, await self._get(url, params, auth))
+
+            RabbitMQ.validate_listing(url, data, paginated=False)
+            return data
+
+        data = []
+        page = 1
+        page_count = 1
+        while page <= page_count:
+            page_params = dict(
+                params, page=page, page_size=settings.RABBIT_MQ_PAGE_SIZE
+            )
+            page_data = self._decode(url, await self._get(url, page_params, auth))
+            RabbitMQ.validate_listing(url, page_data, paginated=True)
+
+            data.extend(page_data['items'])
+            page_count = page_data['page_count']
+            page += 1
+
+        return data
+
+    async def queues(
+        self, interest_queues: List[str], stats: List[Dict]
+    ) -> List[Queue]:
+        return RabbitMQ.queues(interest_queues, stats)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get(self, url: str, params: Dict, auth: aiohttp.BasicAuth) -> bytes:
+        async with self._request(url, params, auth) as response:
+            return await response.read()
+
+    async def _stream(
+        self,
+        url: str,
+        params: Dict,
+        auth: aiohttp.BasicAuth,
+        interest_queues: List[str],
+    ) -> List[Dict]:
+        """Decodes the listing of queues as it's received, keeping only the interest queues."""
+
+        keep = RabbitMQ.listing_filter(url, interest_queues)
+        data = []
+
+        try:
+            async with self._request(url, params, auth) as response:
+                async for queue_stats in aiter_json_array(
+                    response.content.iter_chunked(STREAM_CHUNK_SIZE)
+                ):
+                    if keep(queue_stats):
+                        data.append(queue_stats)
+        except RabbitMQ.ERRORS as err:
+            message = 'Could not decode queue stats from RabbitMQ'
+            LOGGER.error(message, url=url, err=err)
+            raise BrokerError(message) from err
+
+        return data
+
+    @asynccontextmanager
+    async def _request(
+        self, url: str, params: Dict, auth: aiohttp.BasicAuth
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Makes a request to the management API, whose response is read while the context is open."""
+
+        LOGGER.debug('Making request to RabbitMQ', url=url, params=params)
+
+        try:
+            async with self._client().get(url, params=params, auth=auth) as response:
+                response.raise_for_status()
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            message = 'Could not retrieve queue stats from RabbitMQ'
+            LOGGER.error(message, url=url, err=err)
+            raise BrokerError(message) from err
+
+    @staticmethod
+    def _decode(url: str, content: bytes):
+        try:
+            return json.loads(content)
+        except RabbitMQ.ERRORS as err:
+            message = 'Could not decode queue stats from RabbitMQ'
+            LOGGER.error(message, url=url, err=err, response=content)
+            raise BrokerError(message) from err
+
+    def _client(self) -> aiohttp.ClientSession:
+        """The session whose connections are kept alive and reused, created on the running event loop."""
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=settings.CONNECT_TIMEOUT,
+                    sock_read=settings.READ_TIMEOUT,
+                ),
+            )
+
+        return self._session
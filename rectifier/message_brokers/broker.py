@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from rectifier.queue import Queue
 
@@ -11,10 +11,11 @@ class Broker(ABC):
 
     @staticmethod
     @abstractmethod
-    def stats(uri: str):
-        """Retrieves all the available queues stats"""
+    def stats(uri: str, interest_queues: Optional[List[str]] = None):
+        """Retrieves all the available queues stats. Implementations may only
+        retrieve the stats needed for the given interest queues."""
 
     @staticmethod
     @abstractmethod
-    def queues(interest_queues: List[str], stats: Dict) -> List[Queue]:
+    def queues(interest_queues: List[str], stats: List[Dict]) -> List[Queue]:
         """Returns the stats for the given queue names, in a proper representation."""
@@ -0,0 +1,149 @@
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Generator, Iterable, Iterator
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARACTERS = '0123456789+-.eE'
+
+# Yielded by the decoder when it needs the next chunk, which is then sent to it (None at the end).
+_MORE = object()
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Decodes a JSON array incrementally, yielding its items one by one
+    as the UTF-8 encoded chunks of the document are read.
+
+    Only the current item is kept in memory, besides the unread part of the last chunk.
+
+    Raises:
+        ValueError:
+            When the document is not a valid JSON array.
+    """
+
+    remaining_chunks = iter(chunks)
+    decoder = _decode_json_array()
+
+    try:
+        value = next(decoder)
+        while True:
+            if value is _MORE:
+                value = decoder.send(next(remaining_chunks, None))
+            else:
+                yield value
+                value = next(decoder)
+    except StopIteration:
+        return
+
+
+async def aiter_json_array(chunks: AsyncIterable[bytes]) -> AsyncIterator[Any]:
+    """
+    Decodes a JSON array incrementally, the same way `iter_json_array` does,
+    as the chunks of the document are received.
+
+    Raises:
+        ValueError:
+            When the document is not a valid JSON array.
+    """
+
+    remaining_chunks = chunks.__aiter__()
+    decoder = _decode_json_array()
+
+    try:
+        value = next(decoder)
+        while True:
+            if value is _MORE:
+                try:
+                    chunk = await remaining_chunks.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+
+                value = decoder.send(chunk)
+            else:
+                yield value
+                value = next(decoder)
+    except StopIteration:
+        return
+
+
+def _decode_json_array() -> Generator[Any, Any, None]:
+    """
+    Yields the items of a JSON array, and `_MORE` whenever the next chunk of the document
+    should be sent, or None once there are no chunks left.
+    """
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    buffer = ''
+    position = 0
+    exhausted = False
+
+    def read() -> Generator[Any, Any, bool]:
+        """Appends the next chunk to the buffer, dropping what was already decoded."""
+        nonlocal buffer, position, exhausted
+
+        if exhausted:
+            return False
+
+        chunk = yield _MORE
+        if chunk is None:
+            exhausted = True
+            text = utf8.decode(b'', final=True)
+        else:
+            text = utf8.decode(chunk)
+
+        buffer = buffer[position:] + text
+        position = 0
+        return not exhausted or bool(text)
+
+    def peek() -> Generator[Any, Any, str]:
+        """Skips the whitespace, returning the next character, or an empty string at the end."""
+        nonlocal position
+
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+
+            if position < len(buffer):
+                return buffer[position]
+
+            if not (yield from read()):
+                return ''
+
+    if (yield from peek()) != '[':
+        raise ValueError('Expected a JSON array')
+    position += 1
+
+    if (yield from peek()) == ']':
+        position += 1
+    else:
+        while True:
+            yield from peek()
+            while True:
+                try:
+                    (item, end) = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if not (yield from read()):
+                        raise
+                    continue
+
+                # A number at the end of the buffer might continue in the next chunk.
+                truncated = end == len(buffer) or buffer[end] in NUMBER_CHARACTERS
+                if truncated and not exhausted and (yield from read()):
+                    continue
+
+                break
+
+            position = end
+            yield item
+
+            separator = yield from peek()
+            position += 1
+            if separator == ']':
+                break
+            if separator != ',':
+                raise ValueError('Expected a comma or the end of the JSON array')
+
+    if (yield from peek()) != '':
+        raise ValueError('Unexpected data after the JSON array')
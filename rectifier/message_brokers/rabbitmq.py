@@ -1,7 +1,9 @@
+import functools
 import json
-from typing import Dict, List
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 import jsonschema as jsonschema
+from jsonschema.protocols import Validator
 import requests
 import structlog
 import pika
@@ -10,9 +12,19 @@ import schemas
 from rectifier import settings
 from rectifier.queue import Queue
 from .broker import Broker
+from .json_stream import iter_json_array
+from .session_pool import SessionPool
 
 LOGGER = structlog.get_logger(__name__)
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _compile(schema: Dict) -> Validator:
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
 
 class BrokerError(RuntimeError):
     """Error thrown when something goes
@@ -27,10 +39,81 @@ class RabbitMQ(Broker):
     An wrapper over RabbitMQ. Can fetch data about the queues in real time.
     """
 
-    @staticmethod
-    def stats(uri: str):
+    COLUMNS = [
+        'name',
+        'messages',
+        'consumers',
+        'message_stats.publish_details.rate',
+        'message_stats.ack_details.rate',
+    ]
+
+    ERRORS = (
+        requests.exceptions.RequestException,
+        requests.exceptions.HTTPError,
+        EOFError,
+        MemoryError,
+        OSError,
+        UnicodeError,
+        IOError,
+        EnvironmentError,
+        TypeError,
+        ValueError,
+        OverflowError,
+        json.JSONDecodeError,
+    )
+
+    sessions = SessionPool()
+
+    VALIDATORS = dict(
+        queue=_compile(schemas.RabbitMQ.QUEUE),
+        list=_compile(schemas.RabbitMQ.SCHEMA),
+        page=_compile(schemas.RabbitMQ.PAGE),
+        shallow_list=_compile(schemas.RabbitMQ.SHALLOW_SCHEMA),
+        shallow_page=_compile(schemas.RabbitMQ.SHALLOW_PAGE),
+    )
+
+    @classmethod
+    def stats(cls, uri: str, interest_queues: Optional[List[str]] = None):
         """Gets a list of available queues and stat information
-        for each available queue."""
+        for each available queue.
+
+        When streaming is enabled and the interest queues are given, the listing is decoded
+        incrementally and only the stats of the interest queues are kept."""
+
+        (protocol, host, user, password, url) = cls.endpoint(uri)
+
+        session = cls.sessions.get(protocol, host, user, password)
+        params = cls.query_params()
+
+        if not settings.RABBIT_MQ_PAGE_SIZE:
+            if settings.RABBIT_MQ_STREAMING and interest_queues is not None:
+                data = cls._stream(session, url, params, interest_queues)
+            else:
+                data = cls._get(session, url, params)
+
+            cls.validate_listing(url, data, paginated=False)
+            return data
+
+        data = []
+        page = 1
+        page_count = 1
+        while page <= page_count:
+            page_params = dict(
+                params, page=page, page_size=settings.RABBIT_MQ_PAGE_SIZE
+            )
+            page_data = cls._get(session, url, page_params)
+            cls.validate_listing(url, page_data, paginated=True)
+
+            data.extend(page_data['items'])
+            page_count = page_data['page_count']
+            page += 1
+
+        return data
+
+    @staticmethod
+    def endpoint(uri: str) -> Tuple[str, str, str, str, str]:
+        """The protocol, host and credentials of the management API of a broker,
+        and the URL listing its queues."""
 
         url_params = pika.URLParameters(uri)
 
@@ -42,87 +125,177 @@ class RabbitMQ(Broker):
         protocol = 'https' if settings.RABBIT_MQ_SECURE else 'http'
         url = '%s://%s/api/queues/%s' % (protocol, host, vhost)
 
-        auth = requests.auth.HTTPBasicAuth(user, password)
-
-        errors = (
-            requests.exceptions.RequestException,
-            requests.exceptions.HTTPError,
-            EOFError,
-            MemoryError,
-            OSError,
-            UnicodeError,
-            IOError,
-            EnvironmentError,
-            TypeError,
-            ValueError,
-            OverflowError,
-            json.JSONDecodeError,
-        )
+        return (protocol, host, user, password, url)
+
+    @staticmethod
+    def query_params() -> Dict[str, str]:
+        """The query parameters which make the management API return only what we need."""
+
+        params = dict(columns=','.join(RabbitMQ.COLUMNS))
+        if settings.RABBIT_MQ_DISABLE_STATS:
+            params.update(disable_stats='true', enable_queue_totals='true')
+
+        return params
 
-        LOGGER.debug('Making request to RabbitMQ', url=url)
+    @classmethod
+    def _get(cls, session: requests.Session, url: str, params: Dict):
+        response = cls._request(session, url, params)
 
         try:
-            response = requests.get(url, auth=auth)
-            response.raise_for_status()
-        except errors as err:
-            message = 'Could not retrieve queue stats from RabbitMQ'
-            LOGGER.error(message, url=url, err=err)
+            return response.json()
+        except cls.ERRORS as err:
+            message = 'Could not decode queue stats from RabbitMQ'
+            LOGGER.error(message, url=url, err=err, response=response.content)
             raise BrokerError(message) from err
 
+    @classmethod
+    def _stream(
+        cls,
+        session: requests.Session,
+        url: str,
+        params: Dict,
+        interest_queues: List[str],
+    ) -> List[Dict]:
+        """Decodes the listing of queues as it's received, keeping only the interest queues."""
+
+        with cls._request(session, url, params, stream=True) as response:
+            return cls.decode_listing(
+                url,
+                response.iter_content(chunk_size=STREAM_CHUNK_SIZE),
+                interest_queues,
+            )
+
+    @classmethod
+    def decode_listing(
+        cls, url: str, chunks: Iterable[bytes], interest_queues: List[str]
+    ) -> List[Dict]:
+        """Decodes a listing of queues incrementally, keeping only the interest queues."""
+
+        keep = cls.listing_filter(url, interest_queues)
+
         try:
-            data = response.json()
-        except errors as err:
+            return [
+                queue_stats
+                for queue_stats in iter_json_array(chunks)
+                if keep(queue_stats)
+            ]
+        except cls.ERRORS as err:
             message = 'Could not decode queue stats from RabbitMQ'
-            LOGGER.error(message, url=url, err=err, response=response.content)
+            LOGGER.error(message, url=url, err=err)
             raise BrokerError(message) from err
 
+    @classmethod
+    def listing_filter(
+        cls, url: str, interest_queues: List[str]
+    ) -> Callable[[Any], bool]:
+        """
+        Tells which items of a listing of queues decoded incrementally are kept: the interest queues,
+        and anything which isn't a queue, for the validation to report it.
+        """
+
+        queue_names = cls._queue_names(interest_queues)
+
+        def keep(queue_stats) -> bool:
+            if settings.RABBIT_MQ_VALIDATE_ALL_QUEUES:
+                cls._validate(url, queue_stats, cls.VALIDATORS['queue'])
+
+            return (
+                not isinstance(queue_stats, dict)
+                or queue_stats.get('name') in queue_names
+            )
+
+        return keep
+
+    @classmethod
+    def _request(
+        cls,
+        session: requests.Session,
+        url: str,
+        params: Dict,
+        stream: bool = False,
+    ) -> requests.Response:
+        LOGGER.debug('Making request to RabbitMQ', url=url, params=params)
+
         try:
-            jsonschema.validate(data, schemas.RabbitMQ.SCHEMA)
-        except jsonschema.ValidationError as err:
+            response = session.get(url, params=params, stream=stream)
+            response.raise_for_status()
+        except cls.ERRORS as err:
+            message = 'Could not retrieve queue stats from RabbitMQ'
+            LOGGER.error(message, url=url, err=err)
+            raise BrokerError(message) from err
+
+        return response
+
+    @staticmethod
+    def _validate(url: str, data, validator: Validator) -> None:
+        err = next(validator.iter_errors(data), None)
+        if err is not None:
             message = 'Could not validate queue stats returned by RabbitMQ'
             LOGGER.error(message, url=url, err=err, data=data)
             raise BrokerError(message) from err
 
-        return data
+    @classmethod
+    def validate_listing(cls, url: str, data, paginated: bool) -> None:
+        """Validates a listing of queues, or a page of it. Unless all the queues should be validated,
+        only the shape of the listing is checked, and the queues are validated when looked up."""
+
+        if settings.RABBIT_MQ_VALIDATE_ALL_QUEUES:
+            validator = cls.VALIDATORS['page' if paginated else 'list']
+        else:
+            validator = cls.VALIDATORS['shallow_page' if paginated else 'shallow_list']
+
+        cls._validate(url, data, validator)
 
     @classmethod
-    def queues(cls, interest_queues: List[str], stats: Dict) -> List[Queue]:
-        multiple_queues_config = cls._multiple_queue_configs(interest_queues)
-        single_queue_configs = cls._single_queue_configs(interest_queues)
+    def queues(cls, interest_queues: List[str], stats: List[Dict]) -> List[Queue]:
+        (single_queue_configs, multiple_queues_config) = cls._compile_interest_queues(
+            tuple(interest_queues)
+        )
+        stats_by_name = cls._index_stats(stats)
 
         queues = []
         for queue_name in single_queue_configs:
-            queue = cls._handle_single_queue_config(stats, queue_name)
+            queue = cls._handle_single_queue_config(stats_by_name, queue_name)
             if queue:
                 queues.append(queue)
 
         for queue_names in multiple_queues_config:
-            queue = cls._handle_multiple_queues_config(stats, queue_names)
+            queue = cls._handle_multiple_queues_config(stats_by_name, queue_names)
             if queue:
                 queues.append(queue)
 
         return queues
 
     @classmethod
-    def _handle_single_queue_config(cls, stats: Dict, queue_name: str):
-        queue_list = cls._filter_stats(stats, [queue_name])
+    def _handle_single_queue_config(
+        cls, stats_by_name: Dict[str, Dict], queue_name: str
+    ):
+        queue = cls._lookup(stats_by_name, queue_name)
 
-        if len(queue_list) != 1:
+        if queue is None:
             message = 'Could not find such a queue name'
             LOGGER.error(message, queue_name=queue_name)
             return
 
-        queue = queue_list[0]
         return Queue(
             queue_name=queue_name,
             consumers_count=queue.get('consumers') or 0,
             messages=queue.get('messages') or 0,
+            publish_rate=cls._rate(queue, 'publish'),
+            ack_rate=cls._rate(queue, 'ack'),
         )
 
     @classmethod
-    def _handle_multiple_queues_config(cls, stats: Dict, raw_queue_names: str):
-        queue_names = list(map(str.strip, raw_queue_names.split('+')))
-        queue_list = cls._filter_stats(stats, queue_names)
+    def _handle_multiple_queues_config(
+        cls, stats_by_name: Dict[str, Dict], queue_names: Tuple[str, ...]
+    ):
+        queue_list = [
+            queue
+            for queue in (
+                cls._lookup(stats_by_name, queue_name) for queue_name in queue_names
+            )
+            if queue is not None
+        ]
 
         if len(queue_list) != len(queue_names):
             message = 'Could not find all queues'
@@ -144,28 +317,98 @@ class RabbitMQ(Broker):
 
         return Queue(
             queue_name="+".join(queue_names),
-            consumers_count=queue_list[0].get('consumers') or 0,
+            consumers_count=expected_consumers_count,
             messages=sum((q.get('messages') or 0) for q in queue_list),
+            publish_rate=cls._total_rate(queue_list, 'publish'),
+            ack_rate=cls._total_rate(queue_list, 'ack'),
         )
 
     @staticmethod
-    def _single_queue_configs(interest_queues: List[str]) -> List[str]:
-        return [
-            interest_queue
-            for interest_queue in interest_queues
-            if "+" not in interest_queue
-        ]
+    def _rate(queue: Dict, operation: str) -> Optional[float]:
+        """The rate of the given operation (publish, ack) on the queue, if reported by the broker."""
+
+        message_stats = queue.get('message_stats')
+        if not isinstance(message_stats, dict):
+            return None
+
+        details = message_stats.get(f'{operation}_details')
+        if not isinstance(details, dict):
+            return None
+
+        rate = details.get('rate')
+        return rate if isinstance(rate, (int, float)) else None
+
+    @classmethod
+    def _total_rate(cls, queue_list: List[Dict], operation: str) -> Optional[float]:
+        rates = [cls._rate(queue, operation) for queue in queue_list]
+        if None in rates:
+            return None
+
+        return sum(rate for rate in rates if rate is not None)
 
     @staticmethod
-    def _multiple_queue_configs(interest_queues: List[str]) -> List[str]:
-        return [
+    @functools.lru_cache(maxsize=1024)
+    def _compile_interest_queues(
+        interest_queues: Tuple[str, ...]
+    ) -> Tuple[Tuple[str, ...], Tuple[Tuple[str, ...], ...]]:
+        """Splits the configured queue names into single queues and `+`-joined groups
+        of queues. Cached, so that a configuration is only parsed once."""
+
+        single_queue_configs = tuple(
             interest_queue
             for interest_queue in interest_queues
+            if "+" not in interest_queue
+        )
+        multiple_queues_config = tuple(
+            tuple(map(str.strip, interest_queue.split('+')))
+            for interest_queue in interest_queues
             if "+" in interest_queue
-        ]
+        )
 
-    @staticmethod
-    def _filter_stats(stats: Dict, queue_names: List[str]):
-        return list(
-            filter(lambda queue_stats: queue_stats['name'] in queue_names, stats)
+        return single_queue_configs, multiple_queues_config
+
+    @classmethod
+    def _queue_names(cls, interest_queues: List[str]) -> FrozenSet[str]:
+        """The names of all the queues the interest queues are made of."""
+
+        (single_queue_configs, multiple_queues_config) = cls._compile_interest_queues(
+            tuple(interest_queues)
         )
+
+        return frozenset(single_queue_configs).union(*multiple_queues_config)
+
+    @staticmethod
+    def _index_stats(stats: List[Dict]) -> Dict[str, Dict]:
+        stats_by_name = dict()
+
+        for queue_stats in stats:
+            name = queue_stats.get('name') if isinstance(queue_stats, dict) else None
+
+            if not isinstance(name, str):
+                message = 'Could not validate queue stats returned by RabbitMQ'
+                LOGGER.error(message, queue_stats=queue_stats)
+                raise BrokerError(message)
+
+            stats_by_name[name] = queue_stats
+
+        return stats_by_name
+
+    @classmethod
+    def _lookup(cls, stats_by_name: Dict[str, Dict], queue_name: str):
+        """Finds the stats of a queue by its name, validating them.
+
+        Raises:
+            BrokerError:
+                When the stats of the queue don't match the schema.
+        """
+
+        queue = stats_by_name.get(queue_name)
+
+        if queue is not None:
+            err = next(cls.VALIDATORS['queue'].iter_errors(queue), None)
+            if err is not None:
+                message = 'Could not validate queue stats returned by RabbitMQ'
+                LOGGER.error(message, queue_name=queue_name, err=err, data=queue)
+                raise BrokerError(message) from err
+
+        return queue
@@ -0,0 +1,131 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pika
+import structlog
+from pika.adapters.blocking_connection import BlockingChannel
+
+from rectifier import settings
+from .rabbitmq import RabbitMQ, BrokerError
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class RabbitMQAMQP(RabbitMQ):
+    """
+    A wrapper over RabbitMQ which gets the stats of the interest queues over AMQP,
+    by passively declaring each of them on a long-lived channel.
+
+    Unlike the management API, the cost of a poll depends only on the number of
+    interest queues, and the counts aren't delayed by the stats collection. The
+    messages counted are only the ready ones, without the unacknowledged ones
+    the management API counts as well.
+    """
+
+    _channels: Dict[str, Tuple[pika.BlockingConnection, BlockingChannel]] = dict()
+    _locks: Dict[str, threading.Lock] = dict()
+    _locks_lock = threading.Lock()
+
+    @classmethod
+    def stats(cls, uri: str, interest_queues: Optional[List[str]] = None):
+        """Gets the message and consumer count of each of the interest queues,
+        in the same representation as the management API."""
+
+        if interest_queues is None:
+            message = 'The interest queues are needed for retrieving stats over AMQP'
+            LOGGER.error(message)
+            raise BrokerError(message)
+
+        stats = []
+
+        with cls._lock(uri):
+            for queue_name in sorted(cls._queue_names(interest_queues)):
+                counts = cls._declare(uri, queue_name)
+                if counts is None:
+                    continue
+
+                (ready_messages, consumers) = counts
+                stats.append(
+                    dict(
+                        name=queue_name,
+                        messages=ready_messages,
+                        messages_ready=ready_messages,
+                        consumers=consumers,
+                    )
+                )
+
+        return stats
+
+    @classmethod
+    def close(cls) -> None:
+        """Closes all the connections."""
+
+        for uri in list(cls._channels.keys()):
+            with cls._lock(uri):
+                cls._disconnect(uri)
+
+    @classmethod
+    def _declare(cls, uri: str, queue_name: str) -> Optional[Tuple[int, int]]:
+        """Passively declares a queue, returning its ready message and consumer count,
+        or None if the queue doesn't exist."""
+
+        try:
+            channel = cls._channel(uri)
+            frame = channel.queue_declare(queue=queue_name, passive=True)
+        except pika.exceptions.ChannelClosedByBroker as err:
+            # The broker closes the channel, it's reopened on the next declare.
+            if err.reply_code == 404:
+                LOGGER.error('Could not find such a queue name', queue_name=queue_name)
+                return None
+
+            message = 'Could not declare queue on RabbitMQ'
+            LOGGER.error(message, queue_name=queue_name, err=err)
+            raise BrokerError(message) from err
+        except (pika.exceptions.AMQPError, OSError) as err:
+            cls._disconnect(uri)
+
+            message = 'Could not retrieve queue stats from RabbitMQ'
+            LOGGER.error(message, queue_name=queue_name, err=err)
+            raise BrokerError(message) from err
+
+        return frame.method.message_count, frame.method.consumer_count
+
+    @classmethod
+    def _channel(cls, uri: str) -> BlockingChannel:
+        """Gets the channel for the given broker, (re)connecting if needed."""
+
+        (connection, channel) = cls._channels.get(uri, (None, None))
+
+        if connection is not None and connection.is_open:
+            # Lets the connection answer the heartbeats received since the last poll.
+            connection.process_data_events(time_limit=0)
+        else:
+            LOGGER.info('Connecting to RabbitMQ over AMQP')
+            parameters = pika.URLParameters(uri)
+            parameters.socket_timeout = settings.CONNECT_TIMEOUT
+            parameters.stack_timeout = settings.CONNECT_TIMEOUT + settings.READ_TIMEOUT
+            parameters.blocked_connection_timeout = settings.READ_TIMEOUT
+            connection = pika.BlockingConnection(parameters)
+            channel = None
+
+        if channel is None or not channel.is_open:
+            channel = connection.channel()
+
+        cls._channels[uri] = (connection, channel)
+        return channel
+
+    @classmethod
+    def _disconnect(cls, uri: str) -> None:
+        (connection, _) = cls._channels.pop(uri, (None, None))
+        if connection is None or not connection.is_open:
+            return
+
+        try:
+            connection.close()
+        except (pika.exceptions.AMQPError, OSError):
+            pass
+
+    @classmethod
+    def _lock(cls, uri: str) -> threading.Lock:
+        with cls._locks_lock:
+            return cls._locks.setdefault(uri, threading.Lock())
@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+import structlog
+
+from rectifier import settings
+from rectifier.timeout_http_adapter import TimeoutHTTPAdapter
+
+LOGGER = structlog.get_logger(__name__)
+
+SessionKey = Tuple[str, str, str, str]
+
+
+class SessionPool:
+    """
+    Keeps one keep-alive HTTP session per host and credentials, so that
+    successive requests to the same broker reuse the TCP (and TLS) connection.
+
+    Sessions which haven't been used for a while are closed.
+    """
+
+    _sessions: Dict[SessionKey, Tuple[requests.Session, float]]
+
+    def __init__(self, idle_timeout: Optional[int] = None) -> None:
+        """
+        :param idle_timeout: After how many seconds of inactivity a session is closed.
+            Defaults to `settings.BROKER_SESSION_IDLE_TIMEOUT`.
+        """
+        self.idle_timeout = (
+            idle_timeout
+            if idle_timeout is not None
+            else settings.BROKER_SESSION_IDLE_TIMEOUT
+        )
+
+        self._sessions = dict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, protocol: str, host: str, user: str, password: str
+    ) -> requests.Session:
+        """Gets the session for the given host and credentials, creating it if needed."""
+
+        key = (protocol, host, user, password)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._sessions.get(key)
+            session = entry[0] if entry else self._session(user, password)
+            self._sessions[key] = (session, now)
+
+        return session
+
+    def close(self) -> None:
+        """Closes all the sessions."""
+
+        with self._lock:
+            for (session, _) in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self, now: float) -> None:
+        idle_keys = [
+            key
+            for (key, (_, last_used)) in self._sessions.items()
+            if now - last_used >= self.idle_timeout
+        ]
+
+        for key in idle_keys:
+            (session, _) = self._sessions.pop(key)
+            session.close()
+            LOGGER.debug('Closed idle broker session', host=key[1])
+
+    @staticmethod
+    def _session(user: str, password: str) -> requests.Session:
+        session = requests.Session()
+        session.auth = requests.auth.HTTPBasicAuth(user, password)
+        session.headers.update({'Accept-Encoding': 'gzip'})
+
+        adapter = TimeoutHTTPAdapter(pool_maxsize=max(settings.MAX_CONCURRENT_APPS, 1))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
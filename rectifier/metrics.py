@@ -0,0 +1,125 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+TICK_DURATION = Histogram(
+    'rectifier_tick_duration_seconds',
+    'How long a pass over the apps takes.',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 120, 300),
+)
+
+PHASE_DURATION = Histogram(
+    'rectifier_phase_duration_seconds',
+    'How long each phase of scaling an app takes.',
+    ['phase'],
+)
+
+API_CALLS = Counter(
+    'rectifier_api_calls_total',
+    'Calls made to the infrastructure provider and the brokers.',
+    ['app', 'api'],
+)
+
+API_ERRORS = Counter(
+    'rectifier_api_errors_total',
+    'Calls to the infrastructure provider and the brokers which failed.',
+    ['app', 'api'],
+)
+
+CURRENT_WORKERS = Gauge(
+    'rectifier_current_workers',
+    'The number of workers running for a formation.',
+    ['app', 'formation'],
+)
+
+TARGET_WORKERS = Gauge(
+    'rectifier_target_workers',
+    'The number of workers a formation should have, according to the configuration.',
+    ['app', 'formation'],
+)
+
+MISSED_DEADLINES = Counter(
+    'rectifier_missed_tick_deadlines_total',
+    'Passes over the apps which did not complete before the tick deadline.',
+)
+
+DEFERRED_APPS = Counter(
+    'rectifier_deferred_apps_total',
+    'Apps deferred to the next pass, since the tick deadline was missed.',
+)
+
+IS_LEADER = Gauge(
+    'rectifier_is_leader',
+    'Whether this process scales the apps: 1 for the leader, and for every process without a leader election.',
+)
+
+LAST_SUCCESSFUL_TICK = Gauge(
+    'rectifier_last_successful_tick_timestamp_seconds',
+    'When the last pass over the apps completed.',
+)
+
+LAST_SUCCESSFUL_TICK_AGE = Gauge(
+    'rectifier_last_successful_tick_age_seconds',
+    'How long ago the last pass over the apps completed, NaN if this process has not completed one.',
+)
+
+_last_successful_tick: Optional[float] = None
+
+
+def _last_successful_tick_age() -> float:
+    if _last_successful_tick is None:
+        return float('nan')
+
+    return time.time() - _last_successful_tick
+
+
+LAST_SUCCESSFUL_TICK_AGE.set_function(_last_successful_tick_age)
+
+
+def tick_completed() -> None:
+    """Records that a pass over the apps completed."""
+    global _last_successful_tick
+
+    _last_successful_tick = time.time()
+    LAST_SUCCESSFUL_TICK.set(_last_successful_tick)
+
+
+def forget_workers(kept: Optional[Set[Tuple[str, str]]] = None) -> None:
+    """
+    Removes the workers reported for the formations which aren't scaled by this process anymore.
+
+    :param kept: The app and the formation of the workers which are still reported. None of them, by default.
+    """
+    for gauge in (CURRENT_WORKERS, TARGET_WORKERS):
+        for metric in gauge.collect():
+            for sample in metric.samples:
+                labels = (sample.labels['app'], sample.labels['formation'])
+                if kept is None or labels not in kept:
+                    gauge.remove(*labels)
+
+
+@contextmanager
+def api_call(
+    app: str, api: str, phase: Optional[str] = None, counted: bool = True
+) -> Iterator[None]:
+    """
+    Counts a call made for an app, and whether it failed.
+
+    :param phase: The phase whose duration the call is timed in, if any.
+    :param counted: Whether the call is counted, e.g. not when it's answered from a cache. It's timed regardless.
+    """
+    if counted:
+        API_CALLS.labels(app, api).inc()
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if counted:
+            API_ERRORS.labels(app, api).inc()
+        raise
+    finally:
+        if phase:
+            PHASE_DURATION.labels(phase).observe(time.perf_counter() - started_at)
@@ -0,0 +1,122 @@
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+
+import structlog
+
+from rectifier import settings
+from rectifier.config import AppConfig, AppMode
+from rectifier.queue import Queue
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class PollScheduler:
+    """
+    Decides when each app should be polled next, instead of polling every app on every pass.
+
+    Apps whose queues are in their cooldown are polled less often, unless the number of messages
+    in their queues has recently been changing. The first polls are spread evenly over one
+    interval, so that the apps aren't all polled at the same time.
+    """
+
+    _due: List[Tuple[float, str]]
+    _apps: Set[str]
+    _volatility: Dict[str, float]
+    _messages: Dict[str, int]
+
+    def __init__(self, apps: Dict[str, AppConfig], now: float) -> None:
+        """
+        :param apps: The configuration of the apps to be polled.
+        :param now: The current (monotonic) time.
+        """
+        self.base_interval = settings.TIME_BETWEEN_REQUESTS
+        self.max_interval = max(settings.MAX_POLL_INTERVAL, self.base_interval)
+        self.volatility_threshold = settings.POLL_VOLATILITY_THRESHOLD
+
+        self._apps = set()
+        self._volatility = dict()
+        self._messages = dict()
+        self._due = []
+
+        self.update(apps, now)
+
+    def update(self, apps: Dict[str, AppConfig], now: float) -> None:
+        """Updates the configuration of the apps. The apps which were already
+        scheduled keep their schedule, the new ones are spread over one interval."""
+
+        polled_apps = [
+            app
+            for (app, app_config) in apps.items()
+            if app_config.mode != AppMode.NOOP and app_config.queues
+        ]
+
+        new_apps = [app for app in polled_apps if app not in self._apps]
+        stagger = self.base_interval / max(len(new_apps), 1)
+
+        self._apps = set(polled_apps)
+        self._due = [(due, app) for (due, app) in self._due if app in self._apps]
+        self._due.extend(
+            (now + index * stagger, app) for (index, app) in enumerate(new_apps)
+        )
+        heapq.heapify(self._due)
+
+    def due(self, now: float) -> List[str]:
+        """Removes and returns the apps which are due to be polled.
+        They should be given back through :see:record once polled."""
+
+        apps = []
+        while self._due and self._due[0][0] <= now:
+            apps.append(heapq.heappop(self._due)[1])
+
+        return apps
+
+    def record(
+        self,
+        app: str,
+        queues: Optional[List[Queue]],
+        now: float,
+        cooldown_left: float = 0,
+    ) -> None:
+        """Records the outcome of polling an app, and schedules its next poll.
+
+        :param queues: The queues seen while polling, or None if the poll failed.
+        :param cooldown_left: In how many seconds the first queue of the app can be scaled again,
+            or 0 if one can be scaled already.
+        """
+        if app not in self._apps:
+            return
+
+        interval = self._interval(app, queues, cooldown_left)
+        heapq.heappush(self._due, (now + interval, app))
+
+        LOGGER.debug('Scheduled next poll', app=app, interval=interval)
+
+    def next_due(self) -> Optional[float]:
+        """The time at which the next app is due to be polled, if any."""
+
+        return self._due[0][0] if self._due else None
+
+    def _interval(
+        self, app: str, queues: Optional[List[Queue]], cooldown_left: float
+    ) -> float:
+        if queues is None:
+            return self.base_interval
+
+        messages = sum(queue.messages for queue in queues)
+        previous_messages = self._messages.get(app)
+        self._messages[app] = messages
+
+        if previous_messages is None:
+            return self.base_interval
+
+        change = abs(messages - previous_messages) / max(previous_messages, 1)
+        volatility = (self._volatility.get(app, 0) + change) / 2
+        self._volatility[app] = volatility
+
+        # No queue of the app can be scaled before its cooldown has elapsed, so it's polled again by then,
+        # or sooner if its queues are changing. Out of its cooldown, it's polled at the base interval.
+        interval = min(
+            cooldown_left,
+            self.max_interval / (1 + volatility / self.volatility_threshold),
+        )
+        return max(interval, self.base_interval)
@@ -0,0 +1,259 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import structlog
+
+from rectifier.leader_election import LeaderElection
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class ProfilingSession:
+    """
+    Samples the stacks of the scaling threads and traces the memory allocations, for a number of ticks.
+    """
+
+    def __init__(
+        self, ticks: int, interval: float, thread_prefix: str, top_allocations: int
+    ) -> None:
+        self.ticks = ticks
+        self.remaining_ticks = ticks
+        self.interval = interval
+        self.thread_prefix = thread_prefix
+        self.top_allocations = top_allocations
+
+        self.stacks: Counter = Counter()
+        self.started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def begin(self) -> None:
+        self.started_at = time.monotonic()
+        tracemalloc.start()
+
+        self._sampler = threading.Thread(
+            target=self._sample, name='profiler', daemon=True
+        )
+        self._sampler.start()
+
+    def end(self) -> Dict:
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        assert self.started_at is not None
+        return dict(
+            ticks=self.ticks,
+            interval=self.interval,
+            duration=time.monotonic() - self.started_at,
+            samples=sum(self.stacks.values()),
+            collapsed_stacks=[
+                f'{stack} {count}' for (stack, count) in self.stacks.most_common()
+            ],
+            allocations=self._allocations(snapshot),
+        )
+
+    def cancel(self) -> None:
+        """Stops sampling and tracing, without a result."""
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+
+        if self.started_at is not None:
+            tracemalloc.stop()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+
+            for thread in threading.enumerate():
+                if not thread.name.startswith(self.thread_prefix):
+                    continue
+
+                frame = frames.get(thread.ident)  # type: ignore
+                if frame is not None:
+                    self.stacks[self._collapse(thread.name, frame)] += 1
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        """Formats a stack the way flamegraph tools expect it: outermost frame first, separated by semicolons."""
+        stack: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            )
+            frame = frame.f_back
+
+        # The threads of the pool share a stack, regardless of their number.
+        return ';'.join([thread_name.rstrip('_0123456789'), *reversed(stack)])
+
+    def _allocations(self, snapshot: tracemalloc.Snapshot) -> List[Dict]:
+        snapshot = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+
+        return [
+            dict(
+                site=str(statistic.traceback),
+                size_kb=round(statistic.size / 1024, 1),
+                count=statistic.count,
+            )
+            for statistic in snapshot.statistics('lineno')[: self.top_allocations]
+        ]
+
+
+class TickProfiler:
+    """
+    Profiles the scaling loop on demand.
+
+    While no profiling is requested, a tick costs a single attribute check: neither the sampler
+    nor tracemalloc is running.
+    """
+
+    # The most ticks a single profiling can last, and the bounds of the sampling interval.
+    MAX_TICKS = 100
+    MIN_INTERVAL = 0.001
+    MAX_INTERVAL = 1.0
+
+    _session: Optional[ProfilingSession]
+    _result: Optional[Dict]
+
+    def __init__(
+        self,
+        thread_prefix: str = 'rectifier',
+        top_allocations: int = 25,
+        timeout: float = 600,
+    ):
+        """
+        :param thread_prefix: The prefix of the names of the threads which are sampled.
+        :param top_allocations: How many of the allocation sites allocating the most are reported.
+        :param timeout: After how many seconds a profiling which hasn't completed is cancelled,
+            e.g. because the loop isn't ticking.
+        """
+        self.thread_prefix = thread_prefix
+        self.top_allocations = top_allocations
+        self.timeout = timeout
+
+        self._session = None
+        self._result = None
+        self._requested_at = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, ticks: int, interval: float = 0.005) -> Optional[ProfilingSession]:
+        """
+        Requests the profiling of the next ticks.
+
+        :param ticks: How many ticks to profile, at most `MAX_TICKS`.
+        :param interval: How many seconds to wait between samples, between `MIN_INTERVAL` and `MAX_INTERVAL`.
+        :return: The requested profiling, or None if a profiling is already running.
+
+        Raises:
+            ValueError:
+                When there are no ticks to profile, or the interval isn't positive.
+        """
+        if ticks < 1:
+            raise ValueError('At least one tick should be profiled.')
+
+        if not interval > 0:
+            raise ValueError('The sampling interval should be positive.')
+
+        ticks = min(ticks, self.MAX_TICKS)
+        interval = min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL)
+
+        with self._lock:
+            self._expire()
+            if self._session is not None:
+                return None
+
+            LOGGER.info('Profiling requested.', ticks=ticks, interval=interval)
+            self._result = None
+            self._requested_at = time.monotonic()
+            self._session = ProfilingSession(
+                ticks, interval, self.thread_prefix, self.top_allocations
+            )
+            return self._session
+
+    def cancel(self) -> bool:
+        """
+        Cancels the running profiling, if any.
+
+        :return: Whether a profiling was running.
+        """
+        with self._lock:
+            if self._session is None:
+                return False
+
+            self._session.cancel()
+            self._session = None
+            LOGGER.info('Profiling cancelled.')
+            return True
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            self._expire()
+            return self._session is not None
+
+    def result(self) -> Optional[Dict]:
+        """The result of the last profiling which completed."""
+        return self._result
+
+    @contextmanager
+    def tick(self, leader_election: Optional[LeaderElection] = None) -> Iterator[None]:
+        """
+        Wraps a tick of the scaling loop.
+
+        :param leader_election: When given, the tick only counts towards the profiling if this process
+            is the leader by its end: the ticks of the other processes don't scale anything.
+        """
+        session = self._session
+        if session is None:
+            yield
+            return
+
+        with self._lock:
+            if self._session is not session:
+                session = None
+            elif session.started_at is None:
+                session.begin()
+
+        try:
+            yield
+        finally:
+            if session is not None and (
+                leader_election is None or leader_election.is_leader()
+            ):
+                self._end_tick(session)
+
+    def _end_tick(self, session: ProfilingSession) -> None:
+        with self._lock:
+            if self._session is not session:
+                return
+
+            session.remaining_ticks -= 1
+            if session.remaining_ticks <= 0:
+                self._result = session.end()
+                self._session = None
+                LOGGER.info('Profiling completed.', samples=self._result['samples'])
+            else:
+                self._expire()
+
+    def _expire(self) -> None:
+        """Cancels the running profiling if it has been running for longer than the timeout."""
+        if (
+            self._session is not None
+            and time.monotonic() - self._requested_at > self.timeout
+        ):
+            LOGGER.warning('Profiling timed out.', timeout=self.timeout)
+            self._session.cancel()
+            self._session = None
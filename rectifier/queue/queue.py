@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -6,3 +7,5 @@ class Queue:
     queue_name: str
     consumers_count: int
     messages: int
+    publish_rate: Optional[float] = None
+    ack_rate: Optional[float] = None
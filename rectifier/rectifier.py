@@ -1,46 +1,79 @@
-from typing import Optional
+import time
+from contextlib import nullcontext
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import ContextManager, Dict, Iterable, List, Optional, Tuple
 
 import structlog
 
-from rectifier import settings
-from rectifier.config import ConfigParser, AppMode
-from rectifier.consumer_updates_coordinator import ConsumerUpdatesCoordinator
+from rectifier import metrics, settings
+from rectifier.circuit_breaker import CircuitBreaker, CircuitBreakers
+from rectifier.config import ConfigParser, AppMode, AppConfig, BrokerType
+from rectifier.consumer_updates_coordinator import (
+    ConsumerUpdatesCoordinator,
+    DepthForecaster,
+)
 from rectifier.infrastructure_provider import (
     InfrastructureProvider,
     InfrastructureProviderError,
+    RequestDeferredError,
 )
+from rectifier.leader_election import LeaderElection
 from rectifier.message_brokers import Broker
 from rectifier.message_brokers.rabbitmq import BrokerError
+from rectifier.poll_scheduler import PollScheduler
+from rectifier.queue import Queue
+from rectifier.sharding import ShardMembership
 from rectifier.storage import Storage
 
 LOGGER = structlog.get_logger(__name__)
 
 
-class Rectifier:
+class BaseRectifier:
     """
-    The main _controller_ of the autoscaler.
+    The parts of the controller which don't depend on how the brokers and the infrastructure provider are called.
 
-    Keeps track over the configuration, updates everything accordingly.
-    Checks the queue stats, asks for coordination on whether the consumers should be scaled or not,
-    and scales them if needed.
+    Keeps track over the configuration, the leadership and the shard of this process, decides which apps
+    are due, and asks for coordination on whether their consumers should be scaled or not.
     """
 
-    broker: Broker
     consumer_updates_coordinator: Optional[ConsumerUpdatesCoordinator]
-    infrastructure_provider: InfrastructureProvider
+    leader_election: Optional[LeaderElection]
+    poll_scheduler: Optional[PollScheduler]
+    shard: Optional[ShardMembership]
 
     def __init__(
         self,
         storage: Storage,
-        broker: Broker,
-        infrastructure_provider: InfrastructureProvider,
+        max_concurrent_apps: Optional[int] = None,
+        leader_election: Optional[LeaderElection] = None,
+        shard: Optional[ShardMembership] = None,
+        circuit_breakers: Optional[CircuitBreakers] = None,
     ) -> None:
+        """
+        :param max_concurrent_apps: How many apps are scaled in parallel. Defaults to
+            `settings.MAX_CONCURRENT_APPS`; a value of 1 scales the apps one after another.
+        :param leader_election: When given, the consumers are only scaled while this process is the leader.
+        :param shard: When given, only the consumers of the apps in the shard of this process are scaled.
+        :param circuit_breakers: The breakers of the apps and the broker hosts which keep failing.
+        """
         self.storage = storage
-        self.broker = broker
-        self.infrastructure_provider = infrastructure_provider
+        self.leader_election = leader_election
+        metrics.IS_LEADER.set(0 if leader_election else 1)
+        self.shard = shard
+        self.circuit_breakers = circuit_breakers or CircuitBreakers()
+        self.max_concurrent_apps = (
+            max_concurrent_apps
+            if max_concurrent_apps is not None
+            else settings.MAX_CONCURRENT_APPS
+        )
 
         self.subscription = self.storage.subscribe(settings.REDIS_CONFIG_KEY)
 
+        self.poll_scheduler = None
+        self.depth_forecaster = DepthForecaster()
+        self.deferred_apps: List[str] = []
+        self._deadline: Optional[float] = None
         self.update_configuration()
 
     def update_configuration(self) -> None:
@@ -51,72 +84,501 @@ class Rectifier:
 
         if not config_reader.config:
             self.consumer_updates_coordinator = None
+            self.poll_scheduler = None
+            metrics.forget_workers()
             return
 
+        # The formations which were removed, or moved to another shard, aren't reported anymore.
+        metrics.forget_workers(
+            {
+                (app, queue_config.consumers_formation_name)
+                for (
+                    app,
+                    app_config,
+                ) in config_reader.config.coordinator_config.apps.items()
+                if not self.shard or self.shard.owns(app)
+                for queue_config in app_config.queues.values()
+            }
+        )
+
         self.consumer_updates_coordinator = ConsumerUpdatesCoordinator(
-            config=config_reader.config.coordinator_config, storage=self.storage
+            config=config_reader.config.coordinator_config,
+            storage=self.storage,
+            depth_forecaster=self.depth_forecaster,
         )
 
-    def run(self):
+        apps = config_reader.config.coordinator_config.apps
+        if not settings.ADAPTIVE_POLLING:
+            self.poll_scheduler = None
+        elif self.poll_scheduler:
+            self.poll_scheduler.update(apps, now=time.monotonic())
+        else:
+            self.poll_scheduler = PollScheduler(apps, now=time.monotonic())
+
+    def _begin_tick(self) -> Optional[List[str]]:
         """
-        Checks if the configuration has changed, and scales the consumers if needed.
+        Checks if the configuration, the leadership or the shard have changed.
+
+        :return: The apps to be scaled during this tick, or None if there's nothing to do.
         """
-        message = self.subscription.get_message()
-        if message:
+        reload_configuration = bool(self.subscription.get_message())
+
+        if self.leader_election:
+            term = self.leader_election.token
+            leading = self.leader_election.acquire()
+            metrics.IS_LEADER.set(leading)
+            if not leading:
+                if term is not None:
+                    # The new leader reports the workers from now on.
+                    metrics.forget_workers()
+                return None
+
+            # The previous leader might have scaled in the meantime,
+            # so the update times are reloaded on every new term.
+            reload_configuration |= self.leader_election.token != term
+
+        if self.shard:
+            self.shard.heartbeat()
+
+            # The apps which moved to this shard were scaled by other workers,
+            # so their update times are reloaded.
+            reload_configuration |= self.shard.refresh()
+
+        if reload_configuration:
             LOGGER.info('Updating configuration.')
             self.update_configuration()
 
-        self.scale()
+        if not self.consumer_updates_coordinator:
+            return None
+
+        apps_config = self.consumer_updates_coordinator.config.apps
+        if not self.poll_scheduler:
+            apps = list(apps_config)
+        else:
+            apps = self.poll_scheduler.due(time.monotonic())
+
+        # The apps deferred by the last tick go first, they have waited the longest.
+        deferred_apps = [app for app in self.deferred_apps if app in apps_config]
+        self.deferred_apps = []
 
-    def scale(self):
+        return deferred_apps + [app for app in apps if app not in deferred_apps] or None
+
+    def _end_tick(self, apps: List[str], observed_queues: Dict[str, List[Queue]]):
         """
-        Scales the consumers, if needed.
+        Records what was seen for the apps scaled during this tick.
+
+        The deferred apps aren't recorded, they are scheduled again as soon as they are scaled.
         """
-        if not self.consumer_updates_coordinator:
+        if not self.poll_scheduler or not self.consumer_updates_coordinator:
             return
 
-        for (app, app_config) in self.consumer_updates_coordinator.config.apps.items():
-            if app_config.mode == AppMode.NOOP:
-                continue
+        now = time.monotonic()
+        for app in apps:
+            if app not in self.deferred_apps:
+                self.poll_scheduler.record(
+                    app,
+                    observed_queues.get(app),
+                    now,
+                    cooldown_left=self.consumer_updates_coordinator.cooldown_left(app),
+                )
 
-            queues_config = app_config.queues
+    def next_poll_delay(self) -> float:
+        """
+        How many seconds to wait before running again.
+        """
+        if self.leader_election and not self.leader_election.is_leader():
+            return self.leader_election.renew_interval
 
-            try:
-                broker_uri = self.infrastructure_provider.broker_uri(app)
-            except InfrastructureProviderError:
-                return
+        if not self.poll_scheduler:
+            return settings.TIME_BETWEEN_REQUESTS
 
-            if not broker_uri:
-                LOGGER.warning('Cannot find broker URI on app', app=app)
-                continue
+        next_due = self.poll_scheduler.next_due()
+        if next_due is None:
+            return settings.TIME_BETWEEN_REQUESTS
 
-            try:
-                stats = self.broker.stats(broker_uri)
-                queues = self.broker.queues(queues_config.keys(), stats)
-            except BrokerError as err:
-                LOGGER.warning(
-                    'Skipping broker', app=app, broker_uri=broker_uri, err=err
-                )
-                continue
+        return min(max(next_due - time.monotonic(), 0), settings.TIME_BETWEEN_REQUESTS)
 
-            updates = dict()
-            for queue in queues:
+    def _select_apps(
+        self, apps_to_scale: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, AppConfig]]:
+        """
+        The apps which should be scaled by this process, among the given ones (all of them, by default).
+        """
+        assert self.consumer_updates_coordinator
+
+        apps_config = self.consumer_updates_coordinator.config.apps
+        return [
+            (app, apps_config[app])
+            for app in (apps_to_scale if apps_to_scale is not None else apps_config)
+            if apps_config[app].mode != AppMode.NOOP
+            and (not self.shard or self.shard.owns(app))
+        ]
+
+    def _start_deadline(self) -> None:
+        """
+        Starts the time budget of a tick, `settings.TICK_DEADLINE` seconds.
+        """
+        self._deadline = (
+            time.monotonic() + settings.TICK_DEADLINE
+            if settings.TICK_DEADLINE > 0
+            else None
+        )
+
+    def _time_left(self) -> Optional[float]:
+        """
+        How many seconds are left until the deadline of the tick, or None if there's no deadline.
+        """
+        if self._deadline is None:
+            return None
+
+        return max(self._deadline - time.monotonic(), 0)
+
+    def _defer(self, apps: List[str]) -> None:
+        """
+        Defers the apps which couldn't be scaled before the deadline to the next tick, in the same order.
+        """
+        if not apps:
+            return
+
+        LOGGER.warning(
+            'Tick deadline missed, deferring apps to the next tick.',
+            deadline=settings.TICK_DEADLINE,
+            apps=apps,
+        )
+        metrics.MISSED_DEADLINES.inc()
+        metrics.DEFERRED_APPS.inc(len(apps))
+        self.deferred_apps = apps
+
+    def _renewing_lease(self) -> ContextManager:
+        """
+        Keeps the lease of the leader renewed while a tick runs, if there's one.
+        """
+        if not self.leader_election:
+            return nullcontext()
+
+        return self.leader_election.renewing()
+
+    def _flush(self) -> None:
+        """
+        Writes the update times of the whole tick in a single round trip.
+
+        They are written even if the leadership was lost in the meantime: the update times of the apps which
+        weren't scaled because of it were already dropped, the remaining ones are of scales which happened.
+        """
+        if self.consumer_updates_coordinator:
+            self.consumer_updates_coordinator.flush()
+
+    def _decide(
+        self,
+        app: str,
+        app_config: AppConfig,
+        queues: List[Queue],
+        formation: Optional[Dict[str, int]],
+    ) -> Dict[str, int]:
+        """
+        Computes how the consumers of an app should be scaled.
+
+        :param formation: The quantity of each process type of the app, if it's reconciled with.
+        :return: The number of consumers of each formation which should be changed.
+        """
+        assert self.consumer_updates_coordinator
+
+        decide_started_at = time.perf_counter()
+
+        decisions = self.consumer_updates_coordinator.compute_consumers_counts(
+            [
                 (
-                    new_consumer_count,
-                    consumer_formation,
-                ) = self.consumer_updates_coordinator.compute_consumers_count(
-                    app, app_config.mode, queue
+                    app,
+                    app_config.mode,
+                    queue,
+                    formation.get(
+                        app_config.queues[queue.queue_name].consumers_formation_name
+                    )
+                    if formation is not None
+                    else None,
                 )
+                for queue in queues
+            ]
+        )
+        updates = {
+            consumer_formation: new_consumer_count
+            for (new_consumer_count, consumer_formation) in decisions
+            if new_consumer_count is not None and consumer_formation is not None
+        }
+
+        metrics.PHASE_DURATION.labels('decide').observe(
+            time.perf_counter() - decide_started_at
+        )
+
+        if updates and not self._holds_fence():
+            LOGGER.warning('Not scaling, another process took over', app=app)
+            self.consumer_updates_coordinator.discard(app)
+            return dict()
+
+        return updates
+
+    def _app_breaker(self, app: str) -> Optional[CircuitBreaker]:
+        """
+        The breaker of an app, or None if the app is skipped until its backoff elapses.
+        """
+        breaker = self.circuit_breakers.app(app)
+        if not breaker.allow():
+            LOGGER.debug('Skipping app, its circuit is open', app=app)
+            return None
+
+        return breaker
+
+    def _broker_breaker(self, app: str, broker_uri: str) -> Optional[CircuitBreaker]:
+        """
+        The breaker of the host of a broker, or None if it's skipped until its backoff elapses.
+        """
+        breaker = self.circuit_breakers.broker(urlparse(broker_uri).hostname)
+        if not breaker.allow():
+            LOGGER.debug('Skipping broker, its circuit is open', app=app)
+            return None
+
+        return breaker
+
+    def _reconciles_with_formation(self, app: str) -> bool:
+        """
+        Whether the formation of an app should be requested: only when the consumers counts are reconciled
+        with it, and one of the queues of the app is out of its cooldown, so there's a decision it matters for.
+        """
+        return bool(
+            settings.RECONCILE_WITH_FORMATION
+            and self.consumer_updates_coordinator
+            and self.consumer_updates_coordinator.cooldown_left(app) == 0
+        )
+
+    def _holds_fence(self) -> bool:
+        """
+        Whether this process can still act on the infrastructure, as the latest leader.
+        """
+        return not self.leader_election or self.leader_election.holds_fence()
+
+
+class Rectifier(BaseRectifier):
+    """
+    The main _controller_ of the autoscaler.
+
+    Keeps track over the configuration, updates everything accordingly.
+    Checks the queue stats, asks for coordination on whether the consumers should be scaled or not,
+    and scales them if needed.
+    """
+
+    broker: Broker
+    brokers: Dict[BrokerType, Broker]
+    infrastructure_provider: InfrastructureProvider
+
+    def __init__(
+        self,
+        storage: Storage,
+        broker: Broker,
+        infrastructure_provider: InfrastructureProvider,
+        max_concurrent_apps: Optional[int] = None,
+        brokers: Optional[Dict[BrokerType, Broker]] = None,
+        leader_election: Optional[LeaderElection] = None,
+        shard: Optional[ShardMembership] = None,
+        circuit_breakers: Optional[CircuitBreakers] = None,
+    ) -> None:
+        """
+        :param broker: The broker used for the apps which don't use another broker type.
+        :param brokers: The brokers used for the other broker types an app can be configured with.
+        """
+        self.broker = broker
+        self.brokers = {BrokerType.HTTP: broker, **(brokers or dict())}
+        self.infrastructure_provider = infrastructure_provider
+
+        super().__init__(
+            storage,
+            max_concurrent_apps=max_concurrent_apps,
+            leader_election=leader_election,
+            shard=shard,
+            circuit_breakers=circuit_breakers,
+        )
+
+    def run(self):
+        """
+        Checks if the configuration has changed, and scales the consumers if needed.
+        """
+        apps = self._begin_tick()
+        if apps is None:
+            return
+
+        self._end_tick(apps, self.scale(apps))
+
+    def scale(
+        self, apps_to_scale: Optional[Iterable[str]] = None
+    ) -> Dict[str, List[Queue]]:
+        """
+        Scales the consumers, if needed.
+
+        :param apps_to_scale: The apps to be scaled. All of them, by default.
+        :return: The queues seen for each of the apps whose broker could be inspected.
+        """
+        if not self.consumer_updates_coordinator:
+            return dict()
+
+        apps = self._select_apps(apps_to_scale)
+        self._start_deadline()
+
+        try:
+            with metrics.TICK_DURATION.time(), self._renewing_lease():
+                observed_queues = self._scale_apps(apps)
 
-                if new_consumer_count is None:
+            metrics.tick_completed()
+            return observed_queues
+        finally:
+            self._flush()
+
+    def _scale_apps(self, apps: List[Tuple[str, AppConfig]]) -> Dict[str, List[Queue]]:
+        observed_queues: Dict[str, List[Queue]] = dict()
+
+        if self.max_concurrent_apps <= 1:
+            for (index, (app, app_config)) in enumerate(apps):
+                if self._time_left() == 0:
+                    self._defer([app for (app, _) in apps[index:]])
+                    break
+
+                try:
+                    queues = self._scale_app(app, app_config)
+                except InfrastructureProviderError:
+                    LOGGER.warning('Skipping app', app=app)
                     continue
 
-                updates[consumer_formation] = new_consumer_count
+                if queues is not None:
+                    observed_queues[app] = queues
+
+            return observed_queues
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_apps, thread_name_prefix='rectifier'
+        )
+        futures = [
+            (app, executor.submit(self._scale_app, app, app_config))
+            for (app, app_config) in apps
+        ]
+
+        # The apps are submitted in order, so the ones left out by the deadline are the last ones.
+        wait([future for (_, future) in futures], timeout=self._time_left())
+
+        # The apps which haven't started are deferred. The ones being scaled are waited for, their calls
+        # can't be interrupted: they would otherwise scale after their update times are flushed, and be
+        # scaled again by the next tick.
+        executor.shutdown(wait=True, cancel_futures=True)
+        self._defer([app for (app, future) in futures if future.cancelled()])
 
-            if not updates:
+        for (app, future) in futures:
+            if future.cancelled():
                 continue
 
             try:
-                self.infrastructure_provider.scale(app, updates)
+                queues = future.result()
             except InfrastructureProviderError:
-                pass
+                LOGGER.warning('Skipping app', app=app)
+                continue
+
+            if queues is not None:
+                observed_queues[app] = queues
+
+        return observed_queues
+
+    def _scale_app(self, app: str, app_config: AppConfig) -> Optional[List[Queue]]:
+        """
+        Scales the consumers of a single app, if needed.
+
+        :return: The queues seen on the broker of the app, or None if it couldn't be inspected.
+
+        Raises:
+            InfrastructureProviderError:
+                When the broker URI of the app cannot be retrieved.
+        """
+        app_breaker = self._app_breaker(app)
+        if not app_breaker:
+            return None
+
+        # Only a call which reached the infrastructure provider closes the breaker, and is counted.
+        provider_called = not self.infrastructure_provider.is_broker_uri_cached(app)
+
+        try:
+            with metrics.api_call(
+                app, 'broker_uri', phase='broker_uri', counted=provider_called
+            ):
+                broker_uri = self.infrastructure_provider.broker_uri(app)
+        except InfrastructureProviderError as err:
+            # A deferred call says nothing about the app.
+            if not isinstance(err, RequestDeferredError):
+                app_breaker.record_failure()
+            raise
+
+        queues = self._queues(app, app_config, broker_uri)
+        if queues is None:
+            if provider_called:
+                app_breaker.record_success()
+            return None
+
+        updates = self._decide(app, app_config, queues, self._formation(app))
+        if updates:
+            try:
+                with metrics.api_call(app, 'scale', phase='scale'):
+                    self.infrastructure_provider.scale(app, updates)
+            except InfrastructureProviderError:
+                app_breaker.record_failure()
+                return queues
+
+            provider_called = True
+
+        if provider_called:
+            app_breaker.record_success()
+        return queues
+
+    def _queues(
+        self, app: str, app_config: AppConfig, broker_uri: Optional[str]
+    ) -> Optional[List[Queue]]:
+        """
+        The queues seen on the broker of an app, or None if it couldn't be inspected.
+        """
+        if not broker_uri:
+            LOGGER.warning('Cannot find broker URI on app', app=app)
+            return None
+
+        broker = self.brokers.get(app_config.broker)
+        if not broker:
+            LOGGER.warning(
+                'No broker available for app', app=app, broker=app_config.broker.value
+            )
+            return None
+
+        broker_breaker = self._broker_breaker(app, broker_uri)
+        if not broker_breaker:
+            return None
+
+        try:
+            with metrics.api_call(app, 'stats', phase='stats'):
+                interest_queues = list(app_config.queues.keys())
+                stats = broker.stats(broker_uri, interest_queues)
+                queues = broker.queues(interest_queues, stats)
+        except BrokerError as err:
+            LOGGER.warning('Skipping broker', app=app, broker_uri=broker_uri, err=err)
+            broker_breaker.record_failure()
+            self.infrastructure_provider.invalidate_broker_uri(app)
+            return None
+
+        broker_breaker.record_success()
+        return queues
+
+    def _formation(self, app: str) -> Optional[Dict[str, int]]:
+        """
+        The quantity of each process type of an app, which the consumers counts are reconciled with.
+
+        :return: None if the consumers counts reported by the broker should be used instead.
+        """
+        if not self._reconciles_with_formation(app):
+            return None
+
+        try:
+            with metrics.api_call(app, 'formation'):
+                return self.infrastructure_provider.formation(app)
+        except InfrastructureProviderError:
+            LOGGER.warning('Using the consumers counts of the broker', app=app)
+            return None
@@ -7,21 +7,56 @@ env = Env()
 
 REDIS_CHANNEL = 'config'
 REDIS_CONFIG_KEY = 'config'
-REDIS_UPDATE_TIMES = 'update_times'
+REDIS_UPDATE_TIMES = 'queue_update_times'
+REDIS_LEGACY_UPDATE_TIMES = 'update_times'
+REDIS_LEADER_KEY = 'leader'
+REDIS_WORKERS_KEY = 'workers'
 
 BROKER_URL_KEY = 'CLOUDAMQP_URL'
+BROKER_URI_CACHE_TTL = env.int('BROKER_URI_CACHE_TTL', 300)
 
 REDIS_URL = env('REDIS_URL', 'redis://127.0.0.1:6379/0')
 
 RABBIT_MQ_SECURE = env.bool('RABBIT_MQ_SECURE', False)
+RABBIT_MQ_PAGE_SIZE = env.int('RABBIT_MQ_PAGE_SIZE', 0)
+RABBIT_MQ_DISABLE_STATS = env.bool('RABBIT_MQ_DISABLE_STATS', False)
+RABBIT_MQ_VALIDATE_ALL_QUEUES = env.bool('RABBIT_MQ_VALIDATE_ALL_QUEUES', False)
+RABBIT_MQ_STREAMING = env.bool('RABBIT_MQ_STREAMING', False)
+BROKER_SESSION_IDLE_TIMEOUT = env.int('BROKER_SESSION_IDLE_TIMEOUT', 300)
 
 SECRET_KEY = env('SECRET_KEY', 'my-great-secret-key')
 TIME_BETWEEN_REQUESTS = env.int('TIME_BETWEEN_REQUESTS', 30)
+MAX_CONCURRENT_APPS = env.int('MAX_CONCURRENT_APPS', 1)
+ASYNC_IO = env.bool('ASYNC_IO', False)
+MAX_APPS_IN_FLIGHT = env.int('MAX_APPS_IN_FLIGHT', 100)
+ASYNC_CALL_TIMEOUT = env.float('ASYNC_CALL_TIMEOUT', 10)
+CONNECT_TIMEOUT = env.float('CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = env.float('READ_TIMEOUT', 10)
+CIRCUIT_BREAKER_THRESHOLD = env.int('CIRCUIT_BREAKER_THRESHOLD', 3)
+CIRCUIT_BREAKER_BACKOFF = env.float('CIRCUIT_BREAKER_BACKOFF', 60)
+CIRCUIT_BREAKER_MAX_BACKOFF = env.float('CIRCUIT_BREAKER_MAX_BACKOFF', 900)
+RECONCILE_WITH_FORMATION = env.bool('RECONCILE_WITH_FORMATION', False)
+LEADER_LEASE_TTL = env.float('LEADER_LEASE_TTL', 15)
+TICK_DEADLINE = env.float(
+    'TICK_DEADLINE', TIME_BETWEEN_REQUESTS, validate=lambda deadline: deadline >= 0
+)
+SHARDING = env.bool('SHARDING', False)
+SHARD_MEMBER_TTL = env.float('SHARD_MEMBER_TTL', 90)
+
+ADAPTIVE_POLLING = env.bool('ADAPTIVE_POLLING', False)
+MAX_POLL_INTERVAL = env.int('MAX_POLL_INTERVAL', 120)
+POLL_VOLATILITY_THRESHOLD = env.float('POLL_VOLATILITY_THRESHOLD', 0.2)
 
 HEROKU_API_KEY = env('HEROKU_API_KEY', None)
 HEROKU_API_KEYS = env.list(
     'HEROKU_API_KEYS', [HEROKU_API_KEY] if HEROKU_API_KEY else []
 )
+HEROKU_RATE_LIMIT = env.int('HEROKU_RATE_LIMIT', 4500)
+HEROKU_RATE_LIMIT_REFILL = env.float('HEROKU_RATE_LIMIT_REFILL', 75)
+HEROKU_RATE_LIMIT_RESERVE = env.int('HEROKU_RATE_LIMIT_RESERVE', 500)
+
+FORECAST_SMOOTHING = env.float('FORECAST_SMOOTHING', 0.5)
+FORECAST_HISTORY = env.int('FORECAST_HISTORY', 10)
 
 HOST = env('HOST', '0.0.0.0')
 PORT = env.int('PORT', 80)
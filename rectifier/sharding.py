@@ -0,0 +1,130 @@
+import bisect
+import hashlib
+import os
+import socket
+import time
+import uuid
+from typing import Iterable, List, Optional, Set, Tuple
+
+import structlog
+
+from rectifier.storage import Storage
+from rectifier import settings
+
+LOGGER = structlog.get_logger(__name__)
+
+
+class HashRing:
+    """
+    Assigns keys to nodes by consistent hashing.
+
+    Every node is placed on the ring several times, so the keys are spread evenly, and only the keys of
+    a node which joins or leaves are assigned to other nodes.
+    """
+
+    _ring: List[Tuple[int, str]]
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100) -> None:
+        """
+        :param nodes: The nodes keys are assigned to.
+        :param replicas: How many times each node is placed on the ring.
+        """
+        self.replicas = replicas
+        self._ring = sorted(
+            (self._hash(f'{node}#{replica}'), node)
+            for node in nodes
+            for replica in range(0, replicas)
+        )
+        self._hashes = [node_hash for (node_hash, _) in self._ring]
+
+    def node(self, key: str) -> Optional[str]:
+        """The node the given key is assigned to, or None if there are no nodes."""
+        if not self._ring:
+            return None
+
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class ShardMembership:
+    """
+    Registers a worker process in the storage, and tells which apps are in its shard.
+
+    The workers send heartbeats to a shared hash. The ones which haven't sent one for longer than
+    the TTL are considered gone, and their apps are assigned to the remaining workers.
+    """
+
+    members: Set[str]
+
+    def __init__(
+        self,
+        storage: Storage,
+        identity: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> None:
+        """
+        :param storage: The storage the workers register in.
+        :param identity: Identifies this worker. Unique by default.
+        :param ttl: For how many seconds a worker is considered alive after its last heartbeat.
+            Defaults to `settings.SHARD_MEMBER_TTL`.
+        """
+        self.storage = storage
+        self.identity = (
+            identity or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        )
+        self.ttl = ttl if ttl is not None else settings.SHARD_MEMBER_TTL
+
+        self.members = set()
+        self.ring = HashRing([])
+
+    def heartbeat(self) -> None:
+        """Registers this worker as alive."""
+        self.storage.hset(settings.REDIS_WORKERS_KEY, self.identity, str(time.time()))
+
+    def refresh(self) -> bool:
+        """
+        Loads the workers which are alive, and rebalances the apps if they changed.
+
+        :return: Whether the workers changed since the last refresh.
+        """
+        now = time.time()
+
+        members = {self.identity}
+        gone = []
+        for (member, heartbeat) in self.storage.hgetall(
+            settings.REDIS_WORKERS_KEY
+        ).items():
+            member = member.decode() if isinstance(member, bytes) else member
+            if now - float(heartbeat) <= self.ttl:
+                members.add(member)
+            else:
+                gone.append(member)
+
+        if gone:
+            self.storage.hdel(settings.REDIS_WORKERS_KEY, *gone)
+
+        if members == self.members:
+            return False
+
+        LOGGER.info(
+            'Rebalancing the apps.',
+            identity=self.identity,
+            workers=sorted(members),
+            joined=sorted(members - self.members),
+            left=sorted(self.members - members),
+        )
+        self.members = members
+        self.ring = HashRing(members)
+        return True
+
+    def owns(self, app: str) -> bool:
+        """Whether the given app is in the shard of this worker."""
+        return self.ring.node(app) == self.identity
+
+    def leave(self) -> None:
+        """Unregisters this worker, so that its apps are assigned to the others right away."""
+        self.storage.hdel(settings.REDIS_WORKERS_KEY, self.identity)
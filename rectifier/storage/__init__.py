@@ -1,2 +1,2 @@
-from .redis_storage import RedisStorage, RedisSubscription
-from .storage import Storage, StorageSubscription
+from .redis_storage import RedisStorage, RedisStorageBatch, RedisSubscription
+from .storage import Storage, StorageBatch, StorageSubscription
@@ -1,9 +1,9 @@
-from typing import Optional, Any
+from typing import Dict, Optional, Any
 
 import redis
-from redis.client import PubSub
+from redis.client import PubSub, Pipeline
 
-from rectifier.storage.storage import Storage, StorageSubscription
+from rectifier.storage.storage import Storage, StorageBatch, StorageSubscription
 from rectifier import settings
 
 
@@ -15,13 +15,59 @@ class RedisSubscription(StorageSubscription):
         return self.pubsub.get_message()
 
 
+class RedisStorageBatch(StorageBatch):
+    """
+    A batch of writes, sent to Redis in a single round trip through a pipeline.
+    """
+
+    def __init__(self, pipeline: Pipeline) -> None:
+        self.pipeline = pipeline
+
+    def set(self, key: str, value: Any) -> None:
+        self.pipeline.set(key, value)
+
+    def hset(self, key: str, field: str, value: Any) -> None:
+        self.pipeline.hset(key, field, value)
+
+    def hdel(self, key: str, *fields: str) -> None:
+        if fields:
+            self.pipeline.hdel(key, *fields)
+
+    def execute(self) -> None:
+        self.pipeline.execute()
+
+
 class RedisStorage(Storage):
     """
     A wrapper over Redis, providing persistent storage and publish/subscribe capabilities.
     """
 
+    # Sets the holder of the lease if it's free, incrementing the fencing token, or extends the lease
+    # if the holder already has it. Returns the fencing token of the holder's term, or nil.
+    ACQUIRE_LEASE = """
+    local holder = redis.call('get', KEYS[1])
+    if holder == false then
+        redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return redis.call('incr', KEYS[2])
+    end
+    if holder == ARGV[1] then
+        redis.call('pexpire', KEYS[1], ARGV[2])
+        return tonumber(redis.call('get', KEYS[2]))
+    end
+    return false
+    """
+
+    RELEASE_LEASE = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
     def __init__(self) -> None:
         self.redis = self.__redis_instance()
+        self._acquire_lease = self.redis.register_script(self.ACQUIRE_LEASE)
+        self._release_lease = self.redis.register_script(self.RELEASE_LEASE)
 
     @staticmethod
     def __redis_instance():
@@ -36,6 +82,39 @@ class RedisStorage(Storage):
     def get(self, key: str) -> Any:
         return self.redis.get(key)
 
+    def delete(self, key: str) -> None:
+        self.redis.delete(key)
+
+    def hgetall(self, key: str) -> Dict[Any, Any]:
+        return self.redis.hgetall(key)
+
+    def hset(self, key: str, field: str, value: Any) -> None:
+        self.redis.hset(key, field, value)
+
+    def hdel(self, key: str, *fields: str) -> None:
+        if fields:
+            self.redis.hdel(key, *fields)
+
+    def acquire_lease(self, key: str, holder: str, ttl: float) -> Optional[int]:
+        token = self._acquire_lease(
+            keys=[key, self.__token_key(key)], args=[holder, int(ttl * 1000)]
+        )
+        return int(token) if token is not None else None
+
+    def release_lease(self, key: str, holder: str) -> None:
+        self._release_lease(keys=[key], args=[holder])
+
+    def lease_token(self, key: str) -> Optional[int]:
+        token = self.redis.get(self.__token_key(key))
+        return int(token) if token is not None else None
+
+    @staticmethod
+    def __token_key(key: str) -> str:
+        return f'{key}:token'
+
+    def batch(self) -> StorageBatch:
+        return RedisStorageBatch(self.redis.pipeline(transaction=False))
+
     def subscribe(self, channel: str) -> StorageSubscription:
         pubsub = self.redis.pubsub()
         pubsub.subscribe(channel)
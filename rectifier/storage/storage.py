@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Any
+from typing import Dict, Optional, Any
 
 
 class StorageSubscription(ABC):
@@ -8,6 +8,28 @@ class StorageSubscription(ABC):
         """Returns the next message available for this subscription (if one exists)."""
 
 
+class StorageBatch(ABC):
+    """
+    A batch of writes, which are sent to the storage together when executed.
+    """
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        """Set the value of a given key."""
+
+    @abstractmethod
+    def hset(self, key: str, field: str, value: Any) -> None:
+        """Set a field of the hash stored at the given key."""
+
+    @abstractmethod
+    def hdel(self, key: str, *fields: str) -> None:
+        """Delete fields of the hash stored at the given key."""
+
+    @abstractmethod
+    def execute(self) -> None:
+        """Send the writes of the batch to the storage."""
+
+
 class Storage(ABC):
     """
     An abstraction of a key-value persistent storage.
@@ -21,6 +43,43 @@ class Storage(ABC):
     def set(self, key: str, value: Any) -> None:
         """Set the value of a given key."""
 
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Delete the given key."""
+
+    @abstractmethod
+    def hgetall(self, key: str) -> Dict[Any, Any]:
+        """Get all the fields of the hash stored at the given key."""
+
+    @abstractmethod
+    def hset(self, key: str, field: str, value: Any) -> None:
+        """Set a field of the hash stored at the given key."""
+
+    @abstractmethod
+    def hdel(self, key: str, *fields: str) -> None:
+        """Delete fields of the hash stored at the given key."""
+
+    @abstractmethod
+    def acquire_lease(self, key: str, holder: str, ttl: float) -> Optional[int]:
+        """
+        Acquire the lease stored at the given key for the given holder, or renew it if the holder already has it.
+
+        :return: The fencing token of the holder's term, which increases every time the lease changes hands,
+            or None if the lease is held by someone else.
+        """
+
+    @abstractmethod
+    def release_lease(self, key: str, holder: str) -> None:
+        """Release the lease stored at the given key, if the given holder has it."""
+
+    @abstractmethod
+    def lease_token(self, key: str) -> Optional[int]:
+        """Get the fencing token of the latest term of the lease stored at the given key."""
+
+    @abstractmethod
+    def batch(self) -> StorageBatch:
+        """Start a batch of writes."""
+
     @abstractmethod
     def publish(self, channel: str, message: Optional[Any] = None):
         """Publish a message to a channel."""
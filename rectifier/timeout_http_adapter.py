@@ -0,0 +1,28 @@
+from typing import Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+
+from rectifier import settings
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    An HTTP adapter which applies the connect and read timeouts to every request that doesn't set its own,
+    since `requests` waits forever by default.
+    """
+
+    def __init__(
+        self, *args, timeout: Optional[Tuple[float, float]] = None, **kwargs
+    ) -> None:
+        """
+        :param timeout: The connect and read timeouts, in seconds.
+            Defaults to `settings.CONNECT_TIMEOUT` and `settings.READ_TIMEOUT`.
+        """
+        self.timeout = timeout or (settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT)
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        return super().send(request, **kwargs)
@@ -6,16 +6,44 @@ class Config:
             'workers': {'type': 'array', 'items': {'type': 'number'}},
             'cooldown': {'type': 'number'},
             'consumers_formation_name': {'type': 'string'},
+            'forecast_horizon': {'type': 'number'},
+            'target_messages_per_worker': {'type': 'number'},
+            'min_workers': {'type': 'integer'},
+            'max_workers': {'type': 'integer'},
+            'max_step': {'type': 'integer'},
         },
-        'required': ['intervals', 'workers', 'cooldown', 'consumers_formation_name'],
+        'required': ['cooldown', 'consumers_formation_name'],
+        'oneOf': [
+            {
+                'required': ['intervals', 'workers'],
+                'not': {
+                    'anyOf': [
+                        {'required': ['target_messages_per_worker']},
+                        {'required': ['min_workers']},
+                        {'required': ['max_workers']},
+                        {'required': ['max_step']},
+                    ]
+                },
+            },
+            {
+                'required': ['target_messages_per_worker', 'max_workers'],
+                'not': {
+                    'anyOf': [
+                        {'required': ['intervals']},
+                        {'required': ['workers']},
+                    ]
+                },
+            },
+        ],
         'additionalProperties': False,
     }
 
     APP = {
         'type': 'object',
         'patternProperties': {
-            '^(?!mode).*$': QUEUE,
+            '^(?!(mode|broker)$).*$': QUEUE,
             '^mode$': {'type': 'string', 'enum': ['scale', 'noop', 'kill']},
+            '^broker$': {'type': 'string', 'enum': ['http', 'amqp']},
         },
     }
 
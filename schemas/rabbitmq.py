@@ -11,5 +11,20 @@ class RabbitMQ:
 
     SCHEMA = {'type': 'array', 'items': QUEUE}
 
+    PAGE = {
+        'type': 'object',
+        'properties': {'items': SCHEMA, 'page_count': {'type': 'integer'}},
+        'required': ['items', 'page_count'],
+    }
+
+    # The same listings, without validating each queue in them.
+    SHALLOW_SCHEMA = {'type': 'array'}
+
+    SHALLOW_PAGE = {
+        'type': 'object',
+        'properties': {'items': SHALLOW_SCHEMA, 'page_count': {'type': 'integer'}},
+        'required': ['items', 'page_count'],
+    }
+
 
 __all__ = ['RabbitMQ']
@@ -4,7 +4,7 @@ window.schema = {
         ".*": {
             "type": "object",
             "patternProperties": {
-                "^(?!mode).*$": {
+                "^(?!(mode|broker)$).*$": {
                     "type": "object",
                     "properties": {
                         "intervals": {
@@ -24,14 +24,79 @@ window.schema = {
                         },
                         "consumers_formation_name": {
                             "type": "string"
+                        },
+                        "forecast_horizon": {
+                            "type": "number"
+                        },
+                        "target_messages_per_worker": {
+                            "type": "number"
+                        },
+                        "min_workers": {
+                            "type": "integer"
+                        },
+                        "max_workers": {
+                            "type": "integer"
+                        },
+                        "max_step": {
+                            "type": "integer"
                         }
                     },
                     "required": [
-                        "intervals",
-                        "workers",
                         "cooldown",
                         "consumers_formation_name"
                     ],
+                    "oneOf": [
+                        {
+                            "required": [
+                                "intervals",
+                                "workers"
+                            ],
+                            "not": {
+                                "anyOf": [
+                                    {
+                                        "required": [
+                                            "target_messages_per_worker"
+                                        ]
+                                    },
+                                    {
+                                        "required": [
+                                            "min_workers"
+                                        ]
+                                    },
+                                    {
+                                        "required": [
+                                            "max_workers"
+                                        ]
+                                    },
+                                    {
+                                        "required": [
+                                            "max_step"
+                                        ]
+                                    }
+                                ]
+                            }
+                        },
+                        {
+                            "required": [
+                                "target_messages_per_worker",
+                                "max_workers"
+                            ],
+                            "not": {
+                                "anyOf": [
+                                    {
+                                        "required": [
+                                            "intervals"
+                                        ]
+                                    },
+                                    {
+                                        "required": [
+                                            "workers"
+                                        ]
+                                    }
+                                ]
+                            }
+                        }
+                    ],
                     "additionalProperties": false
                 },
                 "^mode$": {
@@ -41,6 +106,13 @@ window.schema = {
                         "noop",
                         "kill"
                     ]
+                },
+                "^broker$": {
+                    "type": "string",
+                    "enum": [
+                        "http",
+                        "amqp"
+                    ]
                 }
             }
         }
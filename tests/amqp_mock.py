@@ -0,0 +1,82 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List
+
+import pika
+
+
+@dataclass
+class DeclareOk:
+    message_count: int
+    consumer_count: int
+
+
+@dataclass
+class Frame:
+    method: DeclareOk
+
+
+class AMQPChannelMock:
+    def __init__(self, broker: 'AMQPBrokerMock', vhost: str) -> None:
+        self.broker = broker
+        self.vhost = vhost
+        self.is_open = True
+
+    def queue_declare(self, queue: str, passive: bool = False) -> Frame:
+        assert passive
+
+        if self.broker.fail:
+            raise pika.exceptions.StreamLostError('Connection lost')
+
+        self.broker.declared.append(queue)
+
+        queues = self.broker.queues[self.vhost]
+        if queue not in queues:
+            self.is_open = False
+            raise pika.exceptions.ChannelClosedByBroker(404, 'NOT_FOUND')
+
+        (consumers, messages) = queues[queue]
+        return Frame(method=DeclareOk(message_count=messages, consumer_count=consumers))
+
+
+class AMQPConnectionMock:
+    def __init__(self, broker: 'AMQPBrokerMock', vhost: str) -> None:
+        self.broker = broker
+        self.vhost = vhost
+        self.is_open = True
+
+    def channel(self) -> AMQPChannelMock:
+        self.broker.channels_opened += 1
+        return AMQPChannelMock(self.broker, self.vhost)
+
+    def process_data_events(self, time_limit=None) -> None:
+        pass
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+class AMQPBrokerMock:
+    """A stand-in for a RabbitMQ broker, answering passive queue declares
+    the way a real broker would. Replaces `pika.BlockingConnection`."""
+
+    queues: Dict[str, Dict[str, tuple]]
+    declared: List[str]
+
+    def __init__(self) -> None:
+        self.queues = defaultdict(dict)
+        self.declared = []
+        self.connections_opened = 0
+        self.channels_opened = 0
+        self.fail = False
+
+    def __call__(self, parameters: pika.URLParameters) -> AMQPConnectionMock:
+        self.connections_opened += 1
+        return AMQPConnectionMock(self, parameters.virtual_host)
+
+    def set_queue(
+        self, vhost: str, name: str, consumers: int = 0, messages: int = 0
+    ) -> None:
+        """Creates or updates the queue with the specified name."""
+
+        self.queues[vhost][name] = (consumers, messages)
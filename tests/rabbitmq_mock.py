@@ -1,6 +1,8 @@
+import math
 import threading
+import time
 from collections import defaultdict
-from typing import Dict
+from typing import Dict, List, Optional
 
 import flask
 from werkzeug.serving import make_server
@@ -14,11 +16,29 @@ class RabbitMQAPIMock:
     API would."""
 
     _queues: Dict
+    requests: List[Dict]
+
+    def __init__(
+        self,
+        latency: float = 0,
+        padding: int = 0,
+        ignore_columns: bool = False,
+        threaded: bool = False,
+    ) -> None:
+        """Initializes a new instance of :see:RabbitMQAPIMock.
 
-    def __init__(self) -> None:
-        """Initializes a new instance of :see:RabbitMQAPIMock."""
+        :param latency: How many seconds every response is delayed for.
+        :param padding: How many bytes of stats each queue has, besides
+            the ones Rectifier selects.
+        :param ignore_columns: Whether to reply with every stat, the way
+            older versions of the management API do.
+        :param threaded: Whether requests are served concurrently."""
 
         self._queues = defaultdict(lambda: defaultdict(str))
+        self.requests = []
+        self.latency = latency
+        self.padding = padding
+        self.ignore_columns = ignore_columns
 
         self._thread = threading.Thread(target=self._run)
 
@@ -26,7 +46,7 @@ class RabbitMQAPIMock:
         self._app.add_url_rule(
             '/api/queues/<app_name>', 'queues', view_func=self._get_queues
         )
-        self._server = make_server('127.0.0.1', 0, self._app)
+        self._server = make_server('127.0.0.1', 0, self._app, threaded=threaded)
 
         self.host = self._server.host
         self.port = self._server.port
@@ -52,20 +72,70 @@ class RabbitMQAPIMock:
         of messages in them and the rate at which messages
         are being consumed."""
 
-        queues = self._queues[app_name]
+        args = flask.request.args
+        self.requests.append(dict(args, app=app_name))
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        items = [
+            {'name': queue_name, **queue}
+            for queue_name, queue in self._queues[app_name].items()
+        ]
+
+        if self.padding:
+            padding = 'x' * self.padding
+            items = [dict(item, backing_queue_status=padding) for item in items]
+
+        if 'columns' in args and not self.ignore_columns:
+            columns = args['columns'].split(',')
+            items = [self._select_columns(item, columns) for item in items]
+
+        if 'page' not in args:
+            return flask.jsonify(items)
+
+        page = int(args['page'])
+        page_size = int(args['page_size'])
+        start = (page - 1) * page_size
         return flask.jsonify(
-            [
-                {
-                    'name': queue_name,
-                    'messages': queue['messages'],
-                    'consumers': queue['consumers'],
-                }
-                for queue_name, queue in queues.items()
-            ]
+            {
+                'items': items[start : start + page_size],
+                'page': page,
+                'page_size': page_size,
+                'page_count': math.ceil(len(items) / page_size),
+                'item_count': len(items[start : start + page_size]),
+                'total_count': len(items),
+            }
         )
 
+    @staticmethod
+    def _select_columns(item: Dict, columns: List[str]) -> Dict:
+        """Keeps only the given columns of a queue, the way the management API
+        does. Nested columns are separated by dots."""
+
+        selected: Dict = dict()
+        for column in columns:
+            (source, target) = (item, selected)
+            keys = column.split('.')
+            for key in keys[:-1]:
+                if key not in source:
+                    break
+                source = source[key]
+                target = target.setdefault(key, dict())
+            else:
+                if keys[-1] in source:
+                    target[keys[-1]] = source[keys[-1]]
+
+        return selected
+
     def set_queue(
-        self, app: str, name: str, consumers: int = 0, messages: int = 0
+        self,
+        app: str,
+        name: str,
+        consumers: int = 0,
+        messages: int = 0,
+        publish_rate: Optional[float] = None,
+        ack_rate: Optional[float] = None,
     ) -> None:
         """Creates or updates the queue with then specified name.
 
@@ -81,5 +151,18 @@ class RabbitMQAPIMock:
 
             consumers:
                 The amount of the consumers in the queue.
+
+            publish_rate, ack_rate:
+                The rates at which messages are published and acknowledged,
+                if they should be reported.
         """
-        self._queues[app][name] = {'messages': messages, 'consumers': consumers}
+        queue: Dict = {'messages': messages, 'consumers': consumers}
+
+        if publish_rate is not None or ack_rate is not None:
+            queue['message_stats'] = dict()
+        if publish_rate is not None:
+            queue['message_stats']['publish_details'] = {'rate': publish_rate}
+        if ack_rate is not None:
+            queue['message_stats']['ack_details'] = {'rate': ack_rate}
+
+        self._queues[app][name] = queue
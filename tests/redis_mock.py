@@ -1,6 +1,7 @@
-from typing import Any, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from rectifier.storage import Storage, StorageSubscription
+from rectifier.storage import Storage, StorageBatch, StorageSubscription
 
 
 class RedisStorageMockSubscription(StorageSubscription):
@@ -8,8 +9,32 @@ class RedisStorageMockSubscription(StorageSubscription):
         return 'message'
 
 
+class RedisStorageBatchMock(StorageBatch):
+    def __init__(self, storage: 'RedisStorageMock'):
+        self.storage = storage
+        self.writes: List[Callable[[], None]] = []
+
+    def set(self, key: str, value: Any) -> None:
+        self.writes.append(lambda: self.storage.set(key, value))
+
+    def hset(self, key: str, field: str, value: Any) -> None:
+        self.writes.append(lambda: self.storage.hset(key, field, value))
+
+    def hdel(self, key: str, *fields: str) -> None:
+        self.writes.append(lambda: self.storage.hdel(key, *fields))
+
+    def execute(self) -> None:
+        round_trips = self.storage.round_trips
+        for write in self.writes:
+            write()
+        self.storage.round_trips = round_trips + 1
+
+
 class RedisStorageMock(Storage):
     def __init__(self):
+        self.round_trips = 0
+        self.leases: Dict[str, Tuple[str, float]] = dict()
+        self.lease_tokens: Dict[str, int] = dict()
         self.data = dict(
             config=b'{"rectifier":{"q1":{"intervals":[0,10,20,30],"workers":[1,5,50,51],"cooldown":30,"consumers_formation_name":"worker_rectifier"}},'
             b'"rectifier2":{"q21":{"intervals":[0,10,22,85],"workers":[1,5,6,7],"cooldown":120,"consumers_formation_name":"worker_rectifier2"}}}'
@@ -19,8 +44,50 @@ class RedisStorageMock(Storage):
         return self.data.get(key)
 
     def set(self, key: str, value: Any) -> None:
+        self.round_trips += 1
         self.data[key] = value
 
+    def delete(self, key: str) -> None:
+        self.round_trips += 1
+        self.data.pop(key, None)
+
+    def hgetall(self, key: str) -> Dict[Any, Any]:
+        return dict(self.data.get(key, {}))
+
+    def hset(self, key: str, field: str, value: Any) -> None:
+        self.round_trips += 1
+        self.data.setdefault(key, dict())[field.encode()] = (
+            value.encode() if isinstance(value, str) else value
+        )
+
+    def hdel(self, key: str, *fields: str) -> None:
+        self.round_trips += 1
+        for field in fields:
+            self.data.get(key, {}).pop(field.encode(), None)
+
+    def acquire_lease(self, key: str, holder: str, ttl: float) -> Optional[int]:
+        now = time.monotonic()
+        (current_holder, expires_at) = self.leases.get(key, (None, now))
+
+        if current_holder is not None and expires_at > now and current_holder != holder:
+            return None
+
+        if current_holder != holder or expires_at <= now:
+            self.lease_tokens[key] = self.lease_tokens.get(key, 0) + 1
+
+        self.leases[key] = (holder, now + ttl)
+        return self.lease_tokens[key]
+
+    def release_lease(self, key: str, holder: str) -> None:
+        if self.leases.get(key, (None, 0))[0] == holder:
+            del self.leases[key]
+
+    def lease_token(self, key: str) -> Optional[int]:
+        return self.lease_tokens.get(key)
+
+    def batch(self) -> StorageBatch:
+        return RedisStorageBatchMock(self)
+
     def publish(self, channel: str, message: Optional[Any] = None):
         pass
 
@@ -0,0 +1,33 @@
+import json
+
+from benchmarks import fleet, policies
+
+
+def test_fleet_benchmark(tmp_path):
+    output = tmp_path / 'fleet.json'
+
+    fleet.main(
+        ['--apps', '5', '--queues', '2', '--ticks', '2', '--output', str(output)]
+    )
+
+    results = json.loads(output.read_text())
+    assert results['parameters']['apps'] == 5
+    assert len(results['tick_wall_time']['ticks']) == 2
+    assert results['broker_requests'] == 10
+    assert results['heroku_calls']['broker_uri'] == 5
+    assert 0 < results['heroku_calls']['scale'] <= 5
+    assert results['redis_round_trips'] == 4
+    assert results['peak_rss_kb'] > 0
+
+
+def test_policies_benchmark(tmp_path):
+    output = tmp_path / 'policies.json'
+
+    policies.main(
+        ['--queues', '200', '--intervals', '5', '--ticks', '2', '--output', str(output)]
+    )
+
+    results = json.loads(output.read_text())
+    assert results['parameters']['queues'] == 200
+    for evaluation in ('linear_scan', 'binary_search', 'batch'):
+        assert len(results[evaluation]['ticks']) == 2
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+from freezegun import freeze_time
+
+from rectifier import settings
+from rectifier.circuit_breaker import CircuitBreaker, CircuitBreakers, CircuitState
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(random, 'uniform', lambda low, high: high)
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('app:rectifier', failure_threshold=3, backoff=10)
+
+    with freeze_time("2012-01-14 03:00:00"):
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.allow()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow()
+
+
+def test_circuit_breaker_backs_off_exponentially():
+    breaker = CircuitBreaker(
+        'app:rectifier', failure_threshold=1, backoff=10, max_backoff=30
+    )
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        breaker.record_failure()
+
+        frozen_time.tick(9)
+        assert not breaker.allow()
+
+        # A single trial is let through once the backoff elapses.
+        frozen_time.tick(1)
+        assert breaker.allow()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert not breaker.allow()
+
+        # The trial fails, the breaker is open for twice as long.
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        frozen_time.tick(19)
+        assert not breaker.allow()
+        frozen_time.tick(1)
+        assert breaker.allow()
+
+        # The backoff is capped.
+        breaker.record_failure()
+        frozen_time.tick(30)
+        assert breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.allow()
+
+
+def test_circuit_breaker_lost_trial():
+    breaker = CircuitBreaker('app:rectifier', failure_threshold=1, backoff=10)
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        breaker.record_failure()
+        frozen_time.tick(10)
+        assert breaker.allow()
+
+        # The trial never reports back, another one is let through after the backoff.
+        frozen_time.tick(10)
+        assert breaker.allow()
+
+
+def test_circuit_breakers_snapshot(monkeypatch):
+    monkeypatch.setattr(settings, 'CIRCUIT_BREAKER_BACKOFF', 60)
+    breakers = CircuitBreakers()
+
+    with freeze_time("2012-01-14 03:00:00"):
+        assert breakers.app('rectifier') is breakers.app('rectifier')
+        breakers.app('rectifier').record_success()
+
+        broker = breakers.broker('broker.example.com')
+        for _ in range(0, broker.failure_threshold):
+            broker.record_failure()
+
+        assert breakers.snapshot() == {
+            'broker:broker.example.com': dict(
+                state='open', failures=broker.failure_threshold, retry_in=60
+            )
+        }
@@ -7,7 +7,7 @@ from rectifier.config import (
     CoordinatorConfig,
     QueueConfig,
 )
-from rectifier.config.config import AppConfig, AppMode
+from rectifier.config.config import AppConfig, AppMode, BrokerType
 from tests.redis_mock import RedisStorageMock
 
 
@@ -29,11 +29,13 @@ def test_config_reader_dict_parsing():
             },
         },
         'rectifier2': {
+            'broker': 'amqp',
             'q3': {
                 'intervals': [0, 10, 11, 12],
                 'workers': [1, 5, 6, 7],
                 'cooldown': 12,
                 'consumers_formation_name': 'q3w',
+                'forecast_horizon': 60,
             },
             'q1+q2': {
                 'intervals': [0, 10, 11, 14],
@@ -67,6 +69,7 @@ def test_config_reader_dict_parsing():
                 ),
                 rectifier2=AppConfig(
                     mode=AppMode.SCALE,
+                    broker=BrokerType.AMQP,
                     queues={
                         "q3": QueueConfig(
                             intervals=[0, 10, 11, 12],
@@ -74,6 +77,7 @@ def test_config_reader_dict_parsing():
                             cooldown=12,
                             queue_name='q3',
                             consumers_formation_name='q3w',
+                            forecast_horizon=60,
                         ),
                         "q1+q2": QueueConfig(
                             intervals=[0, 10, 11, 14],
@@ -133,6 +137,35 @@ def test_config_reader():
     assert config_reader.config is None
 
 
+def test_config_reader_target_tracking():
+    config = ConfigParser.from_dict(
+        {
+            'rectifier': {
+                'q1': {
+                    'target_messages_per_worker': 50,
+                    'min_workers': 1,
+                    'max_workers': 200,
+                    'max_step': 20,
+                    'cooldown': 30,
+                    'consumers_formation_name': 'q1w',
+                },
+            }
+        }
+    )
+
+    assert config.coordinator_config.apps['rectifier'].queues['q1'] == QueueConfig(
+        intervals=[],
+        workers=[],
+        cooldown=30,
+        queue_name='q1',
+        consumers_formation_name='q1w',
+        target_messages_per_worker=50,
+        min_workers=1,
+        max_workers=200,
+        max_step=20,
+    )
+
+
 @pytest.mark.parametrize(
     'config',
     [
@@ -222,6 +255,131 @@ def test_config_reader():
                 }
             },
         ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        'intervals': [0, 1, 30],
+                        'workers': [1, 5, 500],
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                        # Negative forecast horizon
+                        'forecast_horizon': -1,
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    # Unknown broker type
+                    'broker': 'smtp',
+                    'q1': {
+                        'intervals': [0, 1, 30],
+                        'workers': [1, 5, 500],
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    },
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        # Both intervals and a target of messages per worker
+                        'intervals': [0, 1, 30],
+                        'workers': [1, 5, 500],
+                        'target_messages_per_worker': 50,
+                        'max_workers': 10,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        # Intervals and a target of messages per worker, without a maximum
+                        'intervals': [0, 1, 30],
+                        'workers': [1, 5, 500],
+                        'target_messages_per_worker': 50,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        # Bounds which only apply to a target of messages per worker
+                        'intervals': [0, 1, 30],
+                        'workers': [1, 5, 500],
+                        'min_workers': 1,
+                        'max_step': 5,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        # No maximum number of workers
+                        'target_messages_per_worker': 50,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        # No messages per worker
+                        'target_messages_per_worker': 0,
+                        'max_workers': 10,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        'target_messages_per_worker': 50,
+                        # Less workers at most than at least
+                        'min_workers': 5,
+                        'max_workers': 4,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
+        (
+            {
+                'rectifier': {
+                    'q1': {
+                        'target_messages_per_worker': 50,
+                        'max_workers': 10,
+                        # No step
+                        'max_step': 0,
+                        'cooldown': 1,
+                        'consumers_formation_name': 'q1w',
+                    }
+                }
+            }
+        ),
     ],
 )
 def test_invalid_queue_configurations(config):
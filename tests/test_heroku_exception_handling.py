@@ -2,11 +2,27 @@ import pytest
 from uuid import uuid4
 from heroku3.api import ResponseError, RateLimitExceeded
 
-from rectifier.infrastructure_provider import Heroku, InfrastructureProviderError
+from rectifier import settings
+from rectifier.infrastructure_provider import (
+    Heroku,
+    InfrastructureProviderError,
+    RequestDeferredError,
+)
 from unittest import mock
 from requests import HTTPError
 
 
+@pytest.fixture(autouse=True)
+def clear_clients():
+    Heroku._clients.clear()
+    Heroku._scheduler.clear()
+    Heroku._formations.clear()
+    yield
+    Heroku._clients.clear()
+    Heroku._scheduler.clear()
+    Heroku._formations.clear()
+
+
 @pytest.mark.parametrize(
     'side_effect',
     [HTTPError(), ResponseError(), RateLimitExceeded()],
@@ -24,3 +40,145 @@ def test_broker_uri_errors(_key, side_effect):
     with mock.patch('heroku3.from_key', side_effect=side_effect):
         with pytest.raises(InfrastructureProviderError):
             Heroku().broker_uri('rectifier')
+
+
+@pytest.mark.parametrize('status_code', [403, 404])
+@mock.patch.object(Heroku, '_key', return_value=str(uuid4()))
+def test_app_not_found(_key, status_code):
+    error = HTTPError()
+    error.response = mock.MagicMock(status_code=status_code)
+
+    client = mock.MagicMock()
+    client._http_resource = mock.MagicMock(side_effect=error)
+
+    with mock.patch('heroku3.from_key', return_value=client):
+        with pytest.raises(InfrastructureProviderError):
+            Heroku().scale('rectifier', {'worker': 1})
+
+        with pytest.raises(InfrastructureProviderError):
+            Heroku().broker_uri('rectifier')
+
+
+@mock.patch.object(Heroku, '_key', return_value=str(uuid4()))
+def test_scale_reuses_client(_key):
+    client = mock.MagicMock()
+
+    with mock.patch('heroku3.from_key', return_value=client) as from_key:
+        Heroku().scale('rectifier', {'worker': 2})
+        Heroku().scale('rectifier', {'worker': 3})
+
+    assert from_key.call_count == 1
+    assert client._http_resource.call_count == 2
+    client._http_resource.assert_called_with(
+        method='PATCH',
+        resource=('apps', 'rectifier', 'formation'),
+        data=client._resource_serialize.return_value,
+    )
+    client.app.assert_not_called()
+
+
+@mock.patch.object(settings, 'HEROKU_API_KEYS', ['a', 'b'])
+def test_key_with_most_budget():
+    Heroku._scheduler.record('a', 100)
+    Heroku._scheduler.record('b', 3000)
+
+    assert Heroku._key() == 'b'
+
+    Heroku._scheduler.record('b', 50)
+
+    assert Heroku._key() == 'a'
+
+
+@mock.patch.object(settings, 'HEROKU_API_KEYS', ['a', 'b'])
+def test_rate_limit_recorded():
+    client = mock.MagicMock()
+    client._http_resource.return_value.headers = {'ratelimit-remaining': '42'}
+
+    with mock.patch('heroku3.from_key', return_value=client):
+        Heroku().broker_uri('rectifier')
+
+    assert min(Heroku._scheduler.remaining(key) for key in ['a', 'b']) == pytest.approx(
+        42, abs=0.1
+    )
+
+    client._http_resource = mock.MagicMock(side_effect=RateLimitExceeded())
+
+    with mock.patch('heroku3.from_key', return_value=client):
+        with pytest.raises(InfrastructureProviderError):
+            Heroku().scale('rectifier', {'worker': 1})
+
+    assert min(Heroku._scheduler.remaining(key) for key in ['a', 'b']) == pytest.approx(
+        0, abs=0.1
+    )
+
+
+@mock.patch.object(settings, 'HEROKU_API_KEYS', ['a', 'b'])
+def test_lookups_deferred_when_low_on_budget():
+    Heroku._scheduler.record('a', 10)
+    Heroku._scheduler.record('b', 20)
+
+    client = mock.MagicMock()
+
+    with mock.patch('heroku3.from_key', return_value=client):
+        with pytest.raises(RequestDeferredError):
+            Heroku().broker_uri('rectifier')
+
+        client._http_resource.assert_not_called()
+
+        Heroku().scale('rectifier', {'worker': 1})
+
+    assert client._http_resource.call_count == 1
+    assert Heroku._scheduler.remaining('b') == pytest.approx(19, abs=0.1)
+
+
+@mock.patch.object(Heroku, '_key', return_value=str(uuid4()))
+def test_formation_conditional_requests(_key):
+    client = mock.MagicMock()
+    client._url_for = mock.MagicMock(return_value='formation_url')
+    client._session.get = mock.MagicMock(
+        return_value=mock.MagicMock(
+            status_code=200,
+            headers={'ETag': 'etag1'},
+            json=mock.MagicMock(
+                return_value=[
+                    {'type': 'web', 'quantity': 2},
+                    {'type': 'worker', 'quantity': 5},
+                ]
+            ),
+        )
+    )
+
+    with mock.patch('heroku3.from_key', return_value=client):
+        assert Heroku().formation('rectifier') == {'web': 2, 'worker': 5}
+        client._session.get.assert_called_with('formation_url', headers=None)
+
+        client._session.get.return_value = mock.MagicMock(status_code=304, headers={})
+        assert Heroku().formation('rectifier') == {'web': 2, 'worker': 5}
+        client._session.get.assert_called_with(
+            'formation_url', headers={'If-None-Match': 'etag1'}
+        )
+
+        client._session.get.return_value = mock.MagicMock(status_code=404, headers={})
+        with pytest.raises(InfrastructureProviderError):
+            Heroku().formation('rectifier')
+
+
+@pytest.mark.parametrize(
+    'json',
+    [
+        mock.MagicMock(side_effect=ValueError('Expecting value')),
+        mock.MagicMock(return_value=[{'type': 'web'}]),
+        mock.MagicMock(return_value=[{'type': 'web', 'quantity': None}]),
+        mock.MagicMock(return_value={'id': 'not_found'}),
+    ],
+)
+@mock.patch.object(Heroku, '_key', return_value=str(uuid4()))
+def test_formation_bad_body(_key, json):
+    client = mock.MagicMock()
+    client._session.get = mock.MagicMock(
+        return_value=mock.MagicMock(status_code=200, headers={}, json=json)
+    )
+
+    with mock.patch('heroku3.from_key', return_value=client):
+        with pytest.raises(InfrastructureProviderError):
+            Heroku().formation('rectifier')
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+from rectifier.message_brokers.json_stream import aiter_json_array, iter_json_array
+
+
+def chunked(document: str, size: int):
+    data = document.encode('utf-8')
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def decode_async(chunks):
+    async def received():
+        for chunk in chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def decode():
+        return [item async for item in aiter_json_array(received())]
+
+    return asyncio.run(decode())
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1024])
+@pytest.mark.parametrize(
+    'items',
+    [
+        [],
+        [1],
+        [12345, -1.5e3, True, None],
+        [{'name': 'queue', 'messages': 10, 'consumers': 2}],
+        [{'name': 'ț, [ } "', 'messages': 1}, {'name': 'q2', 'nested': {'a': [1, 2]}}],
+    ],
+)
+def test_iter_json_array(items, size):
+    for document in (json.dumps(items), json.dumps(items, indent=4)):
+        assert list(iter_json_array(chunked(document, size))) == items
+        assert decode_async(chunked(document, size)) == items
+
+
+@pytest.mark.parametrize(
+    'document',
+    ['', '{}', '[1, 2', '[1 2]', '[1,]', '[{"name": "q"]', '[1] 2', '["unterminated]'],
+)
+def test_iter_json_array_invalid(document):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(document, 2)))
+
+    with pytest.raises(ValueError):
+        decode_async(chunked(document, 2))
@@ -0,0 +1,146 @@
+from unittest.mock import MagicMock
+
+from prometheus_client import REGISTRY
+
+from rectifier import settings
+from rectifier.infrastructure_provider import (
+    CachedInfrastructureProvider,
+    InfrastructureProviderError,
+)
+from rectifier.leader_election import LeaderElection
+from rectifier.message_brokers import RabbitMQ
+from rectifier.rectifier import Rectifier
+from tests.redis_mock import RedisStorageMock
+
+from .env import env  # noqa
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"metrics":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    infrastructure_provider = MagicMock()
+    infrastructure_provider.broker_uri = MagicMock(
+        return_value=env.rabbit_mq_uri('metrics')
+    )
+    infrastructure_provider.scale = MagicMock(side_effect=InfrastructureProviderError())
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+    )
+
+    ticks = sample('rectifier_tick_duration_seconds_count')
+    scale_phases = sample('rectifier_phase_duration_seconds_count', phase='scale')
+    calls = sample('rectifier_api_calls_total', app='metrics', api='stats')
+    errors = sample('rectifier_api_errors_total', app='metrics', api='scale')
+
+    env.rabbitmq.set_queue('metrics', 'q1', 1, 50)
+    rectifier.run()
+
+    assert sample('rectifier_tick_duration_seconds_count') == ticks + 1
+    assert (
+        sample('rectifier_phase_duration_seconds_count', phase='scale')
+        == scale_phases + 1
+    )
+    assert sample('rectifier_api_calls_total', app='metrics', api='stats') == calls + 1
+    assert (
+        sample('rectifier_api_errors_total', app='metrics', api='scale') == errors + 1
+    )
+    assert (
+        sample('rectifier_current_workers', app='metrics', formation='worker_q1') == 1
+    )
+    assert sample('rectifier_target_workers', app='metrics', formation='worker_q1') == 2
+    assert 0 <= sample('rectifier_last_successful_tick_age_seconds') < 5
+
+    # The target is still reported while the cooldown hasn't expired.
+    env.rabbitmq.set_queue('metrics', 'q1', 1, 150)
+    rectifier.run()
+    assert sample('rectifier_target_workers', app='metrics', formation='worker_q1') == 3
+
+
+def test_workers_forgotten(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"forgotten":{"q1":{"intervals":[0,10],"workers":[1,2],"cooldown":60,"consumers_formation_name":"worker_q1"}},'
+        b'"kept":{"q1":{"intervals":[0,10],"workers":[1,2],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    infrastructure_provider = MagicMock()
+    infrastructure_provider.broker_uri = MagicMock(side_effect=env.rabbit_mq_uri)
+    leader_election = LeaderElection(storage, ttl=15, identity='first')
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+        leader_election=leader_election,
+    )
+
+    env.rabbitmq.set_queue('forgotten', 'q1', 1, 50)
+    env.rabbitmq.set_queue('kept', 'q1', 1, 50)
+    rectifier.run()
+    assert sample('rectifier_is_leader') == 1
+    assert (
+        sample('rectifier_target_workers', app='forgotten', formation='worker_q1') == 2
+    )
+
+    # The app removed from the configuration isn't reported anymore.
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"kept":{"q1":{"intervals":[0,10],"workers":[1,2],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    rectifier.update_configuration()
+    assert (
+        REGISTRY.get_sample_value(
+            'rectifier_target_workers', dict(app='forgotten', formation='worker_q1')
+        )
+        is None
+    )
+    assert sample('rectifier_target_workers', app='kept', formation='worker_q1') == 2
+
+    # Neither are the apps of a leader which lost the leadership.
+    storage.release_lease(settings.REDIS_LEADER_KEY, 'first')
+    assert LeaderElection(storage, ttl=15, identity='second').acquire()
+    rectifier.run()
+    assert sample('rectifier_is_leader') == 0
+    assert (
+        REGISTRY.get_sample_value(
+            'rectifier_current_workers', dict(app='kept', formation='worker_q1')
+        )
+        is None
+    )
+
+
+def test_cached_broker_uris_not_counted(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"cached":{"q1":{"intervals":[0,10],"workers":[1,2],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    infrastructure_provider = MagicMock()
+    infrastructure_provider.broker_uri = MagicMock(side_effect=env.rabbit_mq_uri)
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=CachedInfrastructureProvider(infrastructure_provider),
+    )
+
+    calls = sample('rectifier_api_calls_total', app='cached', api='broker_uri')
+
+    env.rabbitmq.set_queue('cached', 'q1', 1, 1)
+    rectifier.run()
+    rectifier.run()
+
+    assert infrastructure_provider.broker_uri.call_count == 1
+    assert (
+        sample('rectifier_api_calls_total', app='cached', api='broker_uri') == calls + 1
+    )
@@ -1,15 +1,27 @@
-import pytest
+import json
 import pickle
+import time
+from urllib.parse import urlparse
+
+import pytest
+
+from datetime import datetime
 
 from collections import defaultdict
 from typing import Dict
 from unittest.mock import MagicMock
 
 from freezegun import freeze_time
+from prometheus_client import REGISTRY
 
 from rectifier import settings
+from rectifier.circuit_breaker import CircuitState
 from rectifier.config import AppMode
-from rectifier.infrastructure_provider import InfrastructureProvider
+from rectifier.infrastructure_provider import (
+    CachedInfrastructureProvider,
+    InfrastructureProvider,
+    InfrastructureProviderError,
+)
 from rectifier.message_brokers import RabbitMQ
 from rectifier.rectifier import Rectifier
 from tests.redis_mock import RedisStorageMock
@@ -32,8 +44,12 @@ class InfrastructureProviderMock(InfrastructureProvider):
     def broker_uri(self, app_name: str):
         return self.env.rabbit_mq_uri(app_name)
 
+    def formation(self, app_name: str):
+        return dict(self.consumers[app_name])
+
 
-def test_monitor(env):
+@pytest.mark.parametrize('max_concurrent_apps', [1, 4])
+def test_monitor(env, max_concurrent_apps):
     storage = RedisStorageMock()
     infrastructure_provider = InfrastructureProviderMock(env)
 
@@ -46,6 +62,7 @@ def test_monitor(env):
         broker=RabbitMQ(),
         storage=storage,
         infrastructure_provider=infrastructure_provider,
+        max_concurrent_apps=max_concurrent_apps,
     )
 
     with freeze_time("2012-01-14 03:00:00") as frozen_time:
@@ -201,12 +218,12 @@ def test_monitor_with_no_config(env):
     )
 
     assert not storage.get(settings.REDIS_CONFIG_KEY)
-    assert not storage.get(settings.REDIS_UPDATE_TIMES)
+    assert not storage.hgetall(settings.REDIS_UPDATE_TIMES)
     rectifier.run()
 
     assert infrastructure_provider.called_count == 0
     assert not storage.get(settings.REDIS_CONFIG_KEY)
-    assert not storage.get(settings.REDIS_UPDATE_TIMES)
+    assert not storage.hgetall(settings.REDIS_UPDATE_TIMES)
 
 
 def test_monitor_with_no_broker_uri(env):
@@ -230,6 +247,37 @@ def test_monitor_with_no_broker_uri(env):
     assert not infrastructure_provider.scale.called
 
 
+def test_monitor_concurrent_failing_app(env):
+    storage = RedisStorageMock()
+    infrastructure_provider = InfrastructureProviderMock(env)
+
+    def broker_uri(app_name: str):
+        if app_name == 'broken':
+            raise InfrastructureProviderError('App could not be found on Heroku')
+
+        return env.rabbit_mq_uri(app_name)
+
+    infrastructure_provider.broker_uri = broker_uri  # type: ignore
+
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"broken":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}},'
+        b'"rectifier":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+        max_concurrent_apps=2,
+    )
+
+    env.rabbitmq.set_queue('rectifier', 'q1', 0, 20)
+    rectifier.run()
+
+    assert infrastructure_provider.called_count == 1
+    assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 2
+
+
 def test_update_time_storage(env):
     storage = RedisStorageMock()
     infrastructure_provider = InfrastructureProviderMock(env)
@@ -254,8 +302,10 @@ def test_update_time_storage(env):
         assert infrastructure_provider.called_count == 1
         assert infrastructure_provider.consumers['rectify']['worker_q1'] == 1
 
-        update_times = pickle.loads(storage.get(settings.REDIS_UPDATE_TIMES))
-        assert update_times['rectify']['q1'] == frozen_time.time_to_freeze
+        update_times = storage.hgetall(settings.REDIS_UPDATE_TIMES)
+        assert update_times == {
+            b'rectify/q1': frozen_time.time_to_freeze.isoformat().encode()
+        }
 
         env.rabbitmq.set_queue('rectify', 'q1', 1, 11)
         frozen_time.move_to('2012-01-14 03:01:00')
@@ -263,8 +313,10 @@ def test_update_time_storage(env):
         assert infrastructure_provider.called_count == 2
         assert infrastructure_provider.consumers['rectify']['worker_q1'] == 2
 
-        update_times = pickle.loads(storage.get(settings.REDIS_UPDATE_TIMES))
-        assert update_times['rectify']['q1'] == frozen_time.time_to_freeze
+        update_times = storage.hgetall(settings.REDIS_UPDATE_TIMES)
+        assert update_times == {
+            b'rectify/q1': frozen_time.time_to_freeze.isoformat().encode()
+        }
 
         old_time = frozen_time.time_to_freeze
         env.rabbitmq.set_queue('rectify', 'q1', 1, 2)
@@ -272,8 +324,153 @@ def test_update_time_storage(env):
         rectifier.run()
         assert infrastructure_provider.called_count == 2
         assert infrastructure_provider.consumers['rectify']['worker_q1'] == 2
-        update_times = pickle.loads(storage.get(settings.REDIS_UPDATE_TIMES))
-        assert update_times['rectify']['q1'] == old_time
+        update_times = storage.hgetall(settings.REDIS_UPDATE_TIMES)
+        assert update_times == {b'rectify/q1': old_time.isoformat().encode()}
+
+
+@pytest.mark.parametrize('max_concurrent_apps', [1, 4])
+def test_update_time_storage_batched(env, max_concurrent_apps):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectifier":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"},'
+        b'"q2":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q2"}},'
+        b'"rectifier2":{"q3":{"intervals":[0,10,100],"workers":[2,4,6],"cooldown":30,"consumers_formation_name":"worker_q3"}}}',
+    )
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=InfrastructureProviderMock(env),
+        max_concurrent_apps=max_concurrent_apps,
+    )
+
+    env.rabbitmq.set_queue('rectifier', 'q1')
+    env.rabbitmq.set_queue('rectifier', 'q2')
+    env.rabbitmq.set_queue('rectifier2', 'q3')
+
+    storage.round_trips = 0
+    rectifier.run()
+
+    assert storage.round_trips == 1
+    assert set(storage.hgetall(settings.REDIS_UPDATE_TIMES)) == {
+        b'rectifier/q1',
+        b'rectifier/q2',
+        b'rectifier2/q3',
+    }
+
+    # Nothing to write while the cooldowns haven't expired.
+    rectifier.run()
+    assert storage.round_trips == 1
+
+
+def test_monitor_reconcile_with_formation(env, monkeypatch):
+    monkeypatch.setattr(settings, 'RECONCILE_WITH_FORMATION', True)
+
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectifier":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    infrastructure_provider = InfrastructureProviderMock(env)
+    infrastructure_provider.consumers['rectifier']['worker_q1'] = 1
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+    )
+
+    # The single worker dyno opened three channels.
+    env.rabbitmq.set_queue('rectifier', 'q1', 3, 5)
+    rectifier.run()
+    assert infrastructure_provider.called_count == 0
+
+    # The dyno crashed, while the formation still has one.
+    env.rabbitmq.set_queue('rectifier', 'q1', 0, 5)
+    rectifier.run()
+    assert infrastructure_provider.called_count == 0
+
+    env.rabbitmq.set_queue('rectifier', 'q1', 3, 50)
+    rectifier.run()
+    assert infrastructure_provider.called_count == 1
+    assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 2
+
+    # While the queue is in its cooldown, there's nothing to reconcile the formation with.
+    infrastructure_provider.formation = MagicMock()
+    rectifier.run()
+    assert not infrastructure_provider.formation.called
+
+
+def test_update_time_storage_pruned(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectify":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    storage.hset(settings.REDIS_UPDATE_TIMES, 'rectify/q1', '2012-01-14T03:00:00')
+    storage.hset(settings.REDIS_UPDATE_TIMES, 'rectify/q2', '2012-01-14T03:00:00')
+    storage.hset(settings.REDIS_UPDATE_TIMES, 'removed/q1', '2012-01-14T03:00:00')
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=InfrastructureProviderMock(env),
+    )
+
+    assert storage.hgetall(settings.REDIS_UPDATE_TIMES) == {
+        b'rectify/q1': b'2012-01-14T03:00:00'
+    }
+    assert rectifier.consumer_updates_coordinator.queues_update_time == {
+        'rectify': {'q1': datetime(2012, 1, 14, 3, 0, 0)}
+    }
+
+
+def test_legacy_update_times_migrated(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectify":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"},'
+        b'"q2":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q2"}}}',
+    )
+    legacy_update_times: Dict[str, Dict[str, datetime]] = defaultdict(dict)
+    legacy_update_times['rectify']['q1'] = datetime(2012, 1, 14, 3, 0, 0)
+    legacy_update_times['rectify']['q2'] = datetime(2012, 1, 14, 3, 0, 0)
+    storage.set(settings.REDIS_LEGACY_UPDATE_TIMES, pickle.dumps(legacy_update_times))
+    storage.hset(settings.REDIS_UPDATE_TIMES, 'rectify/q2', '2012-01-14T04:00:00')
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=InfrastructureProviderMock(env),
+    )
+
+    assert storage.get(settings.REDIS_LEGACY_UPDATE_TIMES) is None
+    assert storage.hgetall(settings.REDIS_UPDATE_TIMES) == {
+        b'rectify/q1': b'2012-01-14T03:00:00',
+        b'rectify/q2': b'2012-01-14T04:00:00',
+    }
+    assert rectifier.consumer_updates_coordinator.queues_update_time == {
+        'rectify': {
+            'q1': datetime(2012, 1, 14, 3, 0, 0),
+            'q2': datetime(2012, 1, 14, 4, 0, 0),
+        }
+    }
+
+
+def test_legacy_update_times_unsafe_pickle_dropped(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_LEGACY_UPDATE_TIMES, pickle.dumps({'rectify': {'q1': set()}})
+    )
+
+    Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=InfrastructureProviderMock(env),
+    )
+
+    assert storage.get(settings.REDIS_LEGACY_UPDATE_TIMES) is None
+    assert not storage.hgetall(settings.REDIS_UPDATE_TIMES)
 
 
 def test_monitor_common_config(env):
@@ -318,3 +515,266 @@ def test_monitor_common_config(env):
         rectifier.run()
         assert infrastructure_provider.called_count == 2
         assert infrastructure_provider.consumers['rectifier']['worker'] == 3
+
+
+def test_monitor_adaptive_polling(env, monkeypatch):
+    monkeypatch.setattr(settings, 'ADAPTIVE_POLLING', True)
+    monkeypatch.setattr(settings, 'TIME_BETWEEN_REQUESTS', 30)
+    monkeypatch.setattr(settings, 'MAX_POLL_INTERVAL', 120)
+
+    storage = RedisStorageMock()
+    infrastructure_provider = InfrastructureProviderMock(env)
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectifier":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":600,"consumers_formation_name":"worker_q1"}},'
+        b'"rectifier2":{"q2":{"intervals":[0,10,100],"workers":[2,4,6],"cooldown":30,"consumers_formation_name":"worker_q2"}}}',
+    )
+    env.rabbitmq.set_queue('rectifier', 'q1', 0, 0)
+    env.rabbitmq.set_queue('rectifier2', 'q2', 2, 0)
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        rectifier = Rectifier(
+            broker=RabbitMQ(),
+            storage=storage,
+            infrastructure_provider=infrastructure_provider,
+        )
+
+        # The second app is polled half an interval after the first one.
+        rectifier.run()
+        assert len(env.rabbitmq.requests) == 1
+        assert rectifier.next_poll_delay() == 15
+
+        frozen_time.tick(15)
+        rectifier.run()
+        assert len(env.rabbitmq.requests) == 2
+
+        # The first app was scaled, and is in its long cooldown with steady queues: it's polled less often.
+        # The second one can be scaled at any time, it's polled at the base interval.
+        for _ in range(0, 10):
+            frozen_time.tick(15)
+            rectifier.run()
+
+        polled_apps = [request['app'] for request in env.rabbitmq.requests]
+        assert infrastructure_provider.called_count == 1
+        assert polled_apps.count('rectifier2') == 6
+        assert polled_apps.count('rectifier') == 3
+
+
+@pytest.mark.parametrize(
+    'max_concurrent_apps,expected_deferred_apps',
+    [
+        (1, ['slow2', 'rectifier', 'rectifier2']),
+        # The slow apps are still in flight when the deadline is reached, they are waited for.
+        (2, ['rectifier', 'rectifier2']),
+    ],
+)
+def test_monitor_tick_deadline(
+    env, monkeypatch, max_concurrent_apps, expected_deferred_apps
+):
+    monkeypatch.setattr(settings, 'TICK_DEADLINE', 0.05)
+
+    storage = RedisStorageMock()
+    infrastructure_provider = InfrastructureProviderMock(env)
+    polled_apps = []
+
+    def broker_uri(app_name: str):
+        polled_apps.append(app_name)
+        if app_name.startswith('slow'):
+            time.sleep(0.2)
+
+        return env.rabbit_mq_uri(app_name)
+
+    infrastructure_provider.broker_uri = broker_uri  # type: ignore
+
+    apps = ['slow1', 'slow2', 'rectifier', 'rectifier2']
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        json.dumps(
+            {
+                app: {
+                    'q1': {
+                        'intervals': [0, 10, 100],
+                        'workers': [1, 2, 3],
+                        'cooldown': 60,
+                        'consumers_formation_name': 'worker_q1',
+                    }
+                }
+                for app in apps
+            }
+        ).encode(),
+    )
+    for app in apps:
+        env.rabbitmq.set_queue(app, 'q1', 0, 20)
+
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+        max_concurrent_apps=max_concurrent_apps,
+    )
+
+    missed_deadlines = REGISTRY.get_sample_value(
+        'rectifier_missed_tick_deadlines_total'
+    )
+
+    rectifier.run()
+    assert rectifier.deferred_apps == expected_deferred_apps
+    assert (
+        REGISTRY.get_sample_value('rectifier_missed_tick_deadlines_total')
+        == missed_deadlines + 1
+    )
+
+    # The apps which were scaled have their update times written with the tick.
+    scaled_apps = [app for app in apps if app not in expected_deferred_apps]
+    assert sorted(infrastructure_provider.consumers) == sorted(scaled_apps)
+    assert sorted(storage.hgetall(settings.REDIS_UPDATE_TIMES)) == sorted(
+        f'{app}/q1'.encode() for app in scaled_apps
+    )
+
+    # The deferred apps go first in the next tick.
+    monkeypatch.setattr(settings, 'TICK_DEADLINE', 0)
+    rectifier.max_concurrent_apps = 1
+    polled_apps.clear()
+    rectifier.run()
+
+    assert polled_apps[: len(expected_deferred_apps)] == expected_deferred_apps
+    assert rectifier.deferred_apps == []
+
+
+def test_monitor_circuit_breaker(env, monkeypatch):
+    monkeypatch.setattr(settings, 'CIRCUIT_BREAKER_THRESHOLD', 2)
+    monkeypatch.setattr(settings, 'CIRCUIT_BREAKER_BACKOFF', 60)
+
+    storage = RedisStorageMock()
+    infrastructure_provider = InfrastructureProviderMock(env)
+    broker_uri_calls: Dict[str, int] = defaultdict(int)
+
+    def broker_uri(app_name: str):
+        broker_uri_calls[app_name] += 1
+        if app_name == 'broken':
+            raise InfrastructureProviderError('App could not be found on Heroku')
+
+        return env.rabbit_mq_uri(app_name)
+
+    infrastructure_provider.broker_uri = broker_uri  # type: ignore
+
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"broken":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}},'
+        b'"rectifier":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+    )
+    env.rabbitmq.set_queue('rectifier', 'q1', 0, 20)
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        # The broken app doesn't cost the other app its tick.
+        rectifier.run()
+        assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 2
+
+        # The circuit of the broken app opens, it's not called again until the backoff elapses.
+        for _ in range(0, 3):
+            frozen_time.tick(10)
+            rectifier.run()
+
+        assert broker_uri_calls['broken'] == 2
+        assert broker_uri_calls['rectifier'] == 4
+        assert set(rectifier.circuit_breakers.snapshot()) == {'app:broken'}
+
+        frozen_time.tick(60)
+        rectifier.run()
+        assert broker_uri_calls['broken'] == 3
+
+
+def test_monitor_circuit_breaker_closed_by_provider_calls_only(env):
+    storage = RedisStorageMock()
+    infrastructure_provider = CachedInfrastructureProvider(
+        InfrastructureProviderMock(env)
+    )
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectifier":{"q1":{"intervals":[0,10,100],"workers":[1,2,3],"cooldown":60,"consumers_formation_name":"worker_q1"}}}',
+    )
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+    )
+    broker_uri = infrastructure_provider.broker_uri('rectifier')
+
+    # The backoffs of both the app and its broker host have elapsed, the app is on trial.
+    app_breaker = rectifier.circuit_breakers.app('rectifier')
+    broker_breaker = rectifier.circuit_breakers.broker(urlparse(broker_uri).hostname)
+    for breaker in (app_breaker, broker_breaker):
+        for _ in range(0, breaker.failure_threshold):
+            breaker.record_failure()
+        breaker.retry_at = 0
+
+    # The broker URI is cached, and the broker is on trial too: no call reached Heroku.
+    assert broker_breaker.allow()
+    rectifier.run()
+    assert app_breaker.state == CircuitState.HALF_OPEN
+
+    # Once the broker URI is requested from Heroku, the app is back to normal.
+    infrastructure_provider.invalidate_broker_uri('rectifier')
+    app_breaker.retry_at = 0
+    broker_breaker.record_success()
+    rectifier.run()
+    assert app_breaker.state == CircuitState.CLOSED
+
+
+def test_monitor_target_tracking(env):
+    storage = RedisStorageMock()
+    infrastructure_provider = InfrastructureProviderMock(env)
+
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        b'{"rectifier":{"q1":{"target_messages_per_worker":50,"min_workers":1,"max_workers":200,"max_step":20,'
+        b'"cooldown":60,"consumers_formation_name":"worker_q1"}},'
+        b'"rectifier2":{"q2":{"target_messages_per_worker":50,"min_workers":1,"max_workers":200,'
+        b'"cooldown":60,"consumers_formation_name":"worker_q2"}}}',
+    )
+    rectifier = Rectifier(
+        broker=RabbitMQ(),
+        storage=storage,
+        infrastructure_provider=infrastructure_provider,
+    )
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        # The workers are the ceiling of the messages over the target, at most `max_step` away from the current ones.
+        env.rabbitmq.set_queue('rectifier', 'q1', 5, 2001)
+        env.rabbitmq.set_queue('rectifier2', 'q2', 5, 2001)
+        rectifier.run()
+        assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 25
+        assert infrastructure_provider.consumers['rectifier2']['worker_q2'] == 41
+
+        # Within the minimum and the maximum number of workers.
+        frozen_time.tick(60)
+        env.rabbitmq.set_queue('rectifier', 'q1', 25, 1000000)
+        env.rabbitmq.set_queue('rectifier2', 'q2', 41, 0)
+        rectifier.run()
+        assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 45
+        assert infrastructure_provider.consumers['rectifier2']['worker_q2'] == 1
+
+        frozen_time.tick(60)
+        env.rabbitmq.set_queue('rectifier', 'q1', 45, 2250)
+        env.rabbitmq.set_queue('rectifier2', 'q2', 1, 1000000)
+        rectifier.run()
+        assert infrastructure_provider.consumers['rectifier2']['worker_q2'] == 200
+
+        # Already tracking the target.
+        assert infrastructure_provider.called_count == 5
+
+        # Brought back within the bounds at once, whatever the step.
+        frozen_time.tick(60)
+        env.rabbitmq.set_queue('rectifier', 'q1', 300, 1000000)
+        rectifier.run()
+        assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 200
+
+        frozen_time.tick(60)
+        env.rabbitmq.set_queue('rectifier', 'q1', 0, 0)
+        rectifier.run()
+        assert infrastructure_provider.consumers['rectifier']['worker_q1'] == 1
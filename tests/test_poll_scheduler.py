@@ -0,0 +1,116 @@
+from typing import Dict
+
+import pytest
+
+from rectifier import settings
+from rectifier.config import AppConfig, AppMode, QueueConfig
+from rectifier.poll_scheduler import PollScheduler
+from rectifier.queue import Queue
+
+
+@pytest.fixture(autouse=True)
+def poll_settings(monkeypatch):
+    monkeypatch.setattr(settings, 'TIME_BETWEEN_REQUESTS', 30)
+    monkeypatch.setattr(settings, 'MAX_POLL_INTERVAL', 120)
+    monkeypatch.setattr(settings, 'POLL_VOLATILITY_THRESHOLD', 0.2)
+
+
+def app_config(*cooldowns: int, mode: AppMode = AppMode.SCALE) -> AppConfig:
+    return AppConfig(
+        mode=mode,
+        queues={
+            f'q{i}': QueueConfig(
+                intervals=[0, 10],
+                workers=[1, 2],
+                cooldown=cooldown,
+                queue_name=f'q{i}',
+                consumers_formation_name=f'worker_q{i}',
+            )
+            for (i, cooldown) in enumerate(cooldowns)
+        },
+    )
+
+
+def queues(messages: int):
+    return [Queue(queue_name='q0', consumers_count=1, messages=messages)]
+
+
+def test_first_polls_staggered():
+    apps: Dict[str, AppConfig] = dict(
+        a=app_config(60),
+        b=app_config(60),
+        c=app_config(60),
+        paused=app_config(60, mode=AppMode.NOOP),
+    )
+    scheduler = PollScheduler(apps, now=1000)
+
+    assert scheduler.due(1000) == ['a']
+    assert scheduler.due(1009) == []
+    assert scheduler.due(1010) == ['b']
+    assert scheduler.due(1030) == ['c']
+    assert scheduler.due(5000) == []
+    assert scheduler.next_due() is None
+
+
+def test_interval_from_cooldown_left():
+    apps = dict(slow=app_config(600, 900), medium=app_config(100), fast=app_config(10))
+    cooldown_left = dict(slow=500, medium=50, fast=0)
+    scheduler = PollScheduler(apps, now=0)
+    due_apps = scheduler.due(100)
+
+    # The first poll has nothing to compare to.
+    for app in due_apps:
+        scheduler.record(app, queues(10), now=100, cooldown_left=cooldown_left[app])
+    assert sorted(scheduler.due(130)) == ['fast', 'medium', 'slow']
+
+    # The apps are polled by the end of their cooldown, at most every maximum interval,
+    # and at the base interval once out of it.
+    for app in due_apps:
+        scheduler.record(app, queues(10), now=130, cooldown_left=cooldown_left[app])
+    assert scheduler.due(159) == []
+    assert scheduler.due(160) == ['fast']
+    assert scheduler.due(180) == ['medium']
+    assert scheduler.due(249) == []
+    assert scheduler.due(250) == ['slow']
+
+    # Out of its cooldown, even an app with a long cooldown is polled at the base interval.
+    scheduler.record('slow', queues(10), now=250)
+    assert scheduler.due(280) == ['slow']
+
+
+def test_interval_shortened_by_volatility():
+    scheduler = PollScheduler(dict(app=app_config(600)), now=0)
+    assert scheduler.due(0) == ['app']
+
+    scheduler.record('app', queues(100), now=0, cooldown_left=600)
+    assert scheduler.due(30) == ['app']
+
+    # Steady queues are polled at the maximum interval.
+    scheduler.record('app', queues(100), now=30, cooldown_left=570)
+    assert scheduler.due(149) == []
+    assert scheduler.due(150) == ['app']
+
+    # Changing queues are polled sooner.
+    scheduler.record('app', queues(120), now=150, cooldown_left=450)
+    assert scheduler.due(229) == []
+    assert scheduler.due(230) == ['app']
+
+    scheduler.record('app', queues(1000), now=230, cooldown_left=370)
+    assert scheduler.due(260) == ['app']
+
+    # Failed polls are retried at the base interval.
+    scheduler.record('app', None, now=260, cooldown_left=340)
+    assert scheduler.due(290) == ['app']
+
+
+def test_update_keeps_schedule():
+    scheduler = PollScheduler(dict(a=app_config(600), b=app_config(600)), now=0)
+    assert scheduler.due(0) == ['a']
+    scheduler.record('a', queues(10), now=0)
+
+    scheduler.update(dict(a=app_config(600), c=app_config(600)), now=5)
+
+    assert scheduler.due(5) == ['c']
+    assert scheduler.due(29) == []
+    assert scheduler.due(30) == ['a']
+    assert scheduler.next_due() is None
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import pytest
+from freezegun import freeze_time
+
+from rectifier.config import AppConfig, AppMode, CoordinatorConfig, QueueConfig
+from rectifier.consumer_updates_coordinator import (
+    ConsumerUpdatesCoordinator,
+    DepthForecaster,
+)
+from rectifier.queue import Queue
+from tests.redis_mock import RedisStorageMock
+
+
+def test_forecast_from_depth_trend():
+    forecaster = DepthForecaster(smoothing=0.5)
+    assert forecaster.forecast('app', 'q', horizon=60) is None
+
+    forecaster.observe('app', Queue('q', 1, messages=100), now=0)
+    assert forecaster.forecast('app', 'q', horizon=60) is None
+
+    forecaster.observe('app', Queue('q', 1, messages=400), now=30)
+    assert forecaster.forecast('app', 'q', horizon=60) == 400 + 10 * 60
+
+    # The growth rate is smoothed
+    forecaster.observe('app', Queue('q', 1, messages=400), now=60)
+    assert forecaster.forecast('app', 'q', horizon=60) == 400 + 5 * 60
+
+    # The forecast is never negative
+    forecaster.observe('app', Queue('q', 1, messages=0), now=70)
+    assert forecaster.forecast('app', 'q', horizon=60) == 0
+
+
+def test_forecast_from_broker_rates():
+    forecaster = DepthForecaster(smoothing=0.5)
+
+    forecaster.observe(
+        'app', Queue('q', 1, messages=100, publish_rate=12, ack_rate=2), now=0
+    )
+    assert forecaster.forecast('app', 'q', horizon=60) == 100 + 10 * 60
+
+    forecaster.observe(
+        'app', Queue('q', 1, messages=100, publish_rate=2, ack_rate=2), now=30
+    )
+    assert forecaster.forecast('app', 'q', horizon=60) == 100 + 5 * 60
+
+
+def coordinator(forecast_horizon: Optional[int]) -> ConsumerUpdatesCoordinator:
+    queue_config = QueueConfig(
+        intervals=[0, 500, 1000, 2000],
+        workers=[1, 2, 4, 8],
+        cooldown=0,
+        queue_name='q',
+        consumers_formation_name='worker',
+        forecast_horizon=forecast_horizon,
+    )
+    config = CoordinatorConfig(
+        apps=dict(app=AppConfig(queues=dict(q=queue_config), mode=AppMode.SCALE))
+    )
+    return ConsumerUpdatesCoordinator(config=config, storage=RedisStorageMock())
+
+
+def replay(coordinator: ConsumerUpdatesCoordinator, depths) -> Dict[int, int]:
+    """Replays the depths sampled every 30 seconds, returning the time
+    at which at least each of the workers counts was first reached."""
+
+    start = datetime(2012, 1, 14, 3)
+    consumers = 1
+    reached: Dict[int, int] = dict()
+
+    with freeze_time(start) as frozen_time:
+        for (index, depth) in enumerate(depths):
+            frozen_time.move_to(start + timedelta(seconds=30 * index))
+
+            (count, _) = coordinator.compute_consumers_count(
+                'app', AppMode.SCALE, Queue('q', consumers, messages=depth)
+            )
+            if count is not None:
+                consumers = count
+                for workers in (1, 2, 4, 8):
+                    if consumers >= workers:
+                        reached.setdefault(workers, 30 * index)
+
+    return reached
+
+
+@pytest.mark.parametrize('rate', [5, 10, 20])
+def test_replay_ramp_scales_up_earlier(rate):
+    # A backlog growing steadily
+    depths = [rate * 30 * i for i in range(0, 15)]
+
+    reactive = replay(coordinator(forecast_horizon=None), depths)
+    predictive = replay(coordinator(forecast_horizon=120), depths)
+
+    for workers in (2, 4, 8):
+        assert predictive[workers] <= reactive[workers]
+
+    # Once the trend is known, the scale ups come earlier.
+    assert predictive[4] < reactive[4]
+    assert predictive[8] < reactive[8]
+
+    # Scaling down still waits for the queue to drain.
+    draining = depths[::-1]
+    assert replay(coordinator(forecast_horizon=120), draining) == replay(
+        coordinator(forecast_horizon=None), draining
+    )
@@ -0,0 +1,138 @@
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from rectifier.leader_election import LeaderElection
+from rectifier.profiler import TickProfiler
+from tests.redis_mock import RedisStorageMock
+
+
+def busy_tick():
+    allocations = []
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        allocations.append(bytearray(1024))
+    return allocations
+
+
+def run_ticks(profiler: TickProfiler, ticks: int, kept: list):
+    for _ in range(0, ticks):
+        with profiler.tick():
+            kept.append(busy_tick())
+
+
+def test_profiler_idle():
+    profiler = TickProfiler()
+
+    with profiler.tick():
+        assert not tracemalloc.is_tracing()
+
+    assert profiler.result() is None
+
+
+def test_profiler():
+    profiler = TickProfiler()
+    assert profiler.start(ticks=2, interval=0.001)
+    assert not profiler.start(ticks=2)
+
+    kept: list = []
+    thread = threading.Thread(
+        target=run_ticks, args=(profiler, 3, kept), name='rectifier'
+    )
+    thread.start()
+    thread.join()
+
+    assert not profiler.running
+    assert not tracemalloc.is_tracing()
+
+    result = profiler.result()
+    assert result['ticks'] == 2
+    assert result['samples'] > 0
+    assert all(stack.startswith('rectifier;') for stack in result['collapsed_stacks'])
+    assert any('busy_tick' in stack for stack in result['collapsed_stacks'])
+    assert any('test_profiler.py' in site['site'] for site in result['allocations'])
+
+    # Another profiling can be requested once the previous one completed.
+    assert profiler.start(ticks=1)
+
+
+@pytest.mark.parametrize(
+    'ticks,interval', [(0, 0.005), (-1, 0.005), (1, 0), (1, -1), (1, float('nan'))]
+)
+def test_profiler_invalid_requests(ticks, interval):
+    profiler = TickProfiler()
+
+    with pytest.raises(ValueError):
+        profiler.start(ticks, interval)
+
+    assert not profiler.running
+
+
+def test_profiler_capped_requests():
+    profiler = TickProfiler()
+
+    session = profiler.start(ticks=1000000, interval=0.0000001)
+    assert session.ticks == TickProfiler.MAX_TICKS
+    assert session.interval == TickProfiler.MIN_INTERVAL
+    profiler.cancel()
+
+    session = profiler.start(ticks=1, interval=3600)
+    assert session.interval == TickProfiler.MAX_INTERVAL
+
+
+def test_profiler_cancel():
+    profiler = TickProfiler()
+    assert not profiler.cancel()
+
+    assert profiler.start(ticks=5, interval=0.001)
+    run_ticks(profiler, 1, [])
+    assert tracemalloc.is_tracing()
+
+    assert profiler.cancel()
+    assert not profiler.running
+    assert not tracemalloc.is_tracing()
+    assert profiler.result() is None
+
+    # The ticks after the cancellation aren't profiled.
+    run_ticks(profiler, 1, [])
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiler_timeout():
+    profiler = TickProfiler(timeout=0.05)
+
+    # The loop doesn't tick, e.g. on a process which isn't the leader.
+    assert profiler.start(ticks=3, interval=0.001)
+    assert profiler.running
+    time.sleep(0.1)
+    assert not profiler.running
+
+    # A profiling outliving the timeout is cancelled along with the tracing.
+    assert profiler.start(ticks=3, interval=0.001)
+    run_ticks(profiler, 2, [])
+    assert not profiler.running
+    assert not tracemalloc.is_tracing()
+    assert profiler.result() is None
+
+
+def test_profiler_counts_leader_ticks_only():
+    storage = RedisStorageMock()
+    leader = LeaderElection(storage, ttl=30, identity='leader')
+    follower = LeaderElection(storage, ttl=30, identity='follower')
+    profiler = TickProfiler()
+    assert leader.acquire()
+
+    assert profiler.start(ticks=1, interval=0.001)
+
+    with profiler.tick(follower):
+        assert not follower.acquire()
+
+    assert profiler.running
+
+    with profiler.tick(leader):
+        assert leader.acquire()
+
+    assert not profiler.running
+    assert profiler.result()['ticks'] == 1
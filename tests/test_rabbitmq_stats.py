@@ -1,6 +1,12 @@
+import asyncio
+import math
+
+import aiohttp
 import pytest
 
-from rectifier.message_brokers import RabbitMQ
+from rectifier import settings
+from rectifier.message_brokers import AsyncRabbitMQ, RabbitMQ, async_rabbitmq
+from rectifier.message_brokers.rabbitmq import BrokerError
 from rectifier.queue.queue import Queue
 
 from .env import env  # noqa
@@ -59,3 +65,161 @@ def test_get_current_load_missing_queue(env):
     )
 
     assert len(interest_queues) == 0
+
+
+def test_stats_requests_only_needed_columns(env):
+    env.rabbitmq.set_queue('app', 'rectifier', 1, 10)
+
+    RabbitMQ.stats(env.rabbit_mq_uri(app='app'))
+
+    assert env.rabbitmq.requests[-1] == dict(
+        columns='name,messages,consumers,message_stats.publish_details.rate,message_stats.ack_details.rate',
+        app='app',
+    )
+
+
+def test_stats_disable_stats(env, monkeypatch):
+    monkeypatch.setattr(settings, 'RABBIT_MQ_DISABLE_STATS', True)
+    env.rabbitmq.set_queue('app', 'rectifier', 1, 10)
+
+    RabbitMQ.stats(env.rabbit_mq_uri(app='app'))
+
+    assert env.rabbitmq.requests[-1]['disable_stats'] == 'true'
+    assert env.rabbitmq.requests[-1]['enable_queue_totals'] == 'true'
+
+
+@pytest.mark.parametrize('queues_count', [0, 1, 3, 4, 7])
+def test_stats_paginated(env, monkeypatch, queues_count):
+    monkeypatch.setattr(settings, 'RABBIT_MQ_PAGE_SIZE', 3)
+    for i in range(0, queues_count):
+        env.rabbitmq.set_queue('app', f'queue{i}', i, i * 10)
+
+    stats = RabbitMQ.stats(env.rabbit_mq_uri(app='app'))
+
+    assert stats == [
+        dict(name=f'queue{i}', consumers=i, messages=i * 10)
+        for i in range(0, queues_count)
+    ]
+    assert len(env.rabbitmq.requests) == max(math.ceil(queues_count / 3), 1)
+
+
+def test_queues_compiled_once():
+    RabbitMQ._compile_interest_queues.cache_clear()
+    stats = [
+        dict(name='q1', consumers=2, messages=1),
+        dict(name='q2', consumers=2, messages=2),
+        dict(name='q3', consumers=1, messages=3),
+    ]
+
+    for _ in range(0, 3):
+        queues = RabbitMQ.queues(['q3', 'q2 + q1'], stats)
+        assert queues == [
+            Queue(queue_name='q3', consumers_count=1, messages=3),
+            Queue(queue_name='q2+q1', consumers_count=2, messages=3),
+        ]
+
+    cache_info = RabbitMQ._compile_interest_queues.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 2
+
+
+def test_only_configured_queues_validated(env):
+    env.rabbitmq.set_queue('app', 'rectifier', 1, 10)
+    env.rabbitmq.set_queue('app', 'invalid', 1, 'many')
+
+    stats = RabbitMQ.stats(env.rabbit_mq_uri(app='app'))
+    assert RabbitMQ.queues(['rectifier'], stats) == [
+        Queue(queue_name='rectifier', consumers_count=1, messages=10)
+    ]
+
+    with pytest.raises(BrokerError):
+        RabbitMQ.queues(['rectifier', 'invalid'], stats)
+
+    with pytest.raises(BrokerError):
+        RabbitMQ.queues(['rectifier + invalid'], stats)
+
+
+def test_all_queues_validated(env, monkeypatch):
+    monkeypatch.setattr(settings, 'RABBIT_MQ_VALIDATE_ALL_QUEUES', True)
+    env.rabbitmq.set_queue('app', 'rectifier', 1, 10)
+    env.rabbitmq.set_queue('app', 'invalid', 1, 'many')
+
+    with pytest.raises(BrokerError):
+        RabbitMQ.stats(env.rabbit_mq_uri(app='app'))
+
+
+@pytest.mark.parametrize('stats', [[dict(messages=1)], [dict(name=1)], ['rectifier']])
+def test_nameless_queue_stats(stats):
+    with pytest.raises(BrokerError):
+        RabbitMQ.queues(['rectifier'], stats)
+
+
+@pytest.mark.parametrize(
+    'interest_queues',
+    [['rectifier'], ['rectifier', 'rectifier3'], ['rectifier + rectifier2'], ['nope']],
+)
+def test_streaming_stats(env, monkeypatch, interest_queues):
+    env.rabbitmq.set_queue('app', 'rectifier', 2, 10)
+    env.rabbitmq.set_queue('app', 'rectifier2', 2, 30)
+    env.rabbitmq.set_queue('app', 'rectifier3', 1, 5)
+    env.rabbitmq.set_queue('app', 'invalid', 1, 'many')
+
+    uri = env.rabbit_mq_uri(app='app')
+    expected = RabbitMQ.queues(interest_queues, RabbitMQ.stats(uri, interest_queues))
+
+    monkeypatch.setattr(settings, 'RABBIT_MQ_STREAMING', True)
+    stats = RabbitMQ.stats(uri, interest_queues)
+
+    assert len(stats) <= 2
+    assert RabbitMQ.queues(interest_queues, stats) == expected
+
+
+def test_streaming_stats_validate_all(env, monkeypatch):
+    monkeypatch.setattr(settings, 'RABBIT_MQ_STREAMING', True)
+    monkeypatch.setattr(settings, 'RABBIT_MQ_VALIDATE_ALL_QUEUES', True)
+    env.rabbitmq.set_queue('app', 'rectifier', 2, 10)
+    env.rabbitmq.set_queue('app', 'invalid', 1, 'many')
+
+    with pytest.raises(BrokerError):
+        RabbitMQ.stats(env.rabbit_mq_uri(app='app'), ['rectifier'])
+
+
+def test_async_streaming_stats(env, monkeypatch):
+    env.rabbitmq.set_queue('app', 'rectifier', 2, 10)
+    env.rabbitmq.set_queue('app', 'rectifier2', 2, 30)
+    env.rabbitmq.set_queue('app', 'invalid', 1, 'many')
+
+    uri = env.rabbit_mq_uri(app='app')
+    monkeypatch.setattr(settings, 'RABBIT_MQ_STREAMING', True)
+    # The listing is decoded as its chunks are received, rather than read whole.
+    monkeypatch.setattr(async_rabbitmq, 'STREAM_CHUNK_SIZE', 16)
+    monkeypatch.setattr(aiohttp.ClientResponse, 'read', None)
+
+    async def stats():
+        broker = AsyncRabbitMQ()
+        try:
+            return await broker.stats(uri, ['rectifier'])
+        finally:
+            await broker.close()
+
+    stats = asyncio.run(stats())
+
+    assert [queue_stats['name'] for queue_stats in stats] == ['rectifier']
+    assert RabbitMQ.queues(['rectifier'], stats) == [
+        Queue('rectifier', consumers_count=2, messages=10)
+    ]
+
+
+def test_queue_rates(env):
+    env.rabbitmq.set_queue('app', 'q1', 2, 10, publish_rate=4.5, ack_rate=1.5)
+    env.rabbitmq.set_queue('app', 'q2', 2, 30, publish_rate=0.5, ack_rate=1)
+    env.rabbitmq.set_queue('app', 'q3', 2, 30)
+
+    stats = RabbitMQ.stats(env.rabbit_mq_uri(app='app'))
+
+    assert RabbitMQ.queues(['q1', 'q3', 'q1 + q2', 'q1 + q3'], stats) == [
+        Queue('q1', consumers_count=2, messages=10, publish_rate=4.5, ack_rate=1.5),
+        Queue('q3', consumers_count=2, messages=30),
+        Queue('q1+q2', consumers_count=2, messages=40, publish_rate=5, ack_rate=2.5),
+        Queue('q1+q3', consumers_count=2, messages=40),
+    ]
@@ -0,0 +1,62 @@
+import socket
+import time
+
+import pytest
+import requests
+from freezegun import freeze_time
+
+from rectifier import settings
+from rectifier.message_brokers.session_pool import SessionPool
+
+
+def test_session_reused_per_host_and_credentials():
+    pool = SessionPool(idle_timeout=60)
+
+    session = pool.get('https', 'host', 'user', 'password')
+    assert pool.get('https', 'host', 'user', 'password') is session
+    assert session.headers['Accept-Encoding'] == 'gzip'
+
+    assert pool.get('https', 'other-host', 'user', 'password') is not session
+    assert pool.get('https', 'host', 'other-user', 'password') is not session
+    assert len(pool) == 3
+
+    pool.close()
+    assert len(pool) == 0
+
+
+def test_idle_sessions_evicted():
+    pool = SessionPool(idle_timeout=60)
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        session = pool.get('https', 'host', 'user', 'password')
+        idle_session = pool.get('https', 'idle-host', 'user', 'password')
+
+        frozen_time.move_to('2012-01-14 03:00:59')
+        assert pool.get('https', 'host', 'user', 'password') is session
+
+        frozen_time.move_to('2012-01-14 03:01:30')
+        assert pool.get('https', 'host', 'user', 'password') is session
+        assert len(pool) == 1
+
+        assert pool.get('https', 'idle-host', 'user', 'password') is not idle_session
+
+
+def test_session_timeouts(monkeypatch):
+    monkeypatch.setattr(settings, 'READ_TIMEOUT', 0.1)
+
+    # A server which accepts connections, but never replies.
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+
+    pool = SessionPool(idle_timeout=60)
+    session = pool.get('http', 'host', 'user', 'password')
+
+    started_at = time.monotonic()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        session.get(f'http://127.0.0.1:{server.getsockname()[1]}/api/queues')
+
+    assert time.monotonic() - started_at < 1
+
+    pool.close()
+    server.close()
@@ -3,6 +3,8 @@ import uuid
 import sys
 import importlib
 
+from environs import EnvError
+
 
 @pytest.fixture()
 def empty_settings():
@@ -42,6 +44,18 @@ def test_api_key_set(heroku_api_key):
     assert settings.HEROKU_API_KEYS == [heroku_api_key]
 
 
+def test_tick_deadline(empty_settings):
+    assert empty_settings.TICK_DEADLINE == empty_settings.TIME_BETWEEN_REQUESTS
+
+
+def test_tick_deadline_invalid(monkeypatch):
+    monkeypatch.setenv('TICK_DEADLINE', '-1')
+    monkeypatch.delitem(sys.modules, 'rectifier.settings', raising=False)
+
+    with pytest.raises(EnvError):
+        importlib.import_module('rectifier.settings')
+
+
 def test_api_keys_set(heroku_api_keys):
     (heroku_api_keys, settings) = heroku_api_keys
     assert settings.HEROKU_API_KEYS == heroku_api_keys
@@ -0,0 +1,132 @@
+import json
+from collections import defaultdict
+from typing import Dict
+
+from freezegun import freeze_time
+
+from rectifier import settings
+from rectifier.infrastructure_provider import InfrastructureProvider
+from rectifier.message_brokers import RabbitMQ
+from rectifier.rectifier import Rectifier
+from rectifier.sharding import HashRing, ShardMembership
+from tests.redis_mock import RedisStorageMock
+
+from .env import env  # noqa
+
+APPS = [f'app{i}' for i in range(0, 12)]
+
+
+class RecordingInfrastructureProvider(InfrastructureProvider):
+    def __init__(self, env):
+        self.env = env
+        self.scaled: Dict[str, int] = defaultdict(int)
+
+    def scale(self, app_name: str, scale_requests: Dict[str, int]) -> None:
+        self.scaled[app_name] += 1
+
+    def broker_uri(self, app_name: str):
+        return self.env.rabbit_mq_uri(app_name)
+
+
+def test_hash_ring_rebalancing():
+    keys = [f'app{i}' for i in range(0, 1000)]
+
+    ring = HashRing(['a', 'b', 'c'])
+    assignments = {key: ring.node(key) for key in keys}
+
+    for node in ['a', 'b', 'c']:
+        assert 200 < list(assignments.values()).count(node) < 466
+
+    # Only the keys of the node which left are moved.
+    ring = HashRing(['a', 'b'])
+    for key in keys:
+        if assignments[key] != 'c':
+            assert ring.node(key) == assignments[key]
+        else:
+            assert ring.node(key) in ('a', 'b')
+
+    assert HashRing([]).node('app') is None
+
+
+def test_shard_membership():
+    storage = RedisStorageMock()
+    first = ShardMembership(storage, identity='first', ttl=90)
+    second = ShardMembership(storage, identity='second', ttl=90)
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        first.heartbeat()
+        assert first.refresh()
+        assert all(first.owns(app) for app in APPS)
+
+        second.heartbeat()
+        assert second.refresh()
+        assert first.refresh()
+        assert not first.refresh()
+
+        for app in APPS:
+            assert first.owns(app) != second.owns(app)
+
+        # The second worker stopped sending heartbeats.
+        frozen_time.move_to('2012-01-14 03:02:00')
+        first.heartbeat()
+        assert first.refresh()
+        assert first.members == {'first'}
+        assert all(first.owns(app) for app in APPS)
+        assert storage.hgetall(settings.REDIS_WORKERS_KEY).keys() == {b'first'}
+
+
+def test_sharded_rectifiers(env):
+    storage = RedisStorageMock()
+    storage.set(
+        settings.REDIS_CONFIG_KEY,
+        json.dumps(
+            {
+                app: {
+                    'q': {
+                        'intervals': [0, 10, 100],
+                        'workers': [1, 2, 3],
+                        'cooldown': 60,
+                        'consumers_formation_name': 'worker_q',
+                    }
+                }
+                for app in APPS
+            }
+        ).encode(),
+    )
+    for app in APPS:
+        env.rabbitmq.set_queue(app, 'q')
+
+    infrastructure_provider = RecordingInfrastructureProvider(env)
+    (first, second) = [
+        Rectifier(
+            storage=storage,
+            broker=RabbitMQ(),
+            infrastructure_provider=infrastructure_provider,
+            shard=ShardMembership(storage, identity=identity, ttl=90),
+        )
+        for identity in ['first', 'second']
+    ]
+
+    with freeze_time("2012-01-14 03:00:00") as frozen_time:
+        second.shard.heartbeat()
+        first.run()
+        second.run()
+
+        # Every app was scaled once, by the worker whose shard it is in.
+        assert set(infrastructure_provider.scaled) == set(APPS)
+        assert set(infrastructure_provider.scaled.values()) == {1}
+        assert any(second.shard.owns(app) for app in APPS)
+        assert any(first.shard.owns(app) for app in APPS)
+
+        # The second worker leaves, and its apps move to the first one along with their cooldowns.
+        second.shard.leave()
+        for app in APPS:
+            env.rabbitmq.set_queue(app, 'q', 0, 50)
+
+        frozen_time.move_to('2012-01-14 03:00:30')
+        first.run()
+        assert set(infrastructure_provider.scaled.values()) == {1}
+
+        frozen_time.move_to('2012-01-14 03:01:01')
+        first.run()
+        assert set(infrastructure_provider.scaled.values()) == {2}
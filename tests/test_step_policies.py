@@ -0,0 +1,149 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from freezegun import freeze_time
+
+from benchmarks.policies import linear_scan, policies_config
+from rectifier.config import AppConfig, AppMode, CoordinatorConfig, QueueConfig
+from rectifier.consumer_updates_coordinator import ConsumerUpdatesCoordinator
+from rectifier.consumer_updates_coordinator import step_policies
+from rectifier.consumer_updates_coordinator.step_policies import StepPolicies
+from rectifier.queue import Queue
+from tests.redis_mock import RedisStorageMock
+
+
+def test_step_policies_match_linear_scan():
+    config = policies_config(queues=50, intervals=8)
+    policies = StepPolicies(config)
+
+    for (app, app_config) in config.apps.items():
+        for (queue_name, queue_config) in app_config.queues.items():
+            policy = policies.policy(app, queue_name)
+            for messages in [
+                0,
+                0.5,
+                *queue_config.intervals,
+                *[interval - 0.01 for interval in queue_config.intervals[1:]],
+                *[interval + 1 for interval in queue_config.intervals],
+                10**12,
+            ]:
+                assert policies.workers_for(policy, messages) == linear_scan(
+                    queue_config, messages
+                )
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_step_policies_fractional_intervals(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(step_policies, 'numpy', None)
+
+    queue_config = QueueConfig(
+        intervals=[0, 10.5, 10.75, 20],
+        workers=[1, 2, 3, 4],
+        cooldown=30.5,
+        queue_name='q',
+        consumers_formation_name='worker_q',
+    )
+    policies = StepPolicies(
+        CoordinatorConfig(
+            apps=dict(app=AppConfig(queues=dict(q=queue_config), mode=AppMode.SCALE))
+        )
+    )
+
+    messages = [0, 10, 10.5, 10.6, 10.75, 11, 19.99, 20, 25] * 10
+    (workers, in_cooldown) = policies.evaluate(
+        [0] * len(messages), messages, [30] * len(messages)
+    )
+
+    assert workers == [
+        linear_scan(queue_config, queue_messages) for queue_messages in messages
+    ]
+    assert all(in_cooldown)
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_step_policies_batch_matches_scalar(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(step_policies, 'numpy', None)
+
+    config = policies_config(queues=500, intervals=12, seed=1)
+    policies = StepPolicies(config)
+
+    rng = random.Random(1)
+    indexes = [rng.randrange(0, len(policies)) for _ in range(0, 2000)]
+    messages = [
+        rng.choice([rng.uniform(0, 1500), float(rng.randrange(0, 1500)), 10**12])
+        for _ in indexes
+    ]
+    seconds_since_update = [rng.choice([-1, 0, 29, 30, 59, 60, 299]) for _ in indexes]
+
+    (workers, in_cooldown) = policies.evaluate(indexes, messages, seconds_since_update)
+
+    assert workers == [
+        policies.workers_for(policy, queue_messages)
+        for (policy, queue_messages) in zip(indexes, messages)
+    ]
+    assert in_cooldown == [
+        policies.in_cooldown(policy, seconds)
+        for (policy, seconds) in zip(indexes, seconds_since_update)
+    ]
+
+
+def test_coordinator_batch_matches_scalar():
+    config = policies_config(queues=200, intervals=6, seed=2)
+    queues = [
+        (app, app_config.mode, queue_name)
+        for (app, app_config) in config.apps.items()
+        for queue_name in app_config.queues
+    ]
+
+    rng = random.Random(2)
+    stats = [
+        (rng.randint(0, 200), rng.randint(0, 700), rng.choice([None, 0, 30, 600]))
+        for _ in queues
+    ]
+
+    now = datetime(2012, 1, 14, 3)
+    decisions = []
+    for batch in [False, True]:
+        coordinator = ConsumerUpdatesCoordinator(
+            config=config, storage=RedisStorageMock()
+        )
+        for ((app, _, queue_name), (_, _, since_update)) in zip(queues, stats):
+            if since_update is not None:
+                coordinator.queues_update_time[app][queue_name] = now - timedelta(
+                    seconds=since_update
+                )
+
+        requests = [
+            (
+                app,
+                AppMode.KILL if index % 7 == 0 else app_mode,
+                Queue(queue_name, consumers, messages=messages),
+                None,
+            )
+            for (
+                index,
+                ((app, app_mode, queue_name), (consumers, messages, _)),
+            ) in enumerate(zip(queues, stats))
+        ]
+
+        with freeze_time(now):
+            if batch:
+                decisions.append(coordinator.compute_consumers_counts(requests))
+            else:
+                decisions.append(
+                    [
+                        coordinator.compute_consumers_count(*request)
+                        for request in requests
+                    ]
+                )
+
+    assert decisions[0] == decisions[1]
+    assert any(count is not None for (count, _) in decisions[0])
+    assert any(count is None for (count, _) in decisions[0])